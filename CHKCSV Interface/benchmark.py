@@ -0,0 +1,324 @@
+"""
+This Python script benchmarks the CHKCSV interface on synthetic CSV files with matching FMT files, and keeps the
+results over time to catch regressions.
+
+The files have the columns given by --columns (integer, float, date, pattern: a string with a pattern and a maximum
+length, text: an optional free text column, bool), with a share of invalid values given by --error-rate, and the
+number of rows given by --sizes (from 1000 to 10 million rows). For each size, each engine ('chkcsv': check_csv_file
+of CHKCSV itself, 'row': the check functions of chkcsv row by row, chunk by chunk, 'vectorised': masks over the
+columns of chunks of rows) checks the file --repeat times and the best time is kept, then once more under tracemalloc
+for its peak memory. The time taken to format the errors as the interface ('main.py') shows them (output, summary and
+first page of the table of errors, see ResultView in 'core.py') is measured too, without any window.
+
+Each result is appended to a JSON Lines history (--history) and compared with the best previous result of the same
+benchmark on the same machine: a result slower by more than --tolerance is reported as a regression.
+
+The exit status is 1 when the engines do not find the same errors or when a regression is found.
+
+Usage: python benchmark.py [--sizes N,N] [--columns TYPE,TYPE] [--error-rate X] [--engines NAME,NAME] [--repeat N]
+       [--keep FOLDER] [--history PATH] [--tolerance X]
+
+Maintainer: Jose Javier Saiz (josejavier.saizanton@acer.europa.eu, josejavier.saiz.anton@gmail.com)
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import core
+
+from chkcsv import check_csv_file
+
+
+MARKETS = ["DE_LU", "FR", "IT_NO", "ES", "NL", "BE", "AT", "PL", "CZ", "HU_1"]
+
+# Column of each type: name, format specifications, valid value (from the random generator and the row number) and
+# invalid values
+COLUMN_TYPES = {
+    "integer": ("id", "type: integer\ndata_required: True", lambda rng, i: str(i), ["", "12a", "1.5"]),
+    "float": ("amount", "type: float", lambda rng, i: "{:.2f}".format(rng.uniform(-1000, 1000)), ["1,5", "n/a", "--3"]),
+    "date": (
+        "delivery_date", "type: date", lambda rng, i: "2023-{:02d}-{:02d}".format(rng.randint(1, 12), rng.randint(1, 28)),
+        ["2023-13-01", "31/01/2023", "tomorrow"]
+    ),
+    "pattern": (
+        "market", "type: string\nmaxlen: 6\npattern: [A-Z]{2}(_[A-Z0-9]+)?$", lambda rng, i: rng.choice(MARKETS),
+        ["de_lu", "DE_LUXEMBOURG", "XX"]
+    ),
+    "text": (
+        "comment", "column_required: False\nmaxlen: 20", lambda rng, i: rng.choice(["", "", "", "curtailed", "partial delivery"]),
+        ["a comment longer than twenty characters"]
+    ),
+    "bool": ("firm", "type: bool", lambda rng, i: rng.choice(["True", "False", "yes", "no"]), ["maybe", "2"])
+}
+
+OPTIONS = {
+    "data_required": False,
+    "column_required": True,
+    "columnexit": False,
+    "linelength": True,
+    "position": False,
+    "caseinsensitive": False,
+    "haltonerror": False,
+    "optsection": "chkcsvoptions",
+    "encoding": "utf-8",
+    "max_errors": 0
+}
+
+# Engines: CHKCSV itself and those of the interface
+ENGINES = ["chkcsv"] + list(core.ENGINES)
+
+HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".chkcsv_benchmark.jsonl")
+
+
+def get_columns(types):
+    # Names and specifications of the columns, numbered when a type is repeated
+    columns = []
+    for i, column_type in enumerate(types):
+        name, spec, valid, invalid = COLUMN_TYPES[column_type]
+        if types.count(column_type) > 1:
+            name = "{}_{}".format(name, types[:i + 1].count(column_type))
+        columns.append((name, spec, valid, invalid))
+    return columns
+
+
+def generate_file(folder_path, rows, error_rate, types=tuple(COLUMN_TYPES)[:5], seed=0):
+    """
+    Write a synthetic CSV file and its FMT file, unless they were already written in the folder.
+
+    Args:
+    folder_path (str): The folder of the files.
+    rows (int): The number of data rows.
+    error_rate (float): The share of the values replaced by an invalid one (and of short rows).
+    types (list): The types of the columns, keys of COLUMN_TYPES.
+    seed (int): The seed of the random generator.
+
+    Returns:
+    tuple: The paths of the CSV file and of the FMT file.
+    """
+    name = "benchmark_{}_{}_{}_{}".format(rows, "-".join(types), error_rate, seed)
+    csv_path = os.path.join(folder_path, name + ".csv")
+    fmt_path = os.path.join(folder_path, name + ".fmt")
+    if os.path.exists(csv_path) and os.path.exists(fmt_path):
+        return csv_path, fmt_path
+    columns = get_columns(list(types))
+    rng = random.Random(seed)
+    with open(fmt_path, "w", encoding="utf-8") as f:
+        f.write("".join("[{}]\n{}\n".format(name, spec) for name, spec, valid, invalid in columns))
+    # Written under a temporary name first, so that an interrupted run does not leave a partial fixture
+    with open(csv_path + ".tmp", "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(name for name, spec, valid, invalid in columns) + "\n")
+        for i in range(rows):
+            values = [valid(rng, i) for name, spec, valid, invalid in columns]
+            for j, (name, spec, valid, invalid) in enumerate(columns):
+                if rng.random() < error_rate:
+                    values[j] = rng.choice(invalid)
+            f.write(",".join(values) + "\n")
+            if rng.random() < error_rate:
+                f.write(",".join(values[:2]) + "\n")
+    os.replace(csv_path + ".tmp", csv_path)
+    return csv_path, fmt_path
+
+
+def check_file(csv_path, cols, engine):
+    # Errors and rows read by an engine
+    if engine == "chkcsv":
+        errors = check_csv_file(csv_path, cols, OPTIONS["haltonerror"], OPTIONS["columnexit"], OPTIONS["linelength"], OPTIONS["caseinsensitive"], OPTIONS["encoding"], OPTIONS["position"])
+        return errors, None
+    errors, rows, elapsed, sample = core.validate_file(csv_path, cols, dict(OPTIONS, engine=engine))
+    return errors, rows
+
+
+def run_engine(csv_path, cols, engine, repeat=1):
+    """
+    Check the file with an engine.
+
+    Args:
+    csv_path (str): The path of the CSV file.
+    cols (dict): The format specifications returned by read_format_specs.
+    engine (str): The name of the engine, in ENGINES.
+    repeat (int): The number of checks, the best time is kept.
+
+    Returns:
+    tuple: The errors found, the number of rows read, the best time in seconds and the peak memory in bytes.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        errors, rows = check_file(csv_path, cols, engine)
+        best = min(best, time.perf_counter() - start)
+    # Measured apart, tracemalloc slows the check down
+    tracemalloc.start()
+    try:
+        check_file(csv_path, cols, engine)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return errors, rows, best, peak
+
+
+def measure_render(csv_path, errors, rows):
+    """
+    Measure the time taken to format the result of a file with its errors as the interface shows it (output, summary
+    and first page of the errors), without Tk.
+
+    Args:
+    csv_path (str): The path of the CSV file.
+    errors (list): The errors of the file.
+    rows (int): The number of rows read.
+
+    Returns:
+    float: The time in seconds.
+    """
+    options = dict(core.DEFAULT_OPTIONS, max_errors=0)
+    result = core.get_result(os.path.basename(csv_path), csv_path, errors, rows)
+    start = time.perf_counter()
+    view = core.ResultView()
+    view.add("", result, options)
+    view.get_summary_rows()
+    view.get_page_rows(0)
+    view.get_page_text()
+    return time.perf_counter() - start
+
+
+def run_benchmark(folder_path, rows, error_rate, types, engines, repeat=1):
+    csv_path, fmt_path = generate_file(folder_path, rows, error_rate, types)
+    cols = core.read_format_specs(fmt_path, OPTIONS["column_required"], OPTIONS["data_required"], OPTIONS["optsection"])
+    # Load the libraries of the vectorised engine before timing it
+    list(core.get_rule_masks(next(iter(cols.values())), ["1"]))
+    result = {"file": csv_path, "size": os.path.getsize(csv_path), "rows": rows, "engines": {}}
+    for engine in engines:
+        errors, rows_read, elapsed, peak = run_engine(csv_path, cols, engine, repeat)
+        # CHKCSV reads all the rows, header included
+        rows_read = rows_read or sum(1 for _ in open(csv_path, "rb"))
+        result["engines"][engine] = {"errors": errors, "rows": rows_read, "time": elapsed, "peak": peak}
+    result["same_errors"] = len({repr([tuple(error) for error in engine["errors"]]) for engine in result["engines"].values()}) == 1
+    last = result["engines"][engines[-1]]
+    result["render"] = measure_render(csv_path, last["errors"], last["rows"])
+    return result
+
+
+def print_report(result):
+    print("File: {} ({:.1f} MB, {} rows)".format(result["file"], result["size"] / 1e6, result["rows"]))
+    base_time = next(iter(result["engines"].values()))["time"]
+    for name, engine in result["engines"].items():
+        print("{:<12}{:>10} rows{:>10} errors{:>8.2f} s{:>12.0f} rows/sec{:>8.2f}x{:>10.1f} MB peak".format(
+            name, engine["rows"], len(engine["errors"]), engine["time"], engine["rows"] / engine["time"], base_time / engine["time"], engine["peak"] / 1e6
+        ))
+    print("Render: {:.3f} s for {} errors".format(result["render"], len(next(iter(result["engines"].values()))["errors"])))
+    print("Same errors: {}".format(result["same_errors"]))
+
+
+def get_records(result, types, error_rate):
+    """
+    Turn the result of a benchmark into records of the history, one per engine and one for the rendering.
+
+    Args:
+    result (dict): The result returned by run_benchmark.
+    types (list): The types of the columns.
+    error_rate (float): The share of invalid values.
+
+    Returns:
+    list: The records, as dictionaries.
+    """
+    common = {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "rows": result["rows"],
+        "columns": list(types),
+        "error_rate": error_rate
+    }
+    records = [
+        dict(common, engine=name, time=engine["time"], rows_per_sec=engine["rows"] / engine["time"], peak_mb=engine["peak"] / 1e6, errors=len(engine["errors"]))
+        for name, engine in result["engines"].items()
+    ]
+    records.append(dict(common, engine="render", time=result["render"]))
+    return records
+
+
+def find_regressions(records, history, tolerance):
+    """
+    Compare the records with the best previous ones of the same benchmark on the same machine.
+
+    Args:
+    records (list): The new records returned by get_records.
+    history (list): The previous records.
+    tolerance (float): The share by which a time may exceed the best previous one.
+
+    Returns:
+    list: The regressions, as text.
+    """
+    same = lambda a, b: all(a[key] == b[key] for key in ["machine", "rows", "columns", "error_rate", "engine"])
+    regressions = []
+    for record in records:
+        previous = [old["time"] for old in history if same(old, record)]
+        if previous and record["time"] > min(previous) * (1 + tolerance):
+            regressions.append("{} on {} rows: {:.3f} s, best {:.3f} s (+{:.0%})".format(
+                record["engine"], record["rows"], record["time"], min(previous), record["time"] / min(previous) - 1
+            ))
+    return regressions
+
+
+def load_history(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the CHKCSV interface on synthetic CSV files.")
+    parser.add_argument("--sizes", default="1000,100000", help="numbers of data rows of the files, from 1000 to 10000000 (default: %(default)s)")
+    parser.add_argument("--rows", type=int, help="number of data rows of a single file (instead of --sizes)")
+    parser.add_argument("--columns", default=",".join(list(COLUMN_TYPES)[:5]), help="types of the columns, among {} (default: %(default)s)".format(", ".join(COLUMN_TYPES)))
+    parser.add_argument("--error-rate", type=float, default=0.01, help="share of invalid values")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="engines to compare (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of checks per engine, the best time is kept")
+    parser.add_argument("--keep", help="folder where the files are written and kept, and reused by the next runs (temporary folder otherwise)")
+    parser.add_argument("--history", default=HISTORY_PATH, help="JSON Lines file of the results over time, '' for none (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="share by which a time may exceed the best previous one (default: %(default)s)")
+    args = parser.parse_args()
+
+    sizes = [args.rows] if args.rows else [int(size) for size in args.sizes.split(",")]
+    types = args.columns.split(",")
+    engines = args.engines.split(",")
+    for name in types:
+        if name not in COLUMN_TYPES:
+            parser.error("unknown column type: {}".format(name))
+    for name in engines:
+        if name not in ENGINES:
+            parser.error("unknown engine: {}".format(name))
+
+    folder_path = args.keep or tempfile.mkdtemp(prefix="chkcsv_benchmark_")
+    os.makedirs(folder_path, exist_ok=True)
+    history = load_history(args.history) if args.history else []
+    start = time.perf_counter()
+    same_errors = True
+    regressions = []
+    try:
+        for rows in sizes:
+            result = run_benchmark(folder_path, rows, args.error_rate, types, engines, args.repeat)
+            print_report(result)
+            print()
+            same_errors &= result["same_errors"]
+            records = get_records(result, types, args.error_rate)
+            regressions.extend(find_regressions(records, history, args.tolerance))
+            if args.history:
+                with open(args.history, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(record) + "\n" for record in records)
+    finally:
+        if not args.keep:
+            shutil.rmtree(folder_path)
+    for regression in regressions:
+        print("Regression: {}".format(regression))
+    print("Total time: {:.1f} s".format(time.perf_counter() - start))
+    sys.exit(0 if same_errors and not regressions else 1)
@@ -0,0 +1,119 @@
+"""
+This Python script checks CSV files according to the parameters in a separate FMT file from the command line, without
+any window, with the same options and checks as the CHKCSV interface ('main.py'), and writes the results as JSON,
+JUnit XML or CSV reports for scheduled jobs.
+
+The exit status is 0 when no errors are found, 1 when errors are found and 2 when the check could not run (missing
+path or invalid FMT file).
+
+Usage: python cli.py CSV_PATH [-f FMT_PATH] [--routes ROUTES] [options] [--json REPORT] [--junit REPORT] [--csv REPORT]
+
+Author: Jose Javier Saiz (josejavier.saizanton@acer.europa.eu, josejavier.saiz.anton@gmail.com)
+"""
+
+import argparse, multiprocessing, os, sys
+
+from chkcsv import ChkCsvError
+from core import DEFAULT_OPTIONS, ENGINES, check_csv, get_result, show_result, split_archive_member, write_csv_report, write_json_report, write_junit_report
+
+#####################################################################################################
+
+def add_check_arguments(parser):
+    # The options have the names of the options of the chkcsv command line where they exist
+    parser.add_argument("-f", "--formatspec", default="", help="FMT file with the format specifications (default FMT file of the files without route with --routes)")
+    parser.add_argument("-r", "--required", action="store_true", dest="data_required", help="a data value is required in the columns without data_required specification")
+    parser.add_argument("-q", "--columnsnotrequired", action="store_false", dest="column_required", help="the columns without column_required specification are not required")
+    parser.add_argument("-c", "--columnexit", action="store_true", help="stop if the CSV file has columns without format specifications")
+    parser.add_argument("-l", "--linelength", action="store_false", help="allow rows with fewer values than column headers")
+    parser.add_argument("-p", "--position", action="store_true", help="the order of the columns must match the format specifications")
+    parser.add_argument("-i", "--case-insensitive", action="store_true", dest="caseinsensitive", help="case-insensitive matching of column names")
+    parser.add_argument("-e", "--encoding", default=DEFAULT_OPTIONS["encoding"], help="character encoding of the CSV files, auto to detect that of each file (default: %(default)s)")
+    parser.add_argument("-o", "--optsection", default=DEFAULT_OPTIONS["optsection"], help="name of the options section of the FMT file")
+    parser.add_argument("-x", "--exitonerror", action="store_true", dest="haltonerror", help="stop each file at its first error")
+    parser.add_argument("-R", "--recursive", action="store_true", help="include the files of the subdirectories")
+    parser.add_argument("--filter", default=DEFAULT_OPTIONS["file_filter"], dest="file_filter", help="glob patterns of the files of a directory to check (default: %(default)s)")
+    parser.add_argument("--max-errors", type=int, default=DEFAULT_OPTIONS["max_errors"], help="errors after which a file is not read further, 0 for no limit (default: %(default)s)")
+    parser.add_argument("--engine", choices=list(ENGINES), default=DEFAULT_OPTIONS["engine"], help="engine of the check (default: %(default)s)")
+    parser.add_argument("--routes", default=DEFAULT_OPTIONS["routes"], help="CSV routing table of the files to their FMT files (columns pattern, fmt_path, optsection)")
+
+def get_options(args):
+    # Options of the check from the arguments, the default ones for those the command line does not have
+    options = {name: getattr(args, name, DEFAULT_OPTIONS[name]) for name in DEFAULT_OPTIONS}
+    options["max_errors"] = max(options["max_errors"], 0)
+    options["sample_rows"] = max(options["sample_rows"], 0)
+    return options
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Check the content and format of a CSV file or of the CSV files of a directory.")
+    parser.add_argument("csv_path", help="CSV file or directory of CSV files to check")
+    add_check_arguments(parser)
+    parser.add_argument("--sample", type=int, default=DEFAULT_OPTIONS["sample_rows"], dest="sample_rows", help="check only the header, the first N rows and N rows sampled across each file, with estimated error rates (default: %(default)s, full check)")
+    parser.add_argument("--keys", action="store_true", dest="check_keys", help="check the unique_key and references columns of the FMT files across all the files")
+    parser.add_argument("--no-ledger", action="store_false", dest="use_ledger", help="check again the files unchanged since found without errors")
+    parser.add_argument("--json", help="path of a JSON report")
+    parser.add_argument("--junit", help="path of a JUnit XML report")
+    parser.add_argument("--csv", help="path of a CSV report of the errors")
+    parser.add_argument("-s", "--silent", action="store_true", help="do not print the output of the check")
+    return parser
+
+def run(args):
+    """
+    Check the CSV files and write the reports.
+
+    Args:
+    args (argparse.Namespace): The arguments of the command line.
+
+    Returns:
+    int: The exit status.
+    """
+    options = get_options(args)
+    output = sys.stdout if not args.silent else open(os.devnull, "w")
+    if not os.path.exists(split_archive_member(args.csv_path)[0]):
+        print("The specified CSV file does not exist: {}".format(args.csv_path), file=sys.stderr)
+        return 2
+    if not args.formatspec and not args.routes:
+        print("A format file (-f) or a routing table (--routes) is required.", file=sys.stderr)
+        return 2
+    if args.formatspec and not os.path.exists(args.formatspec):
+        print("The format file does not exist: {}".format(args.formatspec), file=sys.stderr)
+        return 2
+    if args.routes and not os.path.exists(args.routes):
+        print("The routing table does not exist: {}".format(args.routes), file=sys.stderr)
+        return 2
+
+    results = []
+    started = False
+    try:
+        for message in check_csv(args.csv_path, args.formatspec, options):
+            if message[0] == "start":
+                started = True
+            elif message[0] == "text":
+                output.write(message[1])
+            elif message[0] == "file":
+                output.write(message[4] + show_result(message[5], options) + "\n")
+                results.append(message[5])
+    except Exception as e:
+        error = e.errmsg if isinstance(e, ChkCsvError) else str(e)
+        # Invalid FMT file
+        if not started:
+            print("Error: {}".format(error), file=sys.stderr)
+            return 2
+        # Single CSV file that could not be read
+        results.append(get_result(os.path.basename(args.csv_path), args.csv_path, failure=error))
+        output.write(show_result(results[-1], options) + "\n")
+    output.flush()
+
+    if args.json:
+        write_json_report(results, args.json, args.csv_path, args.formatspec, options)
+    if args.junit:
+        write_junit_report(results, args.junit)
+    if args.csv:
+        write_csv_report(results, args.csv)
+    return 1 if any(result["errors"] or result["failure"] is not None for result in results) else 0
+
+#####################################################################################################
+
+if __name__ == "__main__":
+    # Needed by the process pool in the executable compiled with PyInstaller
+    multiprocessing.freeze_support()
+    sys.exit(run(get_parser().parse_args()))
@@ -0,0 +1,1621 @@
+"""
+This Python module holds the checking core of the CHKCSV interface, without any dependency on Tk, so that it is shared
+by the window ('main.py') and the command line ('cli.py').
+
+For more information see the README.txt file.
+
+Author: Jose Javier Saiz (josejavier.saizanton@acer.europa.eu, josejavier.saiz.anton@gmail.com)
+"""
+
+import os, bz2, codecs, configparser, contextlib, csv, fnmatch, gzip, hashlib, io, itertools, json, lzma, math, operator, random, re, shutil, sqlite3, tempfile, time, zipfile
+
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from chkcsv import ChkCsvError, read_format_specs
+
+# Default values of the options of a check
+DEFAULT_OPTIONS = {
+    "data_required": False,
+    "column_required": True,
+    "columnexit": False,
+    "linelength": True,
+    "position": False,
+    "caseinsensitive": False,
+    "haltonerror": False,
+    "recursive": False,
+    "use_ledger": True,
+    "file_filter": "*.csv",
+    "max_errors": 1000,
+    "engine": "row",
+    "sample_rows": 0,
+    "check_keys": False,
+    "routes": "",
+    "optsection": "chkcsvoptions",
+    "encoding": "auto"
+}
+
+# Encodings proposed in the interface, "auto" to detect that of each file
+ENCODINGS = ["auto", "utf-8", "utf-8-sig", "cp1252", "latin-1", "utf-16"]
+
+#####################################################################################################
+
+# Functions opening the compressed files as text, by extension
+COMPRESSIONS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+# Separator of the name of a ZIP archive and of the name of a file in it, as in "bundle.zip!data.csv"
+ARCHIVE_SEPARATOR = "!"
+
+def split_archive_member(path):
+    """
+    Split the path of a file in a ZIP archive into the path of the archive and the name of the file in it.
+
+    Args:
+    path (str): The path, as "bundle.zip!data.csv" for a file in an archive.
+
+    Returns:
+    tuple: The path of the archive and the name of the file (the path and None for a file that is not in an archive).
+    """
+    position = path.lower().find(".zip" + ARCHIVE_SEPARATOR)
+    if position < 0:
+        return path, None
+    return path[:position + 4], path[position + 5:]
+
+def is_zip(path):
+    return path.lower().endswith(".zip")
+
+def match_name(name, patterns):
+    # A compressed file matches the patterns of the file it contains ("data.csv.gz" matches "*.csv")
+    names = [name] + [name[:-len(extension)] for extension in COMPRESSIONS if name.lower().endswith(extension)]
+    return len(patterns) == 0 or any(fnmatch.fnmatch(n, pattern) for n in names for pattern in patterns)
+
+def list_archive_members(archive_path, name, patterns):
+    """
+    List the files of a ZIP archive to check.
+
+    Args:
+    archive_path (str): The path of the archive.
+    name (str): The name of the archive in the list of files.
+    patterns (list): The glob patterns of the file names to check (e.g. ["*.csv"]), all files if empty.
+
+    Returns:
+    list: The files as "name!member", the archive itself if it cannot be read (so that its error is reported).
+    """
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            members = [info.filename for info in archive.infolist() if not info.is_dir()]
+    except (OSError, zipfile.BadZipFile):
+        return [name]
+    return [name + ARCHIVE_SEPARATOR + member for member in members if match_name(os.path.basename(member), patterns)]
+
+def list_csv_files(csv_path, patterns, recursive):
+    """
+    List the files of a directory to check, once and in a deterministic order. The files of the ZIP archives are
+    listed as "archive.zip!file.csv".
+
+    Args:
+    csv_path (str): The directory.
+    patterns (list): The glob patterns of the file names to check (e.g. ["*.csv"]), all files if empty.
+    recursive (bool): Whether to include the files of the subdirectories.
+
+    Returns:
+    list: The paths of the files relative to the directory, sorted.
+    """
+    files = []
+    for folder, subfolders, names in os.walk(csv_path):
+        for name in names:
+            file = os.path.relpath(os.path.join(folder, name), csv_path)
+            if is_zip(name):
+                files.extend(list_archive_members(os.path.join(folder, name), file, patterns))
+            elif match_name(name, patterns):
+                files.append(file)
+        if not recursive:
+            break
+    return sorted(files)
+
+def read_routes(routes_path):
+    """
+    Read a routing table of the CSV files to their FMT files: a CSV file with the columns "pattern" (glob pattern of
+    the file names, or of their paths relative to the checked directory), "fmt_path" (relative to the routing table)
+    and, optionally, "optsection" (the options section of the FMT file).
+
+    Args:
+    routes_path (str): The path of the routing table.
+
+    Returns:
+    list: The routes as tuples (pattern, absolute path of the FMT file, options section or None), in their order.
+    """
+    folder = os.path.dirname(os.path.abspath(routes_path))
+    routes = []
+    with open(routes_path, encoding="utf-8-sig", newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            pattern, fmt_path = (row.get("pattern") or "").strip(), (row.get("fmt_path") or "").strip()
+            if not pattern or not fmt_path:
+                raise ChkCsvError("The route in line {} of the routing table has no pattern or no FMT file".format(line), routes_path, line)
+            fmt_path = os.path.normpath(os.path.join(folder, fmt_path))
+            if not os.path.exists(fmt_path):
+                raise ChkCsvError("The format file of the route in line {} of the routing table does not exist: {}".format(line, fmt_path), routes_path, line)
+            routes.append((pattern, fmt_path, (row.get("optsection") or "").strip() or None))
+    return routes
+
+def get_route(file, routes, fmt_path, optsection):
+    """
+    Find the FMT file of a CSV file: that of the first route matching it, the default one otherwise.
+
+    Args:
+    file (str): The path of the file relative to the checked directory (or its name).
+    routes (list): The routes returned by read_routes.
+    fmt_path (str): The default FMT file, "" for none.
+    optsection (str): The default options section.
+
+    Returns:
+    tuple: The FMT file and the options section, None if the file has no route and there is no default FMT file.
+    """
+    names = [os.path.basename(split_archive_member(file)[1] or file), file.replace(os.sep, "/")]
+    for pattern, route_fmt_path, route_optsection in routes:
+        if any(match_name(name, [pattern]) for name in names):
+            return route_fmt_path, route_optsection or optsection
+    return (os.path.abspath(fmt_path), optsection) if fmt_path else None
+
+@contextlib.contextmanager
+def open_binary(path):
+    """
+    Open a CSV file as bytes, decompressing it on the fly if it is compressed (gzip, bz2, xz) or in a ZIP archive,
+    without writing it anywhere.
+
+    Args:
+    path (str): The path of the file, as "bundle.zip!data.csv" for a file in an archive (or the path of an archive
+    with only one file).
+
+    Yields:
+    file: The file, opened as bytes.
+    """
+    archive_path, member = split_archive_member(path)
+    if member is None and is_zip(path):
+        with zipfile.ZipFile(path) as archive:
+            members = [info.filename for info in archive.infolist() if not info.is_dir()]
+        if len(members) != 1:
+            raise ValueError("the archive has {} files, select one of them as {}{}file".format(len(members), path, ARCHIVE_SEPARATOR))
+        member = members[0]
+    if member is not None:
+        with zipfile.ZipFile(archive_path) as archive, archive.open(member) as binary:
+            yield binary
+        return
+    extension = os.path.splitext(path)[1].lower()
+    with COMPRESSIONS.get(extension, open)(path, "rb") as binary:
+        yield binary
+
+@contextlib.contextmanager
+def open_csv(path, encoding):
+    """
+    Open a CSV file as text, decompressing it on the fly if needed (see open_binary).
+
+    Args:
+    path (str): The path of the file.
+    encoding (str): The character encoding of the file.
+
+    Yields:
+    file: The file, opened as text.
+    """
+    with open_binary(path) as binary, io.TextIOWrapper(binary, encoding=encoding, newline="") as f:
+        yield f
+
+# Bytes read at the start of a file to find its encoding and dialect
+SNIFF_BYTES = 65536
+
+# Byte order marks and the encodings reading them, the UTF-32 ones before the UTF-16 one starting the same way
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")
+]
+
+def detect_encoding(block):
+    """
+    Detect the encoding of a file from its first bytes: from its byte order mark if it has one, UTF-8 if they are
+    valid UTF-8, Windows-1252 if they are valid in it, and Latin-1 (which reads any byte) otherwise.
+
+    Args:
+    block (bytes): The first bytes of the file.
+
+    Returns:
+    str: The name of the encoding.
+    """
+    for bom, encoding in BOMS:
+        if block.startswith(bom):
+            return encoding
+    try:
+        # The block may end in the middle of a character
+        codecs.getincrementaldecoder("utf-8")().decode(block, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        block.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+def sniff_dialect(text):
+    """
+    Find the delimiter and quote character of a CSV file from its first line, as check_csv_file does, or from its
+    first lines if the first line is not enough (e.g. a single column), the default CSV dialect otherwise.
+
+    Args:
+    text (str): The start of the file.
+
+    Returns:
+    csv.Dialect: The dialect of the file.
+    """
+    first_line = io.StringIO(text, newline="").readline()
+    try:
+        dialect = csv.Sniffer().sniff(first_line)
+        # A letter or a digit is only found as delimiter in a header without any (one column)
+        if not dialect.delimiter.isalnum():
+            return dialect
+    except csv.Error:
+        pass
+    try:
+        return csv.Sniffer().sniff(text, delimiters=",;\t|")
+    except csv.Error:
+        return csv.excel
+
+# Encodings and dialects of the files, indexed by file (path, modification time and size) and encoding option
+format_cache = {}
+
+def get_csv_format(csv_path, encoding="auto"):
+    """
+    Get the encoding and the dialect of a CSV file from its first block of bytes only, sniffing them only if the file
+    was not sniffed before or if it changed since then.
+
+    Args:
+    csv_path (str): The path of the CSV file.
+    encoding (str): The encoding of the file, "auto" (or "") to detect it.
+
+    Returns:
+    tuple: The encoding and the dialect (csv.Dialect) of the file.
+    """
+    stat = os.stat(split_archive_member(csv_path)[0])
+    key = (os.path.abspath(csv_path), stat.st_mtime_ns, stat.st_size, encoding)
+    if key not in format_cache:
+        with open_binary(csv_path) as f:
+            block = f.read(SNIFF_BYTES)
+        if encoding in ("", "auto"):
+            encoding = detect_encoding(block)
+        text = codecs.getincrementaldecoder(encoding)(errors="replace").decode(block)
+        format_cache[key] = (encoding, sniff_dialect(text))
+    return format_cache[key]
+
+def show_csv_format(encoding, dialect):
+    return "CSV format: encoding {}, delimiter {!r}, quote character {!r}.\n".format(encoding, dialect.delimiter, dialect.quotechar)
+
+# Number of rows read and checked at once by the row engine and by the vectorised engine
+CHUNK_ROWS = 10000
+VECTORISED_CHUNK_ROWS = 100000
+
+def check_header(colnames, cols, options, csv_path):
+    """
+    Check the column names of a CSV file against the format specifications, as check_csv_file does.
+
+    Args:
+    colnames (list): The column names of the CSV file.
+    cols (dict): The format specifications returned by read_format_specs.
+    options (dict): The values of the options of the interface.
+    csv_path (str): The path of the CSV file.
+
+    Returns:
+    tuple: The errors of the header, and the layout of the rows to check (None if the rows are not to be checked): the
+    position and format specifications of the columns to check, the number of columns of the header and the highest
+    position of a column to check.
+    """
+    caseinsensitive = options["caseinsensitive"]
+    names = [c.lower() for c in colnames] if caseinsensitive else colnames
+    key = str.lower if caseinsensitive else str
+    # Stop if all required columns are not present
+    req_missing = [col for col in cols if cols[col].column_required and key(col) not in names]
+    if len(req_missing) > 0:
+        return [("The following columns are required, but are not present in the CSV file: %s." % ", ".join(req_missing), csv_path, 1)], None
+    # Stop if there are extra columns and either the option to exit is set or the column positions must match
+    if options["columnexit"] or options["position"]:
+        speccols = [key(col) for col in cols]
+        extra = [col for col, name in zip(colnames, names) if name not in speccols]
+        if len(extra) > 0:
+            return [("The following columns have no format specifications but are in the CSV file: %s." % ", ".join(extra), csv_path, 1)], None
+    errors = []
+    # Report an error if the position (order) of columns is required to be the same and it is not
+    if options["position"]:
+        spec_col_order = [key(col) for col in sorted(cols, key=lambda col: cols[col].column_position)]
+        if any(spec_col_order[i] != name for i, name in enumerate(names)):
+            errors.append(("The order of columns in the CSV file is not the same as in the specifications", csv_path, 1))
+    # Position and format specifications of the columns common to specifications and data file
+    if caseinsensitive:
+        chkcols = {col: colname for col in cols for colname in colnames if col.lower() == colname.lower()}
+    else:
+        chkcols = {col: col for col in cols if col in colnames}
+    checks = [(colnames.index(chkcols[col]), cols[col]) for col in chkcols]
+    # 0 if format file is empty
+    maxindex = max([index for index, checker in checks], default=0)
+    return errors, (checks, len(colnames), maxindex)
+
+def stream_csv_errors(csv_path, cols, options, max_errors=0, key_run=None):
+    """
+    Check a CSV file against the format specifications as check_csv_file does, but reading it chunk by chunk and
+    giving the errors as they are found, so that the memory used does not depend on the size of the file.
+
+    Args:
+    csv_path (str): The path of the CSV file.
+    cols (dict): The format specifications returned by read_format_specs.
+    options (dict): The values of the options of the interface.
+    max_errors (int): The number of errors after which the file is not read further (no limit if 0).
+    key_run (KeyRun): The run file where the key values of all the rows are written, even after the check stops.
+
+    Yields:
+    tuple: The number of rows read so far (header included) and the errors found since the previous chunk, as tuples
+    (message, file, line, column).
+    """
+    halt = options["haltonerror"]
+    encoding, dialect = get_csv_format(csv_path, options["encoding"])
+    with open_csv(csv_path, encoding) as f:
+        # The first line is read again by the reader, the compressed files cannot go back to it
+        first_line = f.readline()
+        reader = csv.reader(itertools.chain([first_line], f), dialect=dialect)
+        colnames = next(reader)
+        errors, layout = check_header(colnames, cols, options, csv_path)
+        count = len(errors)
+        if count > 0:
+            yield 1, errors
+        check_rows, chunk_rows = ENGINES[options.get("engine", "row")]
+        chunks = iter(lambda: list(itertools.islice(reader, chunk_rows)), [])
+        row_no = 1
+        if key_run is not None:
+            key_run.set_columns(colnames, options["caseinsensitive"])
+        if layout is None or max_errors and count >= max_errors:
+            if key_run is not None:
+                key_run.add_all(chunks, row_no)
+            return
+        # Read and check the CSV file chunk by chunk until done (or until an error)
+        for chunk in chunks:
+            errors = check_rows(chunk, row_no, layout, csv_path, options, max_errors - count if max_errors else 0)
+            if key_run is not None:
+                key_run.add_rows(chunk, row_no)
+            row_no += len(chunk)
+            # Stop checking at the first error or when the maximum number of errors is reached
+            if errors and (halt or max_errors and count + len(errors) >= max_errors):
+                yield errors[-1][2], errors
+                if key_run is not None:
+                    key_run.add_all(chunks, row_no)
+                return
+            count += len(errors)
+            yield row_no, errors
+
+def check_rows(chunk, row_no, layout, csv_path, options, limit=0):
+    """
+    Check a chunk of data rows one by one, with the check functions of chkcsv (row engine).
+
+    Args:
+    chunk (list): The data rows, as lists of values.
+    row_no (int): The line number of the row before the chunk.
+    layout (tuple): The position and format specifications of the columns to check, the number of columns of the
+    header and the highest position of a column to check.
+    csv_path (str): The path of the CSV file.
+    options (dict): The values of the options of the interface.
+    limit (int): The number of errors after which the check stops (no limit if 0).
+
+    Returns:
+    list: The errors of the chunk, in the order of check_csv_file, up to the first one if options["haltonerror"].
+    """
+    checks, ncols, maxindex = layout
+    checks = [(index, checker.check, checker.name) for index, checker in checks]
+    halt = options["haltonerror"]
+    linelength = options["linelength"]
+    errors = []
+    for datarow in chunk:
+        row_no += 1
+        n = len(datarow)
+        if 0 < n < ncols and linelength:
+            errors.append(("fewer data values than column headers", csv_path, row_no))
+        if n > ncols and not (halt and errors):
+            errors.append(("more data values than column headers", csv_path, row_no))
+        if n < maxindex + 1:
+            if n > 0 and not (halt and errors):
+                errors.append(("fewer data values than columns in the format specification", csv_path, row_no))
+        else:
+            for index, check, name in checks:
+                if halt and errors:
+                    break
+                col_errs = check(datarow[index])
+                if len(col_errs) > 0:
+                    errors.extend([(e, csv_path, row_no, name) for e in col_errs])
+        if errors and (halt or limit and len(errors) >= limit):
+            return errors[:limit] if limit else errors
+    return errors
+
+def get_rule_masks(checker, values):
+    """
+    Evaluate the rules of a column on all its values at once: the lengths are compared as arrays and the type and
+    pattern checks of chkcsv are only run once per distinct value.
+
+    Args:
+    checker (CsvChecker): The format specifications of the column.
+    values (list): The values of the column.
+
+    Yields:
+    tuple: The position of the rule among the check functions of the column, the error message and the mask of the
+    values failing the rule, in the order of CsvChecker.check.
+    """
+    import numpy as np
+    import pandas as pd
+
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    factorized = []
+
+    def unique_masks(position, function):
+        if not factorized:
+            factorized.extend(pd.factorize(np.array(values, dtype=object)))
+        codes, uniques = factorized
+        results = [function(value) for value in uniques]
+        for message in dict.fromkeys(result for result in results if result):
+            yield position, message, np.array([result == message for result in results], dtype=bool)[codes]
+
+    def all_numbers(dtype):
+        # Numpy converts the text to numbers in one go when all the values are valid (it accepts less than int and
+        # float, except for trailing null characters, which are dropped from the text array and detected by its lengths)
+        text = np.array(values)[lengths > 0]
+        try:
+            text.astype(dtype)
+        except (ValueError, OverflowError):
+            return False
+        return bool((np.char.str_len(text) == lengths[lengths > 0]).all())
+
+    kind = getattr(checker, "type", None)
+    if checker.data_required:
+        yield 0, "missing data", lengths == 0
+    if kind in ["integer", "float"]:
+        if not all_numbers(np.int64 if kind == "integer" else np.float64):
+            yield from unique_masks(1, checker.chk_int if kind == "integer" else checker.chk_float)
+    elif kind in ["date", "datetime"]:
+        yield from unique_masks(1, checker.chk_date if kind == "date" else checker.chk_datetime)
+        if kind in ["date", "datetime"] and hasattr(checker, "pattern"):
+            yield from unique_masks(2, checker.chk_pat)
+    elif kind in [None, "string"]:
+        if hasattr(checker, "minlen"):
+            too_short = lengths < checker.minlen
+            if not checker.data_required:
+                too_short &= lengths > 0
+            yield 1, "data too short", too_short
+        if hasattr(checker, "maxlen"):
+            yield 2, "data too long", lengths > checker.maxlen
+        if hasattr(checker, "pattern"):
+            yield from unique_masks(3, checker.chk_pat)
+
+def check_rows_vectorised(chunk, row_no, layout, csv_path, options, limit=0):
+    """
+    Check a chunk of data rows column by column, with masks over the values of each column (vectorised engine). The
+    errors are the same as those of check_rows, in the same order.
+
+    Args:
+    chunk (list): The data rows, as lists of values.
+    row_no (int): The line number of the row before the chunk.
+    layout (tuple): The position and format specifications of the columns to check, the number of columns of the
+    header and the highest position of a column to check.
+    csv_path (str): The path of the CSV file.
+    options (dict): The values of the options of the interface.
+    limit (int): The number of errors after which the check stops (no limit if 0).
+
+    Returns:
+    list: The errors of the chunk, in the order of check_csv_file, up to the first one if options["haltonerror"].
+    """
+    import numpy as np
+
+    checks, ncols, maxindex = layout
+    lengths = np.fromiter(map(len, chunk), dtype=np.int64, count=len(chunk))
+    # Failing rows of each rule, with the order of the rule in a row: 0 to 2 for the number of values, then 16 per
+    # column (one per check function)
+    failures = []
+    if options["linelength"]:
+        failures.append((np.flatnonzero((lengths > 0) & (lengths < ncols)), 0, "fewer data values than column headers", None))
+    failures.append((np.flatnonzero(lengths > ncols), 1, "more data values than column headers", None))
+    failures.append((np.flatnonzero((lengths > 0) & (lengths < maxindex + 1)), 2, "fewer data values than columns in the format specification", None))
+    full = np.flatnonzero(lengths >= maxindex + 1)
+    if full.size > 0:
+        rows = chunk if full.size == len(chunk) else [chunk[i] for i in full]
+        for k, (index, checker) in enumerate(checks):
+            values = list(map(operator.itemgetter(index), rows))
+            for position, message, mask in get_rule_masks(checker, values):
+                failures.append((full[mask], 16 * (k + 1) + position, message, checker.name))
+    failures = [failure for failure in failures if failure[0].size > 0]
+    if len(failures) == 0:
+        return []
+    # Sort the errors by row, then by order in the row
+    found = np.concatenate([failure[0] for failure in failures])
+    orders = np.concatenate([np.full(failure[0].size, failure[1]) for failure in failures])
+    groups = np.concatenate([np.full(failure[0].size, i) for i, failure in enumerate(failures)])
+    sort = np.lexsort((orders, found))
+    found, orders, groups = found[sort], orders[sort], groups[sort]
+    if options["haltonerror"]:
+        # Only the first error about the number of values, or the errors of the first column, of the first row
+        batches = np.where(orders < 16, orders, orders // 16 * 16)
+        first = (found == found[0]) & (batches == batches[0])
+        found, groups = found[first], groups[first]
+    if limit:
+        found, groups = found[:limit], groups[:limit]
+    errors = []
+    for i, group in zip(found.tolist(), groups.tolist()):
+        message, name = failures[group][2], failures[group][3]
+        errors.append((message, csv_path, row_no + 1 + i) if name is None else (message, csv_path, row_no + 1 + i, name))
+    return errors
+
+# Check function of a chunk of rows and number of rows per chunk of each engine
+ENGINES = {
+    "row": (check_rows, CHUNK_ROWS),
+    "vectorised": (check_rows_vectorised, VECTORISED_CHUNK_ROWS)
+}
+
+# Number of rows checked at the start of the file and sampled across it by default in the sampling mode, seed of the
+# sample (the same rows are sampled again while the file does not change) and confidence of the estimated error rates
+SAMPLE_ROWS = 1000
+SAMPLE_SEED = 0
+SAMPLE_Z = 1.96
+
+def get_wilson_interval(failures, n, z=SAMPLE_Z):
+    """
+    Get the Wilson score interval of a proportion.
+
+    Args:
+    failures (int): The number of failures.
+    n (int): The size of the sample.
+    z (float): The quantile of the normal distribution of the confidence (1.96 for 95%).
+
+    Returns:
+    tuple: The lower and upper bounds of the proportion.
+    """
+    if n == 0:
+        return 0.0, 1.0
+    p = failures / n
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(centre - margin, 0.0), min(centre + margin, 1.0)
+
+def sample_lines(csv_path, size, start, rows, seed=SAMPLE_SEED):
+    """
+    Read lines spread across a file, by stratified sampling: the file is split into as many strata of bytes as lines
+    to read, and the line following a random position of each stratum is read.
+
+    Args:
+    csv_path (str): The path of the file (not compressed).
+    size (int): The size of the file in bytes.
+    start (int): The position of the first byte to sample (after the header).
+    rows (int): The number of lines to read.
+    seed (int): The seed of the random generator.
+
+    Returns:
+    list: The lines read (as bytes) and their positions in the file.
+    """
+    rng = random.Random(seed)
+    stratum = (size - start) / rows
+    lines = []
+    with open(csv_path, "rb") as f:
+        for i in range(rows):
+            f.seek(start + int(stratum * i + rng.random() * stratum))
+            # Go to the start of the next line
+            if f.tell() > start:
+                f.readline()
+            position = f.tell()
+            line = f.readline()
+            if line.strip() and (not lines or position != lines[-1][1]):
+                lines.append((line, position))
+    return lines
+
+def sample_csv_errors(csv_path, cols, options, rows=SAMPLE_ROWS):
+    """
+    Check the header of a CSV file, its first rows and a sample of rows spread across it, and estimate the error rate
+    of each column from the sample, without reading the whole file. The rows of the sample are read from random byte
+    positions moved to the start of the next line, so a row with line breaks in a quoted value may be read in part.
+    The compressed files cannot be read from random positions and only their first rows are checked.
+
+    Args:
+    csv_path (str): The path of the CSV file.
+    cols (dict): The format specifications returned by read_format_specs.
+    options (dict): The values of the options of the interface.
+    rows (int): The number of rows checked at the start of the file and sampled across it.
+
+    Returns:
+    tuple: The errors found (those of the sampled rows have their byte position instead of a line number), the number
+    of rows checked, and the sample: its number of rows and, for each column with errors in it (and "(row length)"
+    for the rows with a wrong number of values), the number of failing rows and the bounds of the error rate.
+    """
+    check_rows, chunk_rows = ENGINES[options.get("engine", "row")]
+    options = dict(options, haltonerror=False)
+    encoding, dialect = get_csv_format(csv_path, options["encoding"])
+    with open_csv(csv_path, encoding) as f:
+        first_line = f.readline()
+        reader = csv.reader(itertools.chain([first_line], f), dialect=dialect)
+        colnames = next(reader)
+        errorlist, layout = check_header(colnames, cols, options, csv_path)
+        if layout is None:
+            return errorlist, 1, None
+        head = list(itertools.islice(reader, rows))
+    errorlist.extend(check_rows(head, 1, layout, csv_path, options))
+    checked = 1 + len(head)
+
+    # Sample the rows across the file, unless it is compressed, has no more rows or has no single byte line breaks
+    compressed = split_archive_member(csv_path)[1] is not None or is_zip(csv_path) or os.path.splitext(csv_path)[1].lower() in COMPRESSIONS
+    random_sample = not compressed and len(head) == rows and not encoding.startswith(("utf-16", "utf-32"))
+    if random_sample:
+        lines = sample_lines(csv_path, os.path.getsize(csv_path), len(first_line.encode(encoding)), rows)
+        sample = [next(csv.reader([line.decode(encoding, errors="replace")], dialect=dialect), []) for line, position in lines]
+        errors = check_rows(sample, 0, layout, csv_path, options)
+        # The line of a sampled row is only known by its position
+        errorlist.extend((error[0] + " (sampled row at byte {})".format(lines[error[2] - 1][1]), csv_path, None) + tuple(error[3:]) for error in errors)
+        checked += len(sample)
+    else:
+        # The error rates are those of the first rows (all the rows if the file has no more)
+        sample = head
+        errors = [error for error in errorlist if error[2] != 1]
+
+    # Estimated error rate of each column, counting the rows with at least one error in it
+    failing = {}
+    for error in errors:
+        failing.setdefault(error[3] if len(error) > 3 else "(row length)", set()).add(error[2])
+    estimates = {column: (len(failed), ) + get_wilson_interval(len(failed), len(sample)) for column, failed in failing.items()}
+    return errorlist, checked, {"rows": len(sample), "random": random_sample, "columns": estimates}
+
+def validate_file(file_path, cols, options, key_run=None):
+    """
+    Check one CSV file against the format specifications.
+
+    Args:
+    file_path (str): The path of the CSV file.
+    cols (dict): The format specifications returned by read_format_specs.
+    options (dict): The values of the options of the interface.
+    key_run (KeyRun): The run file where the key values are written (not with a sampled check).
+
+    Returns:
+    tuple: The list of errors (at most options["max_errors"]), the number of rows read, the time spent in seconds and
+    the sample returned by sample_csv_errors if options["sample_rows"] is set (None otherwise).
+    """
+    start = time.perf_counter()
+    if options.get("sample_rows"):
+        errorlist, rows, sample = sample_csv_errors(file_path, cols, options, options["sample_rows"])
+        return errorlist, rows, time.perf_counter() - start, sample
+    errorlist = []
+    rows = 0
+    for rows, errors in stream_csv_errors(file_path, cols, options, options["max_errors"], key_run):
+        errorlist.extend(errors)
+    return errorlist, rows, time.perf_counter() - start, None
+
+# Parsed format specifications, indexed by FMT file (path, modification time and size) and parsing options
+spec_cache = {}
+
+def get_format_specs(fmt_path, options):
+    """
+    Get the format specifications of a FMT file, parsing it only if it was not parsed before with the same options or
+    if it changed since then. The specifications are kept compiled (regular expressions and check functions).
+
+    Args:
+    fmt_path (str): The path of the FMT file.
+    options (dict): The values of the options of the interface.
+
+    Returns:
+    tuple: The format specifications returned by read_format_specs and whether they came from the cache.
+    """
+    stat = os.stat(fmt_path)
+    key = (os.path.abspath(fmt_path), stat.st_mtime_ns, stat.st_size, options["column_required"], options["data_required"], options["optsection"])
+    if key in spec_cache:
+        return spec_cache[key], True
+    # Forget the previous versions of the file
+    for old_key in [k for k in spec_cache if k[0] == key[0] and k[1:3] != key[1:3]]:
+        del spec_cache[old_key]
+    spec_cache[key] = read_format_specs(fmt_path, options["column_required"], options["data_required"], options["optsection"])
+    return spec_cache[key], False
+
+def validate_file_in_worker(file_path, fmt_path, options, run_path=None):
+    # The specifications cannot be sent to the processes (they contain functions), each process keeps its own cache
+    cols, cached = get_format_specs(fmt_path, options)
+    if run_path is None:
+        return validate_file(file_path, cols, options) + (cached,)
+    # The key values are written to a run file, loaded in the key index by the main process
+    with KeyRun(run_path, read_key_specs(fmt_path, options["optsection"])) as key_run:
+        return validate_file(file_path, cols, options, key_run) + (cached,)
+
+def read_key_specs(fmt_path, optsection):
+    """
+    Read the keys declared in the options section of a FMT file (chkcsv does not accept them in the column sections):
+    "unique_key.NAME: COLUMNS" for the columns of a key whose values must be unique across all the checked files, and
+    "references.NAME: COLUMNS" for the columns whose values must be values of that key in one of the checked files.
+    The columns are separated by commas for a composite key.
+
+    Args:
+    fmt_path (str): The path of the FMT file.
+    optsection (str): The name of the options section of the FMT file.
+
+    Returns:
+    dict: For "unique_key" and "references", the column names of each key name.
+    """
+    fmtspecs = configparser.ConfigParser(interpolation=None)
+    fmtspecs.read([fmt_path])
+    key_specs = {"unique_key": {}, "references": {}}
+    if fmtspecs.has_section(optsection):
+        for option, value in fmtspecs.items(optsection):
+            kind, _, name = option.partition(".")
+            if kind in key_specs and name:
+                key_specs[kind][name] = [col.strip() for col in value.split(",") if col.strip()]
+    return key_specs
+
+class KeyRun():
+    """
+    Write the key values of the rows of a CSV file to a run file (kind, key name, value, line), so that they are
+    loaded in the key index without being kept in memory. The values of a composite key are joined with a unit
+    separator, and the empty values are not written.
+    """
+    def __init__(self, run_path, key_specs):
+        self.run_path = run_path
+        self.key_specs = key_specs
+        self.columns = []
+        self.file = open(run_path, "w", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.file.close()
+
+    def set_columns(self, colnames, caseinsensitive):
+        # Position of the columns of each key, the keys with missing columns are not written (the header errors tell)
+        names = [c.lower() for c in colnames] if caseinsensitive else colnames
+        self.columns = []
+        for kind, keys in self.key_specs.items():
+            for name, cols in keys.items():
+                cols = [c.lower() for c in cols] if caseinsensitive else cols
+                if all(col in names for col in cols):
+                    self.columns.append((kind, name, [names.index(col) for col in cols]))
+
+    def add_rows(self, chunk, row_no):
+        for kind, name, indexes in self.columns:
+            if len(indexes) == 1:
+                index = indexes[0]
+                values = ([row[index] if index < len(row) else ""] for row in chunk)
+            else:
+                values = ([row[index] if index < len(row) else "" for index in indexes] for row in chunk)
+            self.writer.writerows(
+                (kind, name, "\x1f".join(value), line) for line, value in enumerate(values, start=row_no + 1) if any(value)
+            )
+
+    def add_all(self, chunks, row_no):
+        # Write the keys of the rows left unchecked after an error stopped the check
+        for chunk in chunks:
+            self.add_rows(chunk, row_no)
+            row_no += len(chunk)
+
+# Memory used by SQLite for the pages of the key index (negative: in KiB)
+KEY_INDEX_CACHE = -16384
+
+class KeyIndex():
+    """
+    Index of the key values of all the checked files in a temporary SQLite database on disk, so that the duplicate
+    keys and the values referencing no key are found across hundreds of files with bounded memory.
+    """
+    def __init__(self):
+        self.folder = tempfile.mkdtemp(prefix="chkcsv_keys_")
+        self.db = sqlite3.connect(os.path.join(self.folder, "keys.db"))
+        self.db.execute("PRAGMA journal_mode=OFF")
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.db.execute("PRAGMA cache_size={}".format(KEY_INDEX_CACHE))
+        self.db.execute("CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT, columns TEXT)")
+        self.db.execute("CREATE TABLE keys (kind TEXT, name TEXT, value TEXT, file INTEGER, line INTEGER)")
+        self.runs = 0
+
+    def get_run_path(self):
+        self.runs += 1
+        return os.path.join(self.folder, "run{}.csv".format(self.runs))
+
+    def add_run(self, file_path, run_path, key_specs):
+        """
+        Load the key values of a file from its run file, and delete it.
+
+        Args:
+        file_path (str): The path of the CSV file.
+        run_path (str): The path of the run file written by KeyRun.
+        key_specs (dict): The keys declared in the FMT file of the CSV file, returned by read_key_specs.
+
+        Returns:
+        None
+        """
+        file_id = self.db.execute("INSERT INTO files (path, columns) VALUES (?, ?)", (file_path, json.dumps(key_specs))).lastrowid
+        if os.path.exists(run_path):
+            with open(run_path, encoding="utf-8", newline="") as f:
+                self.db.executemany("INSERT INTO keys VALUES (?, ?, ?, ?, ?)", (row[:3] + [file_id, int(row[3])] for row in csv.reader(f)))
+            os.remove(run_path)
+
+    def get_errors(self, max_errors=0):
+        """
+        Find the duplicate key values and the values referencing no key, across all the loaded files.
+
+        Args:
+        max_errors (int): The number of errors of each kind after which the others are not reported (no limit if 0).
+
+        Returns:
+        list: The errors, as tuples (message, file, line, column), the duplicates first.
+        """
+        self.db.execute("CREATE INDEX keys_value ON keys (kind, name, value)")
+        limit = max_errors or -1
+        files = {file_id: (path, json.loads(columns)) for file_id, path, columns in self.db.execute("SELECT id, path, columns FROM files")}
+        errors = []
+        # Every occurrence of a key value but the first one
+        duplicates = self.db.execute(
+            "SELECT k.name, k.value, k.file, k.line, f.file, f.line FROM keys k JOIN ("
+            "SELECT name, value, MIN(rowid) AS first FROM keys WHERE kind = 'unique_key' GROUP BY name, value HAVING COUNT(*) > 1"
+            ") d ON k.kind = 'unique_key' AND k.name = d.name AND k.value = d.value AND k.rowid != d.first "
+            "JOIN keys f ON f.rowid = d.first ORDER BY k.rowid LIMIT ?", (limit,)
+        )
+        for name, value, file_id, line, first_id, first_line in duplicates:
+            errors.append((
+                "duplicate value '{}' of key '{}' (first in file {}, line {})".format(value.replace("\x1f", ", "), name, files[first_id][0], first_line),
+                files[file_id][0], line, ", ".join(files[file_id][1]["unique_key"][name])
+            ))
+        # References to values of a key found in no file, when the key is declared in at least one FMT file
+        declared = {name for path, key_specs in files.values() for name in key_specs["unique_key"]}
+        orphans = self.db.execute(
+            "SELECT r.name, r.value, r.file, r.line FROM keys r WHERE r.kind = 'references' AND NOT EXISTS ("
+            "SELECT 1 FROM keys k WHERE k.kind = 'unique_key' AND k.name = r.name AND k.value = r.value"
+            ") ORDER BY r.rowid"
+        )
+        orphans = (orphan for orphan in orphans if orphan[0] in declared)
+        for name, value, file_id, line in itertools.islice(orphans, max_errors or None):
+            errors.append((
+                "value '{}' not found in key '{}'".format(value.replace("\x1f", ", "), name),
+                files[file_id][0], line, ", ".join(files[file_id][1]["references"][name])
+            ))
+        return errors
+
+    def get_undeclared(self):
+        # Key names referenced but declared in no FMT file of the checked files
+        key_specs = [json.loads(columns) for columns, in self.db.execute("SELECT columns FROM files")]
+        declared = {name for specs in key_specs for name in specs["unique_key"]}
+        return sorted({name for specs in key_specs for name in specs["references"]} - declared)
+
+    def close(self):
+        self.db.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+# Ledger of the files found without errors: a file is not checked again as long as it, the FMT file and the options
+# do not change
+LEDGER_PATH = os.path.join(os.path.expanduser("~"), ".chkcsv_ledger.json")
+
+# The window, the command line and the watcher may update the ledger at the same time: each of them merges its changes
+# into the ledger while holding a lock file, which is broken when it is older than LEDGER_LOCK_TIMEOUT seconds (left by
+# a process that died)
+LEDGER_LOCK_TIMEOUT = 10
+
+# Options changing the result of a check
+CHECK_OPTIONS = ["data_required", "column_required", "columnexit", "linelength", "position", "caseinsensitive", "optsection", "encoding"]
+
+def load_ledger(path=LEDGER_PATH):
+    """
+    Read the ledger of the files found without errors.
+
+    Args:
+    path (str): The path of the ledger.
+
+    Returns:
+    dict: The entries of the ledger indexed by absolute path of CSV file (empty if there is no valid ledger).
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def read_lock(lock_path):
+    # The token of the holder of a lock file, None if there is no lock
+    try:
+        with open(lock_path, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def break_stale_lock(lock_path, token):
+    """
+    Remove a lock file older than LEDGER_LOCK_TIMEOUT seconds. The lock is first renamed to a name of this process only,
+    so that the lock of another process is never removed by name: if the lock renamed turns out to be a new one (the
+    stale lock was released and taken again in the meantime), it is put back unless a new lock was taken since.
+
+    Args:
+    lock_path (str): The path of the lock file.
+    token (str): The token of this process.
+
+    Returns:
+    None
+    """
+    try:
+        if time.time() - os.path.getmtime(lock_path) <= LEDGER_LOCK_TIMEOUT:
+            return
+        stale_path = "{}.{}.stale".format(lock_path, token.replace(":", "_"))
+        os.rename(lock_path, stale_path)
+    except OSError:
+        # The lock was released or broken by another process in the meantime
+        return
+    try:
+        if time.time() - os.path.getmtime(stale_path) <= LEDGER_LOCK_TIMEOUT:
+            # Put the lock back without replacing a lock taken since
+            os.link(stale_path, lock_path)
+    except OSError:
+        pass
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(stale_path)
+
+@contextlib.contextmanager
+def lock_ledger(path=LEDGER_PATH):
+    """
+    Hold the lock file of the ledger, waiting for the other processes to release it. The lock file holds a token of
+    this process (process id and random value), and it is only removed while it still holds it.
+
+    Args:
+    path (str): The path of the ledger.
+
+    Yields:
+    None
+    """
+    lock_path = path + ".lock"
+    token = "{}:{:016x}".format(os.getpid(), random.getrandbits(64))
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            break_stale_lock(lock_path, token)
+            time.sleep(0.05)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    try:
+        yield
+    finally:
+        # The lock may have been broken as stale, and taken by another process since
+        if read_lock(lock_path) == token:
+            with contextlib.suppress(OSError):
+                os.remove(lock_path)
+
+def save_ledger(ledger, loaded, path=LEDGER_PATH):
+    """
+    Merge the entries added, changed and removed since the ledger was read into the ledger of the files found without
+    errors, without the files that do not exist anymore, keeping the entries written by the other processes meanwhile.
+
+    Args:
+    ledger (dict): The entries of the ledger indexed by absolute path of CSV file.
+    loaded (dict): The entries as read by load_ledger or written by the previous call, updated to the saved entries.
+    path (str): The path of the ledger.
+
+    Returns:
+    None
+    """
+    changes = {file: ledger.get(file) for file in set(ledger) | set(loaded) if ledger.get(file) != loaded.get(file)}
+    with lock_ledger(path):
+        merged = load_ledger(path)
+        for file, entry in changes.items():
+            if entry is None:
+                merged.pop(file, None)
+            else:
+                merged[file] = entry
+        merged = {file: entry for file, entry in merged.items() if os.path.exists(split_archive_member(file)[0])}
+        # Write the ledger under a temporary name first, so that it is never left half written
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(merged, f)
+        os.replace(tmp_path, path)
+    loaded.clear()
+    loaded.update(ledger)
+
+def get_check_key(fmt_path, options):
+    """
+    Identify the FMT file (by its content) and the options of a check.
+
+    Args:
+    fmt_path (str): The path of the FMT file.
+    options (dict): The values of the options of the interface.
+
+    Returns:
+    str: A hash of the FMT file and of the options changing the result of a check.
+    """
+    with open(fmt_path, "rb") as f:
+        fmt_hash = hashlib.sha256(f.read()).hexdigest()
+    return fmt_hash + ":" + json.dumps([options[name] for name in CHECK_OPTIONS])
+
+def get_ledger_entry(file_path, check_key):
+    # The files of an archive change with it
+    stat = os.stat(split_archive_member(file_path)[0])
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "check": check_key}
+
+def is_clean_in_ledger(ledger, file_path, check_key):
+    """
+    Tell whether a file was found without errors with the same FMT file and options and has not changed since.
+
+    Args:
+    ledger (dict): The entries of the ledger indexed by absolute path of CSV file.
+    file_path (str): The path of the CSV file.
+    check_key (str): The key returned by get_check_key.
+
+    Returns:
+    bool: True if the result of the previous check can be reused.
+    """
+    entry = ledger.get(os.path.abspath(file_path))
+    return entry is not None and {k: entry.get(k) for k in ["size", "mtime_ns", "check"]} == get_ledger_entry(file_path, check_key)
+
+def record_result(ledger, file_path, check_key, errorlist, options):
+    # Only the files without errors are kept in the ledger, and only after a full check
+    if options.get("sample_rows"):
+        return
+    if len(errorlist) == 0:
+        ledger[os.path.abspath(file_path)] = dict(get_ledger_entry(file_path, check_key), date=time.strftime("%Y-%m-%d %H:%M"))
+    else:
+        ledger.pop(os.path.abspath(file_path), None)
+
+# Pool of processes kept from one check to the next, so that their caches of format specifications are reused
+pool = None
+
+def get_pool():
+    global pool
+    if pool is None:
+        pool = ProcessPoolExecutor()
+    return pool
+
+def reset_pool():
+    # Forget a pool broken by a process that died (out of memory, crash of an extension), the next one is new
+    global pool
+    if pool is not None:
+        pool.shutdown(wait=False)
+        pool = None
+
+def submit_to_pool(function, *args):
+    """
+    Run a function in the pool of processes, in a new pool if the current one is broken.
+
+    Args:
+    function (function): The function.
+    args: The arguments of the function.
+
+    Returns:
+    concurrent.futures.Future: The future of the result of the function.
+    """
+    try:
+        return get_pool().submit(function, *args)
+    except BrokenProcessPool:
+        reset_pool()
+        return get_pool().submit(function, *args)
+
+#####################################################################################################
+
+def show_errors(errorlist):
+    """
+    Format a list of errors, one per line.
+
+    Args:
+    errorlist (list): The errors, as tuples (message, file, line, column).
+
+    Returns:
+    str: The errors as text.
+    """
+    error_str = ""
+    error_parts = []
+    # Loop over errors
+    for err in errorlist:
+        error_parts = [e for e in zip(("Error:", "in file", "in line", "in column"), err) if e[1]]
+        error_strings = [f"{part[0]} {part[1]}" for part in error_parts]
+        error_message = " ".join(error_strings)
+        error_str += f"{error_message}.\n"
+    return error_str
+
+def show_result(result, options, details=True):
+    """
+    Format the result of the check of a file.
+
+    Args:
+    result (dict): The result returned by get_result.
+    options (dict): The values of the options of the check.
+    details (bool): Whether to list the errors, or only to count them.
+
+    Returns:
+    str: The result as text.
+    """
+    errorlist = result["errors"]
+    if result["failure"] is not None:
+        return "Error: {}.\n".format(result["failure"])
+    if result["cached"] is not None:
+        return "No errors found (cached, checked on {}).".format(result["cached"])
+    if result["sample"] is not None:
+        if len(errorlist) == 0:
+            return "No errors found.\n" + show_sample(result["sample"])
+        error_str = show_errors(errorlist) if details else "{} error(s) found.\n".format(len(errorlist))
+        return error_str + show_sample(result["sample"])
+    if len(errorlist) == 0:
+        return "No errors found."
+    error_str = show_errors(errorlist) if details else "{} error(s) found.\n".format(len(errorlist))
+    if options["max_errors"] and len(errorlist) >= options["max_errors"]:
+        error_str += "Check stopped after {} errors.\n".format(options["max_errors"])
+    return error_str
+
+def show_sample(sample):
+    """
+    Format the estimated error rates of a sampled check.
+
+    Args:
+    sample (dict): The sample returned by sample_csv_errors.
+
+    Returns:
+    str: The error rates as text.
+    """
+    if sample["random"]:
+        sample_str = "Sampled check: header, first rows and {} rows sampled across the file.\n".format(sample["rows"])
+    else:
+        sample_str = "Sampled check: header and first {} rows (no sample across compressed, short, UTF-16 or UTF-32 files).\n".format(sample["rows"])
+    if len(sample["columns"]) == 0:
+        sample_str += "No errors in the sample: error rate below {:.2%} in every column (95% confidence).\n".format(get_wilson_interval(0, sample["rows"])[1])
+    else:
+        sample_str += "Estimated error rate of the rows (95% confidence):\n"
+        for column, (failures, low, high) in sorted(sample["columns"].items(), key=lambda item: -item[1][0]):
+            sample_str += "    {}: {:.2%} ({:.2%} to {:.2%}), {} of {} rows\n".format(column, failures / sample["rows"], low, high, failures, sample["rows"])
+    return sample_str + "Run a full check (sample rows 0) for all the errors.\n"
+
+def get_result(file, path, errorlist=(), rows=0, elapsed=0, cached=None, failure=None, sample=None, fmt=None):
+    """
+    Gather the result of the check of a file, as reported by check_csv and written in the reports.
+
+    Args:
+    file (str): The name of the file (relative to the checked directory).
+    path (str): The path of the file.
+    errorlist (list): The errors found.
+    rows (int): The number of rows read.
+    elapsed (float): The time spent in seconds.
+    cached (str): The date of the previous check if its result was reused, None otherwise.
+    failure (str): The error that stopped the check of the file, None otherwise.
+    sample (dict): The sample of a sampled check, returned by sample_csv_errors.
+    fmt (str): The FMT file the file was checked against.
+
+    Returns:
+    dict: The result of the check.
+    """
+    return {"file": file, "path": path, "fmt": fmt, "errors": list(errorlist), "rows": rows, "time": elapsed, "cached": cached, "failure": failure, "sample": sample}
+
+#####################################################################################################
+
+def get_error_fields(error):
+    # The errors about the number of values of a row have no column, the errors of the keys name the file of the value
+    message, file, line, column = (tuple(error) + (None, None, None))[:4]
+    return {"message": message, "file": file, "line": line, "column": column}
+
+# Number of examples (line numbers) kept per group of errors
+EXAMPLES_PER_GROUP = 5
+
+class ErrorSummary:
+    """
+    Counts of the errors grouped by file, column and message, with the lines of the first errors of each group, so that
+    the errors of large checks can be shown without formatting all of them.
+    """
+
+    def __init__(self, examples=EXAMPLES_PER_GROUP):
+        self.examples = examples
+        # (file, column, message): [count, lines of the first errors]
+        self.groups = {}
+        self.total = 0
+
+    def add(self, file, errorlist):
+        for error in errorlist:
+            fields = get_error_fields(error)
+            group = self.groups.setdefault((file, fields["column"] or "", fields["message"]), [0, []])
+            group[0] += 1
+            if len(group[1]) < self.examples:
+                group[1].append(fields["line"])
+        self.total += len(errorlist)
+
+    def count_by(self, field):
+        """
+        Count the errors by file, by column or by message.
+
+        Args:
+        field (str): "file", "column" or "message".
+
+        Returns:
+        dict: The number of errors of each value of the field, from the most to the least frequent.
+        """
+        position = ["file", "column", "message"].index(field)
+        counts = {}
+        for key, (count, lines) in self.groups.items():
+            counts[key[position]] = counts.get(key[position], 0) + count
+        return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+    def top(self, n=None):
+        """
+        Get the largest groups of errors.
+
+        Args:
+        n (int): The number of groups (all if None).
+
+        Returns:
+        list: The groups as tuples (file, column, message, count, lines of the first errors), from the largest.
+        """
+        groups = sorted(self.groups.items(), key=lambda item: -item[1][0])[:n]
+        return [key + (count, lines) for key, (count, lines) in groups]
+
+# Number of errors per page of the table of errors, and number of groups of errors in the summary
+PAGE_SIZE = 1000
+SUMMARY_GROUPS = 500
+
+class ResultView:
+    """
+    Results of a check as shown by the window, without any dependency on Tk: the output of each file, the summary of
+    the errors and one page of the table of errors, formatted only when shown.
+    """
+
+    def __init__(self):
+        # Errors of the check, as (file, error) pairs, and their summary
+        self.errors = []
+        self.summary = ErrorSummary()
+        self.page = 0
+
+    def add(self, header, result, options):
+        """
+        Add the result of the check of a file.
+
+        Args:
+        header (str): The text shown before the result.
+        result (dict): The result returned by get_result.
+        options (dict): The values of the options of the check.
+
+        Returns:
+        str: The output of the file.
+        """
+        self.errors.extend((result["file"], error) for error in result["errors"])
+        self.summary.add(result["file"], result["errors"])
+        return header + show_result(result, options, details=False)
+
+    def get_summary_rows(self):
+        """
+        Get the rows of the summary: the largest groups of errors, with the lines of their first errors as children.
+
+        Returns:
+        list: The groups as tuples ((file, column, message, count), [(column, line text) of the first errors]).
+        """
+        return [
+            ((file, column, message, count), [(column, "line {}".format(line)) for line in lines])
+            for file, column, message, count, lines in self.summary.top(SUMMARY_GROUPS)
+        ]
+
+    def get_page_rows(self, page):
+        """
+        Go to a page of the table of errors, kept within the pages there are.
+
+        Args:
+        page (int): The number of the page, from 0.
+
+        Returns:
+        list: The errors of the page as tuples (file, line, column, message).
+        """
+        pages = max((len(self.errors) + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+        self.page = min(max(page, 0), pages - 1)
+        first = self.page * PAGE_SIZE
+        rows = []
+        for file, error in self.errors[first:first + PAGE_SIZE]:
+            fields = get_error_fields(error)
+            rows.append((file, fields["line"] or "", fields["column"] or "", fields["message"]))
+        return rows
+
+    def get_page_text(self):
+        """
+        Describe the page of the table of errors.
+
+        Returns:
+        str: The range of errors shown and the number of the page.
+        """
+        first = self.page * PAGE_SIZE
+        last = min(first + PAGE_SIZE, len(self.errors))
+        pages = max((len(self.errors) + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+        return "Errors {}-{} of {} (page {}/{})".format(first + 1 if last else 0, last, len(self.errors), self.page + 1, pages)
+
+    def is_page_full(self, errors):
+        """
+        Tell whether the page shown was full before the last errors were added, so that it does not change.
+
+        Args:
+        errors (int): The number of errors before the last ones were added.
+
+        Returns:
+        bool: True if the page shown does not need to be filled again.
+        """
+        return errors >= (self.page + 1) * PAGE_SIZE
+
+def write_json_report(results, report_path, csv_path, fmt_path, options):
+    """
+    Write the results of a check as a JSON report.
+
+    Args:
+    results (list): The results returned by get_result.
+    report_path (str): The path of the report.
+    csv_path (str): The checked CSV file or directory.
+    fmt_path (str): The FMT file.
+    options (dict): The values of the options of the check.
+
+    Returns:
+    None
+    """
+    summary = ErrorSummary()
+    for result in results:
+        summary.add(result["file"], result["errors"])
+    report = {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "csv_path": csv_path,
+        "fmt_path": fmt_path,
+        "options": options,
+        "summary": {
+            "files": len(results),
+            "files_with_errors": sum(len(result["errors"]) > 0 for result in results),
+            "files_failed": sum(result["failure"] is not None for result in results),
+            "files_cached": sum(result["cached"] is not None for result in results),
+            "errors": sum(len(result["errors"]) for result in results),
+            "rows": sum(result["rows"] for result in results)
+        },
+        "errors_by_column": summary.count_by("column"),
+        "errors_by_message": summary.count_by("message"),
+        "groups": [
+            {"file": file, "column": column, "message": message, "count": count, "lines": lines}
+            for file, column, message, count, lines in summary.top()
+        ],
+        "files": [dict(result, errors=[get_error_fields(error) for error in result["errors"]]) for result in results]
+    }
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+def write_junit_report(results, report_path):
+    """
+    Write the results of a check as a JUnit XML report, with a test case per file: a failure for the files with
+    errors and an error for the files that could not be checked.
+
+    Args:
+    results (list): The results returned by get_result.
+    report_path (str): The path of the report.
+
+    Returns:
+    None
+    """
+    import xml.etree.ElementTree as ET
+
+    suite = ET.Element("testsuite", {
+        "name": "chkcsv",
+        "tests": str(len(results)),
+        "failures": str(sum(len(result["errors"]) > 0 for result in results)),
+        "errors": str(sum(result["failure"] is not None for result in results)),
+        "time": "{:.3f}".format(sum(result["time"] for result in results))
+    })
+    for result in results:
+        case = ET.SubElement(suite, "testcase", {"classname": "chkcsv", "name": result["file"], "time": "{:.3f}".format(result["time"])})
+        if result["failure"] is not None:
+            ET.SubElement(case, "error", {"message": result["failure"]})
+        elif len(result["errors"]) > 0:
+            failure = ET.SubElement(case, "failure", {"message": "{} error(s)".format(len(result["errors"]))})
+            failure.text = show_errors(result["errors"])
+        elif result["cached"] is not None:
+            ET.SubElement(case, "system-out").text = "No errors found (cached, checked on {}).".format(result["cached"])
+    suites = ET.Element("testsuites")
+    suites.append(suite)
+    ET.ElementTree(suites).write(report_path, encoding="utf-8", xml_declaration=True)
+
+def write_csv_report(results, report_path):
+    """
+    Write the errors of a check as a CSV report, one row per error (and per file that could not be checked).
+
+    Args:
+    results (list): The results returned by get_result.
+    report_path (str): The path of the report.
+
+    Returns:
+    None
+    """
+    with open(report_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file", "line", "column", "message"])
+        for result in results:
+            if result["failure"] is not None:
+                writer.writerow([result["path"], "", "", result["failure"]])
+            for error in result["errors"]:
+                fields = get_error_fields(error)
+                writer.writerow([fields["file"] or result["path"], fields["line"] or "", fields["column"] or "", fields["message"]])
+
+def get_key_result(index, csv_path, options, unindexed=()):
+    """
+    Check the keys of all the checked files in their index, as a result of its own after those of the files.
+
+    Args:
+    index (KeyIndex): The index of the key values of the files.
+    csv_path (str): The checked CSV file or directory.
+    options (dict): The values of the options of the check.
+    unindexed (list): The files that could not be checked, whose keys are not in the index.
+
+    Returns:
+    tuple: The header of the result in the output and the result returned by get_result.
+    """
+    start = time.perf_counter()
+    errorlist = index.get_errors(options["max_errors"])
+    values = index.db.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+    header = "\n\nKeys across files ({} value(s) indexed, {:.2f} s).\n\n".format(values, time.perf_counter() - start)
+    if unindexed:
+        header += "Incomplete, the keys of {} file(s) that could not be checked are not indexed: {}.\n".format(len(unindexed), ", ".join(unindexed))
+    undeclared = index.get_undeclared()
+    if undeclared:
+        header += "Not checked, referenced keys declared as unique_key in no FMT file: {}.\n".format(", ".join(undeclared))
+    return header, get_result("Keys across files", csv_path, errorlist, values, time.perf_counter() - start)
+
+def check_csv(csv_path, fmt_path, options):
+    # Yield the output file by file: ("start", number of files), then ("file", index, number of files, rows, header,
+    # result) with the result returned by get_result (formatted by show_result), with ("rows", rows read) while a single
+    # file is checked and ("text", output) for the rest. With a routing table (options["routes"]), each file is checked
+    # against the FMT file of its route, fmt_path being the default one ("" for none). With options["check_keys"], the
+    # keys declared in the FMT files are checked across all the files after them, as a last ("file", ...) message.
+
+    # Raise errors
+    if not os.path.exists(split_archive_member(csv_path)[0]) or csv_path == "":
+        yield ("text", "The specified CSV file does not exist: {}".format(csv_path))
+        return
+    if not options["routes"] and fmt_path == "" or fmt_path != "" and not os.path.exists(fmt_path):
+        yield ("text", "The format file does not exist: {}".format(fmt_path))
+        return
+    if options["routes"] and not os.path.exists(options["routes"]):
+        yield ("text", "The routing table does not exist: {}".format(options["routes"]))
+        return
+    routes = read_routes(options["routes"]) if options["routes"] else []
+
+    # Check if it is a directory, an archive of several files or a file
+    patterns = [pattern for pattern in re.split(r"[;,\s]+", options["file_filter"]) if pattern]
+    files = None
+    if os.path.isdir(csv_path):
+        folder, files = csv_path, list_csv_files(csv_path, patterns, options["recursive"])
+    elif is_zip(csv_path):
+        folder, files = os.path.dirname(csv_path), list_archive_members(csv_path, os.path.basename(csv_path), patterns)
+        if len(files) == 1:
+            csv_path, files = os.path.join(folder, files[0]), None
+    if files is not None and routes:
+        # The routing table is not one of the files to check
+        files = [file for file in files if os.path.abspath(os.path.join(folder, file)) != os.path.abspath(options["routes"])]
+
+    # Get format specifications as a list of ChkCsv objects from each FMT file (or from the cache), once for all the
+    # files routed to it
+    file_routes = [get_route(file, routes, fmt_path, options["optsection"]) for file in files or [os.path.basename(csv_path)]]
+    specs = {}
+    for route in file_routes:
+        if route is None or route in specs:
+            continue
+        route_options = dict(options, optsection=route[1])
+        start = time.perf_counter()
+        cols, cached = get_format_specs(route[0], route_options)
+        name = "Format specifications" if not routes else "Format specifications '{}' [{}]".format(route[0], route[1])
+        if cached:
+            yield ("text", "{}: cache hit.\n".format(name))
+        else:
+            yield ("text", "{}: cache miss, parsed in {:.1f} ms.\n".format(name, 1000 * (time.perf_counter() - start)))
+        specs[route] = (cols, route_options, get_check_key(route[0], route_options), read_key_specs(route[0], route[1]))
+    no_route = "No route of the routing table matches the file and there is no default FMT file"
+
+    # Get the files found without errors by the previous checks, all the files are read to index their keys
+    ledger = load_ledger() if options["use_ledger"] else {}
+    loaded = dict(ledger)
+    index_keys = options["check_keys"] and not options["sample_rows"]
+    reuse = ledger if not index_keys else {}
+
+    if files is None:
+        yield ("start", 1)
+        route = file_routes[0]
+        if route is None:
+            yield ("file", 1, 1, 0, "", get_result(os.path.basename(csv_path), csv_path, failure=no_route))
+            return
+        cols, route_options, check_key, key_specs = specs[route]
+        yield ("text", show_csv_format(*get_csv_format(csv_path, options["encoding"])))
+        if is_clean_in_ledger(reuse, csv_path, check_key):
+            date = ledger[os.path.abspath(csv_path)]["date"]
+            yield ("file", 1, 1, 0, "", get_result(os.path.basename(csv_path), csv_path, cached=date, fmt=route[0]))
+        elif options["sample_rows"]:
+            errorlist, rows, elapsed, sample = validate_file(csv_path, cols, route_options)
+            yield ("file", 1, 1, rows, "", get_result(os.path.basename(csv_path), csv_path, errorlist, rows, elapsed, sample=sample, fmt=route[0]))
+        else:
+            # Check the file in this thread, chunk by chunk, to show the progress and stop it when cancelled
+            start = time.perf_counter()
+            errorlist = []
+            rows = 0
+            index = KeyIndex() if index_keys else None
+            run_path = index.get_run_path() if index is not None else None
+            try:
+                with KeyRun(run_path, key_specs) if index is not None else contextlib.nullcontext() as key_run:
+                    for rows, errors in stream_csv_errors(csv_path, cols, route_options, options["max_errors"], key_run):
+                        errorlist.extend(errors)
+                        yield ("rows", rows)
+                record_result(ledger, csv_path, check_key, errorlist, options)
+                result = get_result(os.path.basename(csv_path), csv_path, errorlist, rows, time.perf_counter() - start, fmt=route[0])
+                if options["use_ledger"]:
+                    save_ledger(ledger, loaded)
+                yield ("file", 1, 1, rows, "", result)
+                if index is not None:
+                    index.add_run(csv_path, run_path, key_specs)
+                    yield ("file", 1, 1, 0) + get_key_result(index, csv_path, options)
+            finally:
+                if index is not None:
+                    index.close()
+
+    else:
+        yield ("start", len(files))
+        # Check the new and changed files of all the routes in parallel, each process parses the format specifications
+        # of a FMT file once and keeps them
+        index = KeyIndex() if index_keys else None
+        run_paths = [index.get_run_path() if index is not None else None for file in files]
+        jobs = [
+            None if route is None or is_clean_in_ledger(reuse, os.path.join(folder, file), specs[route][2])
+            else (os.path.join(folder, file), route[0], specs[route][1], run_path)
+            for file, route, run_path in zip(files, file_routes, run_paths)
+        ]
+        futures = [None if job is None else submit_to_pool(validate_file_in_worker, *job) for job in jobs]
+        parsed = 0
+        unindexed = []
+        try:
+            # Report the results in the order of the files, whatever the order in which they are done
+            for i, (file, route, future, run_path) in enumerate(zip(files, file_routes, futures, run_paths)):
+                path = os.path.join(folder, file)
+                if route is None:
+                    header = f"\n\nFile '{file}' ({i+1}/{len(files)}, no route).\n\n"
+                    yield ("file", i + 1, len(files), 0, header, get_result(file, path, failure=no_route))
+                    continue
+                if future is None:
+                    date = ledger[os.path.abspath(path)]["date"]
+                    header = f"\n\nFile '{file}' ({i+1}/{len(files)}, cached).\n\n"
+                    yield ("file", i + 1, len(files), 0, header, get_result(file, path, cached=date, fmt=route[0]))
+                    continue
+                try:
+                    try:
+                        outcome = future.result()
+                    except BrokenProcessPool:
+                        # A process of the pool died: the file is checked again alone in a new pool, then the files
+                        # not done yet are submitted again, so that only the file killing the pool alone fails
+                        reset_pool()
+                        wait([other for other in futures[i + 1:] if other is not None])
+                        try:
+                            outcome = submit_to_pool(validate_file_in_worker, *jobs[i]).result()
+                        finally:
+                            for j in range(i + 1, len(futures)):
+                                if futures[j] is not None and not futures[j].cancelled() and isinstance(futures[j].exception(), BrokenProcessPool):
+                                    futures[j] = submit_to_pool(validate_file_in_worker, *jobs[j])
+                    errorlist, rows, elapsed, sample, cached = outcome
+                    parsed += not cached
+                    record_result(ledger, path, specs[route][2], errorlist, options)
+                    result = get_result(file, path, errorlist, rows, elapsed, sample=sample, fmt=route[0])
+                except BrokenProcessPool:
+                    # The file killed a new pool alone, the next files get another one
+                    reset_pool()
+                    rows, elapsed = 0, 0
+                    failure = "The process checking the file stopped unexpectedly (out of memory or crash)"
+                    result = get_result(file, path, failure=failure, fmt=route[0])
+                except Exception as e:
+                    rows, elapsed = 0, 0
+                    failure = e.errmsg if isinstance(e, ChkCsvError) else str(e)
+                    result = get_result(file, path, failure=failure, fmt=route[0])
+                # The run file of a file that could not be checked is missing or cut short
+                if index is not None and result["failure"] is None:
+                    index.add_run(path, run_path, specs[route][3])
+                elif index is not None:
+                    unindexed.append(file)
+                fmt_name = f", {os.path.basename(route[0])}" if routes else ""
+                header = f"\n\nFile '{file}' ({i+1}/{len(files)}, {elapsed:.2f} s{fmt_name}).\n\n"
+                yield ("file", i + 1, len(files), rows, header, result)
+            # Check the keys once all the files are indexed
+            if index is not None:
+                yield ("file", len(files), len(files), 0) + get_key_result(index, csv_path, options, unindexed)
+        finally:
+            # Do not start the remaining files when the check is cancelled
+            for future in futures:
+                if future is not None:
+                    future.cancel()
+            if options["use_ledger"]:
+                save_ledger(ledger, loaded)
+            if index is not None:
+                index.close()
+        checked = sum(future is not None for future in futures)
+        routed = sum(route is not None for route in file_routes)
+        yield ("text", "\n\n{} file(s) checked, {} file(s) unchanged since found without errors (cached).".format(checked, routed - checked))
+        if routed < len(files):
+            yield ("text", "\n\n{} file(s) without route to a FMT file.".format(len(files) - routed))
+        yield ("text", "\n\nFormat specifications parsed by {} process(es), cache hit for the other {} file(s).".format(parsed, checked - parsed))
+        yield ("text", "\n\nDone.\n\n")
@@ -26,10 +26,11 @@ def import_or_install(package):
 for lib in ["os", "tkinter", "chkcsv"]:
     import_or_install(lib)
 
-import os, tkinter as tk, chkcsv
+import multiprocessing, queue, threading, time, tkinter as tk, chkcsv
 
-from tkinter import filedialog, scrolledtext
-from chkcsv import ChkCsvError, FORMATSPECS, read_format_specs, check_csv_file, clparser
+from tkinter import filedialog, scrolledtext, ttk
+from chkcsv import ChkCsvError, FORMATSPECS, clparser
+from core import ENCODINGS, ResultView, check_csv
 
 #####################################################################################################
 
@@ -64,8 +65,15 @@ class EXE:
             "position": tk.BooleanVar(value=False), #default false
             "caseinsensitive": tk.BooleanVar(value=False), #default false
             "haltonerror": tk.BooleanVar(value=False), #default false
+            "recursive": tk.BooleanVar(value=False), #default false
+            "use_ledger": tk.BooleanVar(value=True), #default true
+            "file_filter": tk.StringVar(value="*.csv"), #default csv files only
+            "max_errors": tk.StringVar(value="1000"), #default 1000 errors per file
+            "engine": tk.StringVar(value="row"), #default chkcsv row by row
+            "sample_rows": tk.StringVar(value="0"), #default full check
+            "check_keys": tk.BooleanVar(value=False), #default false
             "optsection": "chkcsvoptions", # TODO: Provide input text field
-            "encoding": "utf-8" # TODO: Provide dropdown list 
+            "encoding": tk.StringVar(value="auto") #default detected per file
         }
 
         options_menu.add_checkbutton(label="Data required", variable=self.opts["data_required"], onvalue=True, offvalue=False)
@@ -75,6 +83,15 @@ class EXE:
         options_menu.add_checkbutton(label="Check position", variable=self.opts["position"], onvalue=True, offvalue=False)
         options_menu.add_checkbutton(label="Case insensitive", variable=self.opts["caseinsensitive"], onvalue=True, offvalue=False)
         options_menu.add_checkbutton(label="Exit on first error", variable=self.opts["haltonerror"], onvalue=True, offvalue=False)
+        options_menu.add_checkbutton(label="Include subdirectories", variable=self.opts["recursive"], onvalue=True, offvalue=False)
+        options_menu.add_checkbutton(label="Skip files unchanged since found without errors", variable=self.opts["use_ledger"], onvalue=True, offvalue=False)
+        options_menu.add_checkbutton(label="Check keys across files", variable=self.opts["check_keys"], onvalue=True, offvalue=False)
+
+        # Create engine submenu
+        engine_menu = tk.Menu(options_menu, bg='azure')
+        options_menu.add_cascade(label="Engine", menu=engine_menu)
+        engine_menu.add_radiobutton(label="Row by row (chkcsv)", variable=self.opts["engine"], value="row")
+        engine_menu.add_radiobutton(label="Vectorised (pandas)", variable=self.opts["engine"], value="vectorised")
 
         # Create a frame to hold the path widgets
         input_frame = tk.Frame(root, bg='alice blue')
@@ -83,9 +100,14 @@ class EXE:
         # Set dialog options
         csvfile_opts = {
             'defaultextension':'.csv',
-            'filetypes':[('Tabular files', '.csv')]      
+            'filetypes':[('Tabular files', '.csv'), ('Compressed files', '.gz .bz2 .xz .zip')]      
         } 
 
+        routesfile_opts = {
+            'defaultextension':'.csv',
+            'filetypes':[('Tabular files', '.csv')]
+        }
+
         fmtfile_opts = {
             'defaultextension':'.fmt',
             'filetypes':[('Text files', '.fmt')]      
@@ -94,7 +116,8 @@ class EXE:
         # Create the path variables
         self.paths = {
             "csv_path": tk.Entry(input_frame, width=80),
-            "fmt_path": tk.Entry(input_frame, width=80)
+            "fmt_path": tk.Entry(input_frame, width=80),
+            "routes": tk.Entry(input_frame, width=80)
         }
 
         # Create the widgets for the paths
@@ -105,6 +128,22 @@ class EXE:
         fmtfile_label = tk.Label(input_frame, text="FMT Path:", bg='alice blue')
         fmtfile_button = tk.Button(input_frame, text="📃 Select file 📃", command=lambda: self.clearandinsert("fmt_path", filedialog.askopenfilename(**fmtfile_opts)), bg='azure')
 
+        routes_label = tk.Label(input_frame, text="Routes (optional):", bg='alice blue')
+        routes_button = tk.Button(input_frame, text="📃 Select file 📃", command=lambda: self.clearandinsert("routes", filedialog.askopenfilename(**routesfile_opts)), bg='azure')
+
+        filter_label = tk.Label(input_frame, text="File filter:", bg='alice blue')
+        filter_entry = tk.Entry(input_frame, textvariable=self.opts["file_filter"], width=80)
+
+        max_errors_label = tk.Label(input_frame, text="Max errors per file:", bg='alice blue')
+        max_errors_entry = tk.Entry(input_frame, textvariable=self.opts["max_errors"], width=80)
+
+        sample_label = tk.Label(input_frame, text="Sample rows per file (0: full check):", bg='alice blue')
+        sample_entry = tk.Entry(input_frame, textvariable=self.opts["sample_rows"], width=80)
+        full_button = tk.Button(input_frame, text="🔍 Full check 🔍", command=self.fullcheck, bg='azure')
+
+        encoding_label = tk.Label(input_frame, text="Encoding:", bg='alice blue')
+        encoding_combo = ttk.Combobox(input_frame, textvariable=self.opts["encoding"], values=ENCODINGS, width=77)
+
         # Place the path widgets
         csvfile_label.grid(row=0, column=0, padx=5, pady=5, sticky='W')
         self.paths["csv_path"].grid(row=0, column=1, padx=5, pady=5)
@@ -115,16 +154,89 @@ class EXE:
         self.paths["fmt_path"].grid(row=1, column=1, padx=5, pady=5)
         fmtfile_button.grid(row=1, column=2, padx=5, pady=5)
 
-        # Creating scrolled text for results
+        routes_label.grid(row=2, column=0, padx=5, pady=5, sticky='W')
+        self.paths["routes"].grid(row=2, column=1, padx=5, pady=5)
+        routes_button.grid(row=2, column=2, padx=5, pady=5)
+
+        filter_label.grid(row=3, column=0, padx=5, pady=5, sticky='W')
+        filter_entry.grid(row=3, column=1, padx=5, pady=5)
+
+        max_errors_label.grid(row=4, column=0, padx=5, pady=5, sticky='W')
+        max_errors_entry.grid(row=4, column=1, padx=5, pady=5)
+
+        sample_label.grid(row=5, column=0, padx=5, pady=5, sticky='W')
+        sample_entry.grid(row=5, column=1, padx=5, pady=5)
+        full_button.grid(row=5, column=2, padx=5, pady=5)
+
+        encoding_label.grid(row=6, column=0, padx=5, pady=5, sticky='W')
+        encoding_combo.grid(row=6, column=1, padx=5, pady=5)
+
+        # Creating tabs for results: scrolled text for the output, a tree of the errors grouped by file, column and
+        # message, and a table of the errors shown page by page
         self.results_frame = tk.Frame(root, bg='alice blue')
         self.results_frame.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
 
-        self.text_area = scrolledtext.ScrolledText(self.results_frame, wrap=tk.WORD, width=40, height=20)
-        self.text_area.pack(side='top', fill=tk.BOTH, expand=True)
-
-        # Create a button to
-        run_button = tk.Button(self.results_frame, text="🔎 Check CSV 🔎", command=self.execute, bg='azure')
-        run_button.pack(side='bottom', pady=20, ipadx=5, ipady=5)
+        notebook = ttk.Notebook(self.results_frame)
+        notebook.pack(side='top', fill=tk.BOTH, expand=True)
+
+        self.text_area = scrolledtext.ScrolledText(notebook, wrap=tk.WORD, width=40, height=20)
+        notebook.add(self.text_area, text="Output")
+
+        summary_frame = tk.Frame(notebook, bg='alice blue')
+        notebook.add(summary_frame, text="Summary")
+        self.summary_tree = ttk.Treeview(summary_frame, columns=("column", "message", "count"))
+        self.summary_tree.heading("#0", text="File")
+        self.summary_tree.heading("column", text="Column")
+        self.summary_tree.heading("message", text="Error")
+        self.summary_tree.heading("count", text="Count")
+        summary_scroll = ttk.Scrollbar(summary_frame, orient="vertical", command=self.summary_tree.yview)
+        self.summary_tree.configure(yscrollcommand=summary_scroll.set)
+        summary_scroll.pack(side='right', fill=tk.Y)
+        self.summary_tree.pack(side='left', fill=tk.BOTH, expand=True)
+
+        errors_frame = tk.Frame(notebook, bg='alice blue')
+        notebook.add(errors_frame, text="Errors")
+        pages_frame = tk.Frame(errors_frame, bg='alice blue')
+        pages_frame.pack(side='bottom', fill=tk.X)
+        self.errors_tree = ttk.Treeview(errors_frame, columns=("file", "line", "column", "message"), show="headings")
+        for column, heading in zip(("file", "line", "column", "message"), ("File", "Line", "Column", "Error")):
+            self.errors_tree.heading(column, text=heading)
+        errors_scroll = ttk.Scrollbar(errors_frame, orient="vertical", command=self.errors_tree.yview)
+        self.errors_tree.configure(yscrollcommand=errors_scroll.set)
+        errors_scroll.pack(side='right', fill=tk.Y)
+        self.errors_tree.pack(side='left', fill=tk.BOTH, expand=True)
+
+        previous_button = tk.Button(pages_frame, text="◀ Previous", command=lambda: self.showpage(self.view.page - 1), bg='azure')
+        previous_button.pack(side='left', padx=5, pady=5)
+        self.page_text = tk.StringVar(value="")
+        page_label = tk.Label(pages_frame, textvariable=self.page_text, bg='alice blue')
+        page_label.pack(side='left', expand=True)
+        next_button = tk.Button(pages_frame, text="Next ▶", command=lambda: self.showpage(self.view.page + 1), bg='azure')
+        next_button.pack(side='right', padx=5, pady=5)
+
+        # Errors of the current check and their summary
+        self.view = ResultView()
+
+        # Create the progress bar, the status line and the buttons to run and cancel the check
+        controls_frame = tk.Frame(self.results_frame, bg='alice blue')
+        controls_frame.pack(side='bottom', fill=tk.X, pady=10)
+
+        self.progress_bar = ttk.Progressbar(controls_frame, mode="determinate")
+        self.progress_bar.pack(side='top', fill=tk.X, padx=5, pady=5)
+        self.status = tk.StringVar(value="")
+        status_label = tk.Label(controls_frame, textvariable=self.status, bg='alice blue')
+        status_label.pack(side='top', padx=5, pady=5)
+
+        self.run_button = tk.Button(controls_frame, text="🔎 Check CSV 🔎", command=self.execute, bg='azure')
+        self.run_button.pack(side='left', expand=True, pady=10, ipadx=5, ipady=5)
+        self.cancel_button = tk.Button(controls_frame, text="✖ Cancel ✖", command=self.cancel, bg='azure', state="disabled")
+        self.cancel_button.pack(side='left', expand=True, pady=10, ipadx=5, ipady=5)
+
+        # Messages sent by the validation thread and read by 'poll' in the Tk thread
+        self.messages = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.running = False
+        self.progress_text = ""
 
     def on_configure(self, event):
             self.results_frame.config(width=event.width, height=event.height)
@@ -162,77 +274,146 @@ class EXE:
         vers_label = tk.Label(vers_window, text=about_msg, justify="center", wraplength=500, bg='alice blue')
         vers_label.pack()
 
-    def showerrors(self, errorlist):
-        error_str = ""
-        error_parts = []
-        # Loop over errors
-        for err in errorlist:
-            error_parts = [e for e in zip(("Error:", "in file", "in line", "in column"), err) if e[1]]
-            error_strings = [f"{part[0]} {part[1]}" for part in error_parts]
-            error_message = " ".join(error_strings)
-            error_str += f"{error_message}.\n"
-        return error_str
+    def showpage(self, page):
+        # Show only one page of errors in the table, formatted when shown
+        self.errors_tree.delete(*self.errors_tree.get_children())
+        for values in self.view.get_page_rows(page):
+            self.errors_tree.insert("", "end", values=values)
+        self.showpagetext()
+
+    def showpagetext(self):
+        self.page_text.set(self.view.get_page_text())
+
+    def showsummary(self):
+        # Show the largest groups of errors, with the lines of their first errors as children
+        self.summary_tree.delete(*self.summary_tree.get_children())
+        for (file, column, message, count), children in self.view.get_summary_rows():
+            group = self.summary_tree.insert("", "end", text=file, values=(column, message, count))
+            for child in children:
+                self.summary_tree.insert(group, "end", text="", values=child + ("",))
+
+    def get_options(self):
+        # Read the Tk variables in the Tk thread, the validation thread only gets plain values
+        options = {name: var.get() if isinstance(var, tk.Variable) else var for name, var in self.opts.items()}
+        if not options["optsection"]:
+            options["optsection"] = "chkcsvoptions"
+        options["routes"] = self.paths["routes"].get()
+        # No limit of errors if the field is empty or 0
+        try:
+            options["max_errors"] = max(int(options["max_errors"] or 0), 0)
+        except ValueError:
+            options["max_errors"] = 1000
+        # Full check if the field is empty, 0 or invalid
+        try:
+            options["sample_rows"] = max(int(options["sample_rows"] or 0), 0)
+        except ValueError:
+            options["sample_rows"] = 0
+        return options
 
     def execute(self):
-        output = self.check_csv()
-        # Run script with the input values
-        #try:
-        #    output = self.check_csv()
-        #except:
-        #    output = "Error"
-
-        # Empty text area
+        if self.running:
+            return
+        # Empty text area and tables of errors
         self.text_area.delete("1.0", "end")
-        # Display the output in a label widget
-        self.text_area.insert(tk.INSERT, output)
-
-    def check_csv(self):
-        # Get files
-        csv_path = self.paths["csv_path"].get()
-        fmt_path = self.paths["fmt_path"].get()
-
-        # Raise errors
-        if not os.path.exists(csv_path) or csv_path == "":
-            output = "The specified CSV file does not exist: {}".format(csv_path)
-        if not os.path.exists(fmt_path) or fmt_path == "":
-            output = "The format file does not exist: {}".format(fmt_path)
-
-        # Get format specifications as a list of ChkCsv objects from the configuration file.
-        if self.opts["optsection"]:
-            chkopts = self.opts["optsection"]
-        else:
-            chkopts = "chkcsvoptions"
-        cols = read_format_specs(fmt_path, self.opts["column_required"].get(), self.opts["data_required"].get(), chkopts)
-
-        # Check if it is a directory or a file 
-        if os.path.isfile(csv_path):
-            # Check the file
-            errorlist = check_csv_file(csv_path, cols, self.opts["haltonerror"].get(), self.opts["columnexit"].get(), self.opts["linelength"].get(), self.opts["caseinsensitive"].get(), self.opts["encoding"], self.opts["position"].get())
-            # Get error list
-            if len(errorlist) > 0:
-                output = self.showerrors(errorlist)
-            else:
-                output = "No errors found."
-
-        if os.path.isdir(csv_path):
-            output = ""
-            for i, file in enumerate(os.listdir(csv_path)):
-                output += f"\n\nFile '{file}' ({i+1}/{len(os.listdir(csv_path))}).\n\n"
-                # Check the file
-                file_path = csv_path + "/" + file
-                errorlist = check_csv_file(file_path, cols, self.opts["haltonerror"].get(), self.opts["columnexit"].get(), self.opts["linelength"].get(), self.opts["caseinsensitive"].get(), self.opts["encoding"], self.opts["position"].get())
-                # Get error list
-                if len(errorlist) > 0:
-                    output += self.showerrors(errorlist)
+        self.view = ResultView()
+        self.showpage(0)
+        self.showsummary()
+        self.status.set("")
+        self.cancel_event.clear()
+        self.running = True
+        self.run_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        # Run the check with the input values in the background
+        self.options = self.get_options()
+        worker = threading.Thread(
+            target=self.run_check,
+            args=(self.paths["csv_path"].get(), self.paths["fmt_path"].get(), self.options),
+            daemon=True
+        )
+        worker.start()
+        root.after(100, self.poll)
+
+    def fullcheck(self):
+        # Check again every row after a sampled check
+        if self.running:
+            return
+        self.opts["sample_rows"].set("0")
+        self.execute()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.status.set("Cancelling...")
+
+    def run_check(self, csv_path, fmt_path, options):
+        checks = check_csv(csv_path, fmt_path, options)
+        try:
+            for message in checks:
+                self.messages.put(message)
+                if self.cancel_event.is_set():
+                    self.messages.put(("text", "\n\nCancelled.\n\n"))
+                    break
+        except Exception as e:
+            self.messages.put(("text", "\n\nError: {}\n\n".format(e.errmsg if isinstance(e, ChkCsvError) else e)))
+        finally:
+            # Stop the remaining checks before reporting the end
+            checks.close()
+        self.messages.put(("end",))
+
+    def poll(self):
+        # Display the output of the validation thread as it arrives
+        errors = len(self.view.errors)
+        while not self.messages.empty():
+            message = self.messages.get()
+            if message[0] == "start":
+                _, files = message
+                self.start_time = time.time()
+                self.rows = 0
+                self.progress_text = "0/{} files".format(files)
+                if files == 1:
+                    self.progress_bar.config(mode="indeterminate")
+                    self.progress_bar.start()
                 else:
-                    output += "No errors found."
-            output += "\n\nDone.\n\n"
-        
-        return output
+                    self.progress_bar.config(mode="determinate", maximum=files, value=0)
+            elif message[0] == "rows":
+                # Rows read so far in the file being checked
+                elapsed = max(time.time() - self.start_time, 1e-6)
+                self.status.set("{} rows, {:.0f} rows/sec".format(self.rows + message[1], (self.rows + message[1]) / elapsed))
+            elif message[0] == "file":
+                _, i, files, rows, header, result = message
+                self.rows += rows
+                elapsed = max(time.time() - self.start_time, 1e-6)
+                self.progress_bar.config(value=i)
+                self.progress_text = "{}/{} files, {} rows, {:.0f} rows/sec".format(i, files, self.rows, self.rows / elapsed)
+                self.status.set(self.progress_text)
+                self.text_area.insert("end", self.view.add(header, result, self.options))
+                self.text_area.see("end")
+            elif message[0] == "text":
+                self.text_area.insert("end", message[1])
+                self.text_area.see("end")
+            elif message[0] == "end":
+                self.running = False
+                self.progress_bar.stop()
+                self.progress_bar.config(mode="determinate")
+                self.run_button.config(state="normal")
+                self.cancel_button.config(state="disabled")
+                if self.cancel_event.is_set():
+                    self.status.set("Cancelled after " + self.progress_text)
+        # Update the tables of errors with the new ones
+        if len(self.view.errors) > errors:
+            self.showsummary()
+            # The page shown is only filled again if it was not full
+            if not self.view.is_page_full(errors):
+                self.showpage(self.view.page)
+            else:
+                self.showpagetext()
+        if self.running:
+            root.after(100, self.poll)
 
 #####################################################################################################
 
 if __name__ == "__main__":
+    # Needed by the process pool in the executable compiled with PyInstaller
+    multiprocessing.freeze_support()
     root = tk.Tk()
     root.configure(bg='alice blue')
     exe = EXE(root)
@@ -0,0 +1,348 @@
+"""
+This Python script watches a drop folder and checks each CSV file as soon as it lands there, with the same options
+and checks as the command line ('cli.py'), so that nobody has to open the interface and press "Check CSV".
+
+The folder is scanned every --interval seconds (and at once on any change if the 'watchdog' package is installed). A
+new or changed file is only checked once its size and modification time have not changed for --settle seconds, so
+that the files still being written or copied are not checked half way. The files are checked in the pool of processes
+of the interface, the result of each file is written next to it ("file.csv.chkcsv.json", as the JSON report of the
+command line) and a rolling summary of the last results is kept in the folder ("chkcsv_summary.json").
+
+The results written next to the files tell which files were already checked when the script is started again: a file
+is only checked again if it changed after its result was written.
+
+Usage: python watch.py FOLDER [-f FMT_PATH] [--routes ROUTES] [options] [--interval S] [--settle S] [--once]
+
+Author: Jose Javier Saiz (josejavier.saizanton@acer.europa.eu, josejavier.saiz.anton@gmail.com)
+"""
+
+import argparse, collections, json, multiprocessing, os, re, sys, threading, time
+
+from concurrent.futures.process import BrokenProcessPool
+from chkcsv import ChkCsvError
+from cli import add_check_arguments, get_options
+from core import (
+    ARCHIVE_SEPARATOR, get_format_specs, get_result, get_route, list_csv_files, read_routes, reset_pool, show_result,
+    split_archive_member, submit_to_pool, validate_file_in_worker, write_json_report
+)
+
+# Name of the result written next to each file and of the rolling summary of the folder
+RESULT_SUFFIX = ".chkcsv.json"
+SUMMARY_NAME = "chkcsv_summary.json"
+
+# Number of results kept in the rolling summary
+RECENT_RESULTS = 100
+
+#####################################################################################################
+
+def get_result_path(path):
+    # The result of a file of a ZIP archive is written next to the archive
+    archive_path, member = split_archive_member(path)
+    if member is None:
+        return path + RESULT_SUFFIX
+    return archive_path + ARCHIVE_SEPARATOR + member.replace("/", "_") + RESULT_SUFFIX
+
+def log(message):
+    print("{} {}".format(time.strftime("%Y-%m-%d %H:%M:%S"), message), file=sys.stderr, flush=True)
+
+def get_state(path):
+    # Size and modification time of a file (of its archive for a file of a ZIP archive), None if it is gone
+    try:
+        stat = os.stat(split_archive_member(path)[0])
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def start_notifier(folder, recursive, changed):
+    """
+    Wake the watcher up as soon as something changes in the folder, with the 'watchdog' package (inotify on Linux)
+    if it is installed.
+
+    Args:
+    folder (str): The watched folder.
+    recursive (bool): Whether to watch the subfolders.
+    changed (threading.Event): The event set on each change.
+
+    Returns:
+    object: The running observer, None if 'watchdog' is not installed (the folder is then only scanned periodically).
+    """
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            changed.set()
+
+    observer = Observer()
+    observer.schedule(Handler(), folder, recursive=recursive)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+class FolderWatcher():
+    """
+    Check the files landing in a folder once they are complete, and keep their results.
+
+    Args:
+    folder (str): The watched folder.
+    fmt_path (str): The FMT file (the default one with a routing table, "" for none).
+    options (dict): The values of the options of the check.
+    settle (float): The seconds during which a file must not change before it is checked.
+    summary_path (str): The path of the rolling summary.
+    """
+    def __init__(self, folder, fmt_path, options, settle, summary_path):
+        self.folder = folder
+        self.fmt_path = fmt_path
+        self.options = options
+        self.settle = settle
+        self.summary_path = summary_path
+        self.routes = read_routes(options["routes"]) if options["routes"] else []
+        self.patterns = [pattern for pattern in re.split(r"[;,\s]+", options["file_filter"]) if pattern]
+        # Files waiting to settle (state and time since which it has not changed), checked (state when checked) and
+        # being checked (future of the check, file, state and time since which it had not changed)
+        self.pending = {}
+        self.checked = {}
+        self.running = {}
+        # Files being checked when a process of the pool died, checked again alone to find the one killing it
+        self.crashes = {}
+        self.summary = {
+            "folder": os.path.abspath(folder),
+            "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "updated": None,
+            "files_checked": 0,
+            "files_with_errors": 0,
+            "files_failed": 0,
+            "errors": 0,
+            "rows": 0,
+            "recent": collections.deque(maxlen=RECENT_RESULTS)
+        }
+
+    def scan(self, now):
+        """
+        List the files of the folder and find those settled since they changed.
+
+        Args:
+        now (float): The current time (time.monotonic).
+
+        Returns:
+        list: The files to check, relative to the folder, with their state and the time since which they have not changed.
+        """
+        settled = []
+        # The results and the summary are not checked, even without file filter
+        ignored = {os.path.abspath(self.summary_path), os.path.abspath(self.summary_path) + ".tmp"}
+        files = {
+            file for file in list_csv_files(self.folder, self.patterns, self.options["recursive"])
+            if not file.endswith((RESULT_SUFFIX, RESULT_SUFFIX + ".tmp")) and os.path.abspath(os.path.join(self.folder, file)) not in ignored
+        }
+        # Forget the files that are gone
+        for known in [self.pending, self.checked, self.crashes]:
+            for file in [file for file in known if file not in files]:
+                del known[file]
+        busy = {file for file, state, landed in self.running.values()}
+        for file in files:
+            path = os.path.join(self.folder, file)
+            state = get_state(path)
+            if state is None or file in busy or self.checked.get(file) == state:
+                continue
+            if file not in self.checked and self.is_done(path, state):
+                self.checked[file] = state
+                continue
+            if file not in self.pending or self.pending[file][0] != state:
+                self.pending[file] = (state, now)
+            elif now - self.pending[file][1] >= self.settle:
+                settled.append((file, state, self.pending.pop(file)[1]))
+        return settled
+
+    def is_done(self, path, state):
+        # Result written after the last change of the file, by a previous run of the script
+        try:
+            return os.stat(get_result_path(path)).st_mtime_ns >= state[1]
+        except OSError:
+            return False
+
+    def submit(self, file, state, landed):
+        path = os.path.join(self.folder, file)
+        route = get_route(file, self.routes, self.fmt_path, self.options["optsection"])
+        if route is None:
+            result = get_result(file, path, failure="No route of the routing table matches the file and there is no default FMT file")
+            self.checked[file] = state
+            return self.record(result, route, landed)
+        # A file that was being checked when a process died is checked alone, and the others wait for it
+        suspect = any(self.crashes.get(running_file) for running_file, running_state, running_landed in self.running.values())
+        if self.running and (self.crashes.get(file) or suspect):
+            self.pending[file] = (state, landed)
+            return None
+        options = dict(self.options, optsection=route[1])
+        try:
+            future = submit_to_pool(validate_file_in_worker, path, route[0], options)
+        except BrokenProcessPool:
+            # Checked at the next scan, in a new pool
+            reset_pool()
+            self.pending[file] = (state, landed)
+            log("{}: the pool of processes is broken, the file will be checked again.".format(file))
+            return None
+        self.running[future] = (file, state, landed)
+        return None
+
+    def collect(self):
+        """
+        Record the results of the files checked since the previous call.
+
+        Yields:
+        dict: The result of each file, returned by get_result.
+        """
+        for future in [future for future in self.running if future.done()]:
+            file, state, landed = self.running.pop(future)
+            path = os.path.join(self.folder, file)
+            route = get_route(file, self.routes, self.fmt_path, self.options["optsection"])
+            try:
+                errorlist, rows, elapsed, sample, cached = future.result()
+                result = get_result(file, path, errorlist, rows, elapsed, sample=sample, fmt=route[0])
+            except BrokenProcessPool:
+                # A process of the pool died: the files being checked are checked again alone in a new pool, and the
+                # file killing it alone is reported as a failure
+                reset_pool()
+                if not self.crashes.get(file):
+                    self.crashes[file] = 1
+                    self.pending[file] = (state, landed)
+                    log("{}: a process stopped unexpectedly while the file was checked, the file will be checked again alone.".format(file))
+                    continue
+                del self.crashes[file]
+                result = get_result(file, path, failure="The process checking the file stopped unexpectedly (out of memory or crash)", fmt=route[0])
+            except Exception as e:
+                result = get_result(file, path, failure=e.errmsg if isinstance(e, ChkCsvError) else str(e), fmt=route[0])
+            self.checked[file] = state
+            self.crashes.pop(file, None)
+            yield self.record(result, route, landed)
+
+    def record(self, result, route, landed):
+        # Write the result next to the file, then the rolling summary, each under a temporary name first. A folder
+        # that cannot be written (read-only, full, file removed) is logged without stopping the watcher
+        result_path = get_result_path(result["path"])
+        try:
+            write_json_report([result], result_path + ".tmp", result["path"], route[0] if route else "", self.options)
+            os.replace(result_path + ".tmp", result_path)
+        except OSError as e:
+            log("{}: the result cannot be written: {}".format(result["file"], e))
+        summary = self.summary
+        summary["updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        summary["files_checked"] += 1
+        summary["files_with_errors"] += len(result["errors"]) > 0
+        summary["files_failed"] += result["failure"] is not None
+        summary["errors"] += len(result["errors"])
+        summary["rows"] += result["rows"]
+        summary["recent"].appendleft({
+            "file": result["file"],
+            "checked": summary["updated"],
+            "errors": len(result["errors"]),
+            "failure": result["failure"],
+            "rows": result["rows"],
+            "time": result["time"],
+            "latency": time.monotonic() - landed,
+            "result": result_path
+        })
+        try:
+            with open(self.summary_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(dict(summary, recent=list(summary["recent"])), f, indent=2)
+            os.replace(self.summary_path + ".tmp", self.summary_path)
+        except OSError as e:
+            log("The summary cannot be written: {}".format(e))
+        return result
+
+    def run(self, interval, once=False, output=sys.stdout):
+        """
+        Watch the folder and check the files until interrupted.
+
+        Args:
+        interval (float): The seconds between two scans of the folder.
+        once (bool): Whether to stop once the files found by the first scan are checked.
+        output (file): Where the result of each file is printed.
+
+        Returns:
+        bool: Whether errors were found.
+        """
+        changed = threading.Event()
+        observer = start_notifier(self.folder, self.options["recursive"], changed)
+        found_errors = False
+        first = True
+        try:
+            while True:
+                for file, state, landed in self.scan(time.monotonic()):
+                    result = self.submit(file, state, landed)
+                    results = [result] if result is not None else []
+                    found_errors |= self.report(results, output)
+                found_errors |= self.report(self.collect(), output)
+                if first:
+                    first = False
+                    waiting = set(self.pending)
+                waiting &= set(self.pending) | {file for file, state, landed in self.running.values()}
+                if once and not waiting and not self.running:
+                    return found_errors
+                # Wake up at once on a change (with watchdog), but still wait for the files to settle
+                changed.wait(interval if not self.running else min(interval, 0.1))
+                changed.clear()
+        finally:
+            if observer is not None:
+                observer.stop()
+
+    def report(self, results, output):
+        found_errors = False
+        for result in results:
+            found_errors |= bool(result["errors"]) or result["failure"] is not None
+            output.write("{} {}: {}\n".format(time.strftime("%Y-%m-%d %H:%M:%S"), result["file"], show_result(result, self.options, details=False).strip()))
+            output.flush()
+        return found_errors
+
+#####################################################################################################
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Watch a folder and check each CSV file as soon as it lands there.")
+    parser.add_argument("folder", help="folder to watch")
+    add_check_arguments(parser)
+    parser.add_argument("--interval", type=float, default=2, help="seconds between two scans of the folder (default: %(default)s)")
+    parser.add_argument("--settle", type=float, default=2, help="seconds during which a file must not change before it is checked (default: %(default)s)")
+    parser.add_argument("--summary", help="path of the rolling summary (default: {} in the folder)".format(SUMMARY_NAME))
+    parser.add_argument("--once", action="store_true", help="stop once the files already in the folder are checked")
+    return parser
+
+def run(args):
+    """
+    Watch the folder.
+
+    Args:
+    args (argparse.Namespace): The arguments of the command line.
+
+    Returns:
+    int: The exit status: 2 if the folder cannot be watched, with --once 1 if errors were found and 0 otherwise.
+    """
+    options = get_options(args)
+    if not os.path.isdir(args.folder):
+        print("The folder does not exist: {}".format(args.folder), file=sys.stderr)
+        return 2
+    if not args.formatspec and not args.routes:
+        print("A format file (-f) or a routing table (--routes) is required.", file=sys.stderr)
+        return 2
+    try:
+        watcher = FolderWatcher(args.folder, args.formatspec, options, args.settle, args.summary or os.path.join(args.folder, SUMMARY_NAME))
+        # Stop at once on an invalid FMT file
+        for fmt_path, optsection in set([(watcher.fmt_path, options["optsection"])] if watcher.fmt_path else []) | {route[1:] for route in watcher.routes}:
+            get_format_specs(fmt_path, dict(options, optsection=optsection or options["optsection"]))
+    except (OSError, ChkCsvError) as e:
+        print("Error: {}".format(e.errmsg if isinstance(e, ChkCsvError) else e), file=sys.stderr)
+        return 2
+    print("Watching {} (Ctrl+C to stop).".format(os.path.abspath(args.folder)))
+    try:
+        found_errors = watcher.run(args.interval, args.once)
+    except KeyboardInterrupt:
+        return 0
+    return 1 if found_errors else 0
+
+#####################################################################################################
+
+if __name__ == "__main__":
+    # Needed by the process pool in the executable compiled with PyInstaller
+    multiprocessing.freeze_support()
+    sys.exit(run(get_parser().parse_args()))
@@ -0,0 +1,309 @@
+"""
+This Python script benchmarks the extraction of the catalogue of requirements on a synthetic corpus (see
+'synthetic_corpus.py') and checks the structure of the output against the expected one, so that both speed and
+accuracy regressions are caught.
+
+It reports the throughput (pages/sec) of 'convert_pdf_to_str' and of the full 'create_table_of_requirement', and the
+number of articles and paragraphs found compared to the manifest of the corpus. The exit status is 1 when the
+structure does not match or when the throughput is below --min-pages-per-sec.
+
+The cold start of the script (fresh interpreter until the dialog box can be built) is measured first and must stay
+within --startup-budget seconds without loading any of the heavy libraries.
+
+With --tables P, the documents contain ruled tables (see 'synthetic_corpus.py'); with --skip-tables-and-figures, the
+extraction runs with SKIP_TABLES_AND_FIGURES and every table must be replaced by its placeholder, without any of its
+text left in the rows.
+
+With --queue-workers N, the extraction is also run with the work queue of the catalogue script shared by N local
+processes in a temporary folder, and the merged output must be identical to the serial one.
+
+Usage: python benchmark.py [--documents N] [--pages N [N ...]] [--repeat N] [--min-pages-per-sec X] [--keep FOLDER]
+                           [--queue-workers N] [--startup-budget SECONDS] [--tables P] [--skip-tables-and-figures]
+
+Maintainer: Jose Javier Saiz (josejavier.saizanton@acer.europa.eu, josejavier.saiz.anton@gmail.com)
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import catalogue_of_requirements_project as catalogue
+from synthetic_corpus import TABLE_COLUMNS, generate_corpus
+
+
+# Modules that must not be loaded before the dialog box is shown
+HEAVY_MODULES = ["pandas", "numpy", "pdfplumber", "dateparser", "datefinder"]
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import catalogue_of_requirements_project
+import tkinter
+print(time.perf_counter() - start)
+print(",".join(module for module in {} if module in sys.modules))
+""".format(HEAVY_MODULES)
+
+
+def measure_startup(repeat=5):
+    """
+
+    Args:
+        repeat: number of fresh interpreters started, the best time is kept
+
+    Returns:
+        Cold-start time: wall time of a fresh interpreter until the dialog box can be built (import of the catalogue
+        script and tkinter), time spent in these imports only, and the heavy modules loaded by them (should be none)
+    """
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+    time_process = float("inf")
+    time_import = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT], cwd=folder, capture_output=True, text=True, check=True
+        ).stdout.split("\n")
+        time_process = min(time_process, time.perf_counter() - start)
+        time_import = min(time_import, float(output[0]))
+        heavy_modules = [module for module in output[1].split(",") if module]
+
+    return time_process, time_import, heavy_modules
+
+
+def check_structure(df_tcm, df_requirement, manifest):
+    """
+
+    Args:
+        df_tcm: catalogue of regulation returned by create_table_of_tcms
+        df_requirement: catalogue of requirement returned by create_table_of_requirement
+        manifest: expected structure returned by generate_corpus
+
+    Returns:
+        Counts of expected and found articles/paragraphs and a list of mismatch descriptions
+    """
+
+    counts = {"articles_expected": 0, "articles_found": 0, "paragraphs_expected": 0, "paragraphs_found": 0}
+    errors = []
+
+    for _, tcm in df_tcm.iterrows():
+        structure = manifest[tcm["File_name"]]
+        rows = df_requirement[df_requirement["TCM_id"] == tcm["TCM_id"]]
+        found = {}
+        for article_nb, paragraph_nb in zip(rows["Article_nb"], rows["Paragraph_nb"]):
+            if paragraph_nb.isdigit():
+                found.setdefault(article_nb, []).append(paragraph_nb)
+
+        expected_articles = {article["nb"] for article in structure["articles"]}
+        for article_nb in sorted(set(found) - expected_articles):
+            errors.append(tcm["File_name"] + ": unexpected article " + article_nb)
+
+        if catalogue.SKIP_TABLES_AND_FIGURES:
+            nb_rows = rows["Text"].str.contains(TABLE_COLUMNS[0], regex=False).sum()
+            if nb_rows > 0:
+                errors.append(tcm["File_name"] + ": table text left in " + str(nb_rows) + " rows")
+            nb_placeholders = rows["Text"].str.count(r"\[table on page").sum()
+            if nb_placeholders != structure.get("tables", 0):
+                errors.append(
+                    tcm["File_name"] + ": " + str(nb_placeholders) + " table placeholders instead of "
+                    + str(structure.get("tables", 0))
+                )
+
+        for header in structure.get("headers_and_footers", []):
+            nb_rows = rows["Text"].str.contains(header, regex=False).sum()
+            if nb_rows > 0:
+                errors.append(tcm["File_name"] + ": header or footer '" + header + "' left in " + str(nb_rows) + " rows")
+
+        for article in structure["articles"]:
+            expected = [str(p + 1) for p in range(article["paragraphs"])]
+            counts["articles_expected"] += 1
+            counts["paragraphs_expected"] += len(expected)
+            if article["nb"] in found:
+                counts["articles_found"] += 1
+                counts["paragraphs_found"] += len(set(found[article["nb"]]) & set(expected))
+            if found.get(article["nb"], []) != expected:
+                errors.append(
+                    tcm["File_name"] + ": article " + article["nb"] + " has paragraphs "
+                    + str(found.get(article["nb"], [])) + " instead of " + str(expected)
+                )
+
+    return counts, errors
+
+
+def run_queue_worker(queue_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        catalogue.run_queue_worker(queue_path)
+
+
+def run_queue_benchmark(folder_path, df_tcm, df_requirement, workers):
+    """
+
+    Args:
+        folder_path: root folder of the synthetic corpus
+        df_tcm: catalogue of regulation of the serial run
+        df_requirement: catalogue of requirement of the serial run
+        workers: number of extractor processes sharing the work queue
+
+    Returns:
+        Time of the extraction with a work queue in a temporary folder shared by several processes, and whether
+        the merged catalogue of requirement is identical to the one of the serial run
+    """
+
+    queue_path = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        catalogue.init_work_queue(queue_path, folder_path, df_tcm)
+        processes = [multiprocessing.Process(target=run_queue_worker, args=(queue_path,)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        _, df_merged = catalogue.merge_queue_shards(queue_path)
+        time_queue = time.perf_counter() - start
+    finally:
+        shutil.rmtree(queue_path, ignore_errors=True)
+
+    return time_queue, df_merged.equals(df_requirement)
+
+
+def run_benchmark(folder_path, manifest, repeat=1, verbose=False, queue_workers=0):
+    """
+
+    Args:
+        folder_path: root folder of the synthetic corpus
+        manifest: expected structure returned by generate_corpus
+        repeat: number of runs, the best time is kept
+        verbose: whether to show the progress printed by the catalogue script
+        queue_workers: number of processes for the work queue run (no work queue run if 0)
+
+    Returns:
+        Dictionary with the timings, throughputs and structural check results
+    """
+
+    pages = sum(structure["pages"] for structure in manifest.values())
+    market_codes = sorted({structure["market_code"] for structure in manifest.values()})
+    output = sys.stdout if verbose else io.StringIO()
+
+    with contextlib.redirect_stdout(output):
+        start = time.perf_counter()
+        df_tcm = catalogue.create_table_of_tcms(folder_path, preferred_folders=market_codes)
+        time_tcms = time.perf_counter() - start
+
+        time_convert = float("inf")
+        time_requirement = float("inf")
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for file_pdf, structure in manifest.items():
+                catalogue.convert_pdf_to_str(
+                    os.path.join(folder_path, structure["market_code"], structure["methodology"], "Approved", file_pdf)
+                )
+            time_convert = min(time_convert, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            df_requirement = catalogue.create_table_of_requirement(folder_path, df_tcm, catalogue.STAKEHOLDERS_LIST)
+            time_requirement = min(time_requirement, time.perf_counter() - start)
+
+    counts, errors = check_structure(df_tcm, df_requirement, manifest)
+
+    time_queue = None
+    if queue_workers > 0:
+        time_queue, identical = run_queue_benchmark(folder_path, df_tcm, df_requirement, queue_workers)
+        if not identical:
+            errors.append("work queue output differs from create_table_of_requirement")
+
+    return {
+        "documents": len(manifest),
+        "pages": pages,
+        "rows": len(df_requirement),
+        "time_tcms": time_tcms,
+        "time_convert": time_convert,
+        "time_requirement": time_requirement,
+        "convert_pages_per_sec": pages / time_convert,
+        "requirement_pages_per_sec": pages / time_requirement,
+        "queue_workers": queue_workers,
+        "time_queue": time_queue,
+        "counts": counts,
+        "errors": errors,
+    }
+
+
+def print_report(result):
+    counts = result["counts"]
+    print(
+        "{documents} documents, {pages} pages, {rows} requirement rows".format(**result)
+    )
+    print("  create_table_of_tcms:        {:8.2f} s".format(result["time_tcms"]))
+    print("  convert_pdf_to_str:          {:8.2f} s  {:8.1f} pages/sec".format(
+        result["time_convert"], result["convert_pages_per_sec"]))
+    print("  create_table_of_requirement: {:8.2f} s  {:8.1f} pages/sec".format(
+        result["time_requirement"], result["requirement_pages_per_sec"]))
+    if result["time_queue"] is not None:
+        print("  work queue ({} processes):   {:8.2f} s  {:8.1f} pages/sec".format(
+            result["queue_workers"], result["time_queue"], result["pages"] / result["time_queue"]))
+    print("  articles found:   {} / {}".format(counts["articles_found"], counts["articles_expected"]))
+    print("  paragraphs found: {} / {}".format(counts["paragraphs_found"], counts["paragraphs_expected"]))
+    for error in result["errors"]:
+        print("  STRUCTURE: " + error)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the catalogue extraction on a synthetic corpus.")
+    parser.add_argument("--documents", type=int, default=3, help="Number of documents per corpus (default: 3).")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50],
+                        help="Approximate number of pages per document, one corpus per value (default: 10 50).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the corpus generator (default: 0).")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of runs, the best time is kept (default: 1).")
+    parser.add_argument("--min-pages-per-sec", type=float, default=0,
+                        help="Fail when the full extraction is slower than this throughput.")
+    parser.add_argument("--keep", help="Folder where the corpus is generated and kept (default: temporary folder).")
+    parser.add_argument("--queue-workers", type=int, default=0,
+                        help="Also run the extraction with a work queue shared by this number of processes and check "
+                             "that the merged output is identical.")
+    parser.add_argument("--startup-budget", type=float, default=0.5,
+                        help="Fail when the cold start (fresh interpreter until the dialog box can be built) takes "
+                             "longer than this number of seconds (default: 0.5).")
+    parser.add_argument("--tables", type=float, default=0.0,
+                        help="Probability of a ruled table after each numbered paragraph of the corpus (default: 0).")
+    parser.add_argument("--skip-tables-and-figures", action="store_true",
+                        help="Run the extraction with SKIP_TABLES_AND_FIGURES and check the table placeholders.")
+    parser.add_argument("--verbose", action="store_true", help="Show the progress of the catalogue script.")
+    args = parser.parse_args()
+
+    catalogue.SKIP_TABLES_AND_FIGURES = args.skip_tables_and_figures
+    status = 0
+
+    time_process, time_import, heavy_modules = measure_startup()
+    print("Cold start: {:.3f} s (imports {:.3f} s), budget {} s".format(time_process, time_import, args.startup_budget))
+    if heavy_modules:
+        print("  STARTUP: modules loaded before the dialog box: " + ", ".join(heavy_modules))
+        status = 1
+    if time_process > args.startup_budget:
+        print("  STARTUP: cold start above the budget")
+        status = 1
+
+    for pages in args.pages:
+        folder_path = os.path.join(args.keep, str(pages) + "_pages") if args.keep else tempfile.mkdtemp()
+        try:
+            manifest = generate_corpus(folder_path, args.documents, pages, args.seed, tables=args.tables)
+            result = run_benchmark(folder_path, manifest, args.repeat, args.verbose, args.queue_workers)
+        finally:
+            if not args.keep:
+                shutil.rmtree(folder_path, ignore_errors=True)
+
+        print_report(result)
+
+        if result["errors"]:
+            status = 1
+        if result["requirement_pages_per_sec"] < args.min_pages_per_sec:
+            print("  SPEED: below the minimum of {} pages/sec".format(args.min_pages_per_sec))
+            status = 1
+
+    sys.exit(status)
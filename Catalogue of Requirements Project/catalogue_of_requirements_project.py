@@ -10,31 +10,42 @@ Coauthor: Kristy Louise Rhades (kristylou.rhades@gmail.com)
 Maintainer: Jose Javier Saiz (josejavier.saizanton@acer.europa.eu, josejavier.saiz.anton@gmail.com)
 """
 
-import pip
+import itertools
+import importlib
+import re
+import argparse
+import json
+import os, os.path
+import socket
+import time
 
-def import_or_install(package):
-    try:
-        __import__(package)
-    except ImportError:
-        pip.main(['install', package]) 
 
-for lib in ["dateparser", "datefinder", "pandas", "pdfplumber", "re", "tkinter"]:
-    import_or_install(lib)
+class LazyModule:
+    """
+    Library imported on the first access to one of its attributes, so that the dialog box is shown without waiting for
+    the heavy libraries to be loaded
+    """
+
+    def __init__(self, name):
 
-import re
-import pdfplumber
-import pandas as pd
-import os, os.path
-import numpy as np 
-import dateparser
-from dateparser.search import search_dates
-import datetime
-from datetime import date
-import datefinder
-import tkinter as tk
-from tkinter import filedialog, Checkbutton
-import colorsys
-import dateutil.parser as dp
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attribute):
+
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+
+        return getattr(self.module, attribute)
+
+
+# The heavy libraries are imported on first use (tkinter is imported by the dialog box). They are not installed
+# automatically anymore (see the RUN.txt file).
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+pdfplumber = LazyModule("pdfplumber")
+dateparser = LazyModule("dateparser")
+datefinder = LazyModule("datefinder")
 
 guideline_test = True  # Do not change setting. Global boolean variable to differentiate TCM from Regulation.
 
@@ -91,10 +102,55 @@ STAKEHOLDERS_LIST = [
     "Shipping agents",
 ]
 
+# Running headers and footers: lines in the top or bottom HEADER_FOOTER_MARGIN of the page height with the same text
+# (page number masked) in the same vertical band (in points) of at least HEADER_FOOTER_MIN_PAGES pages and
+# HEADER_FOOTER_MIN_SHARE of the pages of a document; article titles and numbered paragraphs are never learnt
+HEADER_FOOTER_MARGIN = 0.12
+HEADER_FOOTER_BAND = 10
+HEADER_FOOTER_MIN_PAGES = 3
+HEADER_FOOTER_MIN_SHARE = 0.5
+
+# Optional mode: detect the tables, figures and displayed equations of each page and extract the words outside of them
+# only; each region is replaced by a placeholder line with its bounding box (figures: images, or clusters of at least
+# FIGURE_MIN_OBJECTS drawings closer than FIGURE_MARGIN points covering FIGURE_MIN_AREA square points; equations:
+# characters in EQUATION_FONTS making at least EQUATION_MIN_SHARE of the characters of their lines)
+SKIP_TABLES_AND_FIGURES = False
+FIGURE_MIN_OBJECTS = 3
+FIGURE_MIN_AREA = 2000
+FIGURE_MARGIN = 5
+EQUATION_FONTS = ["Math", "Symbol", "CMMI", "CMSY", "CMEX", "MT Extra"]
+EQUATION_MIN_SHARE = 0.5
+
+# MONOCLE upload: columns of the table of TCMs ('Full_name' must stay in the ninth column) and separator used to build
+# 'Full_name' out of 'Regulation_name', 'TCM_name_actual' and 'Geographic_perimeter'
+MONOCLE_TCM_COLUMNS = [
+    "TCM_id",
+    "Ignore_status",
+    "Regulation_name",
+    "Geographic_perimeter",
+    "TCM_name",
+    "Amended_version",
+    "Decision_date",
+    "File_name",
+    "Full_name",
+    "TCM_name_actual",
+]
+MONOCLE_FULL_NAME_SEPARATOR = " "
+
+# Work queue: age (in seconds) after which the claim of a document by an extractor instance that did not deliver
+# its result is abandoned, so that another instance can take the document over
+QUEUE_CLAIM_TIMEOUT = 3600
+
+# Stable identifiers: mapping of the TCM and requirement keys to their 'TCM_id' and 'Requirement_id', and last
+# exported catalogue of requirement (compared with the new one to write the delta workbook), kept in the export folder
+ID_MAP_FILE_NAME = "catalogue_id_map.json"
+SNAPSHOT_FILE_NAME = "catalogue_of_requirement_snapshot.pkl"
+
 # color hue for input interface
 hue = 0
 
-def main(folder_path=FOLDER_PATH, stakeholders_list=STAKEHOLDERS_LIST, excel_export=True):
+def main(folder_path=FOLDER_PATH, stakeholders_list=STAKEHOLDERS_LIST, excel_export=True, monocle_export=True,
+         delta_export=True):
     """
 
     Args:
@@ -103,57 +159,108 @@ def main(folder_path=FOLDER_PATH, stakeholders_list=STAKEHOLDERS_LIST, excel_exp
         excel_export: boolean variable to whether or not export the pandas dataframe to XLSX file (special characters
         such as equations could be lost in the format conversion, it is always better to work directly with
         the pandas dataframe if possible).
+        monocle_export: boolean variable to whether or not export the merged workbook ready for upload in MONOCLE
+        (see 'prepare_tables_for_monocle').
+        delta_export: boolean variable to whether or not export the requirement rows inserted, changed or removed
+        since the previous run (see 'create_requirement_delta').
+
+    Returns:
+        df_tcm: catalogue of regulation (tcm + regulation), None if the extraction was cancelled
+        df_requirement: catalogue of requirement (list of paragraph), None if the extraction was cancelled
+    """
+
+    # Extraction started by the dialog box on a background thread, with the export path and selected folders
+    def extraction(input_exportpath, input_marketcodes, progress, cancel):
+        # Compile table of TCMs
+        df_tcm = create_table_of_tcms(folder_path, preferred_folders = input_marketcodes)
+        # Compile table of requirements
+        df_requirement = create_table_of_requirement(folder_path, df_tcm, stakeholders_list, progress, cancel)
+        # Assign stable identifiers, fix equations in table of requirements and export tables
+        return export_tables(df_tcm, df_requirement, input_exportpath, excel_export, monocle_export, delta_export)
+
+    # Get input with dialog box and run the extraction (None if it was cancelled)
+    result = dialogbox(extraction)
+
+    return result if result is not None else (None, None)
+
+
+def export_tables(df_tcm, df_requirement, export_path, excel_export=True, monocle_export=True, delta_export=True):
+    """
+
+    Args:
+        df_tcm: catalogue of regulation
+        df_requirement: catalogue of requirement
+        export_path: folder where the workbooks are written
+        excel_export: boolean variable to whether or not export the two raw workbooks
+        monocle_export: boolean variable to whether or not export the merged workbook ready for upload in MONOCLE
+        delta_export: boolean variable to whether or not export the workbook of the requirement rows inserted,
+        changed or removed since the previous export to the same folder
 
     Returns:
-        df_tcm: catalogue of regulation (tcm + regulation)
-        df_requirement: catalogue of requirement (list of paragraph)
-    """
-
-    # Get input with dialog box
-    varpath, vardict, _ = dialogbox()
-    # Retrieve path and selected folders
-    input_exportpath = varpath.get()
-    input_marketcodes = [code for code in vardict.keys() if vardict[code].get() == True]
-    # Compile table of TCMs
-    df_tcm = create_table_of_tcms(folder_path, preferred_folders = input_marketcodes)
-    # Compile table of requirements
-    df_requirement = create_table_of_requirement(folder_path, df_tcm, stakeholders_list)
+        Catalogue of regulation and catalogue of requirement with the stable identifiers of the export folder (see
+        'assign_stable_ids'), the equations removed from the 'Text' column of the latter
+    """
+
+    # Replace the run identifiers with the stable ones
+    df_tcm, df_requirement = assign_stable_ids(df_tcm, df_requirement, os.path.join(export_path, ID_MAP_FILE_NAME))
     # Fix equations in table of requirements
     df_requirement_fix = remove_equation_symbols(df_requirement)
     # Export tables
     if excel_export:
 
-        df_tcm.to_excel(input_exportpath + "//" + "catalogue_of_tcms_auto.xlsx", index=False)
+        df_tcm.to_excel(export_path + "//" + "catalogue_of_tcms_auto.xlsx", index=False)
+
+        #df_requirement.to_excel(export_path + "//" + "catalogue_of_requirement_auto.xlsx", index=False, engine='xlsxwriter')
+
+        df_requirement_fix.to_excel(export_path + "//" + "catalogue_of_requirement_auto.xlsx", index=False, engine='xlsxwriter')
 
-        #df_requirement.to_excel(input_exportpath + "//" + "catalogue_of_requirement_auto.xlsx", index=False, engine='xlsxwriter', encoding='utf-8')
+    if monocle_export or delta_export:
 
-        df_requirement_fix.to_excel(input_exportpath + "//" + "catalogue_of_requirement_auto.xlsx", index=False, engine='xlsxwriter', encoding='utf-8')
+        df_tcm_monocle, df_requirement_monocle = prepare_tables_for_monocle(df_tcm, df_requirement_fix)
 
+    if monocle_export:
+
+        export_monocle_workbook(df_tcm_monocle, df_requirement_monocle, export_path + "//" + "catalogue_of_requirement_monocle.xlsx")
+
+    if delta_export:
+
+        export_requirement_delta(df_requirement_monocle, export_path)
 
     return df_tcm, df_requirement_fix
 
 
-def dialogbox():
+def dialogbox(extraction):
     """
 
     Args:
-        None
+        extraction: function called with the export path, the selected Market Code folders, a progress function
+        (number of documents analysed, number of documents, file name) and a cancel event (threading.Event)
 
     Returns:
         A dialog box with entry fields for:
         - Export path
         - Selection of input Market Code folders
+        The extraction is started on a background thread with the "Start" button, and its progress (documents
+        analysed, throughput and estimated remaining time) is shown while the window stays responsive; "Cancel" stops
+        it after the current document. Returns the result of the extraction (None if it was cancelled or failed).
     """
 
+    import colorsys
+    import queue
+    import threading
+    import traceback
+    import tkinter as tk
+    from tkinter import filedialog, Checkbutton, ttk
+
     # Set function to clear path field box
     def clearandinsert(tkentry, dirname):
         tkentry.delete(0, "end")
         tkentry.insert(tk.INSERT, dirname)
     
-    # Set function to change background
+    # Set function to change background, called once per analysed document
     def update_color():
         global hue
-        hue += 0.002 # change this value to adjust the speed of color change
+        hue += 0.05 # change this value to adjust the speed of color change
         if hue > 1:
             hue = 0
         rgb = [int(x*255) for x in colorsys.hsv_to_rgb(hue, 1, 1)]
@@ -161,11 +268,89 @@ def dialogbox():
         window.config(bg=hexcolor)
         path_frame.config(bg=hexcolor)
         check_frame.config(bg=hexcolor)
-        #check_frame.config(bg=hexcolor)
-        window.after(10, update_color) # change this value to adjust the frequency of color update    
+        progress_frame.config(bg=hexcolor)
+
+    # Messages sent by the extraction thread, read by 'poll' in the main thread (tkinter is not thread-safe)
+    messages = queue.Queue()
+    cancel = threading.Event()
+    state = {"running": False, "result": None, "start": 0}
+
+    def run(export_path, market_codes):
+        try:
+            result = extraction(
+                export_path,
+                market_codes,
+                lambda done, total, file_name: messages.put(("document", done, total, file_name)),
+                cancel,
+            )
+            messages.put(("done", result))
+        except ExtractionCancelled:
+            messages.put(("cancelled",))
+        except Exception as error:
+            traceback.print_exc()
+            messages.put(("error", error))
+
+    def start():
+        export_path = var_path.get()
+        market_codes = [code for code in var_dict.keys() if var_dict[code].get() == True]
+        if not os.path.isdir(export_path):
+            var_status.set("Select an existing export folder")
+            return
+        if len(market_codes) == 0:
+            var_status.set("Select at least one Market Code folder")
+            return
+        cancel.clear()
+        state["running"] = True
+        state["start"] = time.time()
+        start_button.config(state="disabled")
+        cancel_button.config(text="Cancel")
+        progress_bar.config(value=0, maximum=1)
+        var_status.set("Listing the documents...")
+        threading.Thread(target=run, args=(export_path, market_codes), daemon=True).start()
+        window.after(100, poll)
+
+    def stop():
+        if state["running"]:
+            cancel.set()
+            var_status.set("Cancelling after the current document...")
+        else:
+            window.destroy()
+
+    def close():
+        cancel.set()
+        window.destroy()
+
+    def poll():
+        while not messages.empty():
+            message = messages.get()
+            if message[0] == "document":
+                _, done, total, file_name = message
+                elapsed = time.time() - state["start"]
+                eta = elapsed / done * (total - done)
+                progress_bar.config(value=done, maximum=total)
+                var_status.set(
+                    "({}/{}) {} - {:.1f} documents/min, {:.0f} min {:02.0f} s left".format(
+                        done, total, file_name, 60 * done / elapsed, eta // 60, eta % 60
+                    )
+                )
+                update_color()
+            else:
+                state["running"] = False
+                start_button.config(state="normal")
+                cancel_button.config(text="Close")
+                if message[0] == "done":
+                    state["result"] = message[1]
+                    var_status.set("Done in {:.0f} s, the tables are exported".format(time.time() - state["start"]))
+                elif message[0] == "cancelled":
+                    var_status.set("Cancelled")
+                else:
+                    var_status.set("Error: " + str(message[1]))
+        if state["running"]:
+            window.after(100, poll)
 
     # Set main window
     window = tk.Tk()
+    window.protocol("WM_DELETE_WINDOW", close)
 
 
     # Set title
@@ -177,6 +362,9 @@ def dialogbox():
     # Create a frame to hold the input widgets
     check_frame = tk.Frame(window)
     check_frame.pack(padx = 20, pady = 20, anchor="center")
+    # Create a frame to hold the progress widgets
+    progress_frame = tk.Frame(window)
+    progress_frame.pack(padx = 20, pady = 20, anchor="center")
 
     # Create the path field box
     var_path = tk.StringVar()
@@ -199,9 +387,24 @@ def dialogbox():
         # Pack the check button with some padding
         chk.pack(side="left")
 
-    update_color() # start the color update loop
+    # Create the progress widgets
+    var_status = tk.StringVar(value="Select the export folder and the Market Code folders, then start")
+    progress_bar = ttk.Progressbar(progress_frame, length=480, mode="determinate")
+    status_label = tk.Label(progress_frame, textvariable=var_status, width=80)
+    start_button = tk.Button(progress_frame, text="Start", command=start)
+    cancel_button = tk.Button(progress_frame, text="Close", command=stop)
+
+    # Place the progress widgets
+    progress_bar.grid(row=0, column=0, columnspan=2, padx=5, pady=5)
+    status_label.grid(row=1, column=0, columnspan=2, padx=5, pady=5)
+    start_button.grid(row=2, column=0, padx=5, pady=5)
+    cancel_button.grid(row=2, column=1, padx=5, pady=5)
+
+    update_color() # set the initial color
 
-    return var_path, var_dict, window.mainloop()
+    window.mainloop()
+
+    return state["result"]
     
 
 def get_x_pos(word):
@@ -277,16 +480,21 @@ def rearrange_exponent_and_indices(dic):
     return dic
 
 
-def extract_text_from_page(page):
+def extract_lines_from_page(page, regions=()):
     """
 
     Args:
         page:
+        regions: tables, figures and equations of the page to leave out (output of 'find_masked_regions')
 
     Returns:
-        Extract words from one page of a pdf document
+        Extract words from one page of a pdf document and aggregate them in lines (list of lists of words)
     """
 
+    if len(regions) > 0:
+        bboxes = [region["bbox"] for region in regions]
+        page = page.filter(lambda obj: not is_in_bounding_boxes(obj, bboxes))
+
     dic = page.extract_words(extra_attrs=["size"]) # .dedupe_chars and y_tolerance=6 to handle subscripts properly
 
     dic = rearrange_exponent_and_indices(dic)
@@ -368,25 +576,266 @@ def extract_text_from_page(page):
     while [] in lines:
         lines.remove([])
 
+    return lines
+
+
+def get_bounding_box(obj):
+    return obj["x0"], obj["top"], obj["x1"], obj["bottom"]
+
+
+def is_in_bounding_boxes(obj, bboxes):
+    """
+
+    Args:
+        obj: pdfplumber object (character, line, rect, curve, image, etc.)
+        bboxes: list of (x0, top, x1, bottom) bounding boxes
+
+    Returns:
+        True if the center of the object is in one of the bounding boxes
+    """
+
+    x = (obj["x0"] + obj["x1"]) / 2
+    y = (obj["top"] + obj["bottom"]) / 2
+
+    return any(x0 <= x <= x1 and top <= y <= bottom for x0, top, x1, bottom in bboxes)
+
+
+def merge_bounding_boxes(bboxes, margin):
+    """
+
+    Args:
+        bboxes: list of (x0, top, x1, bottom) bounding boxes
+        margin: distance (in points) under which two boxes are merged
+
+    Returns:
+        Clusters of boxes that overlap or are closer than the margin: list of (bounding box, number of boxes)
+    """
+
+    clusters = []
+
+    for bbox in sorted(bboxes, key=lambda bbox: bbox[1]):
+
+        x0, top, x1, bottom = bbox
+        count = 1
+        merged = True
+
+        while merged:
+            merged = False
+            for k, ((c_x0, c_top, c_x1, c_bottom), c_count) in enumerate(clusters):
+                if c_x0 - margin <= x1 and x0 <= c_x1 + margin and c_top - margin <= bottom and top <= c_bottom + margin:
+                    x0, top, x1, bottom = min(x0, c_x0), min(top, c_top), max(x1, c_x1), max(bottom, c_bottom)
+                    count += c_count
+                    clusters.pop(k)
+                    merged = True
+                    break
+
+        clusters.append(((x0, top, x1, bottom), count))
+
+    return clusters
+
+
+def find_masked_regions(page):
+    """
+
+    Args:
+        page:
+
+    Returns:
+        Tables (pdfplumber 'find_tables'), figures (images and clusters of curves, rects and lines outside the
+        tables) and displayed equations (lines mostly made of characters in a math font) of the page, in reading
+        order: list of dictionaries with the 'kind' of region, its 'bbox' (x0, top, x1, bottom) and the 'page' number
+    """
+
+    regions = [{"kind": "table", "bbox": table.bbox} for table in page.find_tables()]
+
+    # Figures
+
+    for image in page.images:
+        bbox = get_bounding_box(image)
+        if (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) >= FIGURE_MIN_AREA:
+            regions.append({"kind": "figure", "bbox": bbox})
+
+    bboxes = [region["bbox"] for region in regions]
+    drawings = [
+        get_bounding_box(obj) for obj in page.curves + page.rects + page.lines if not is_in_bounding_boxes(obj, bboxes)
+    ]
+
+    for bbox, count in merge_bounding_boxes(drawings, FIGURE_MARGIN):
+        if count >= FIGURE_MIN_OBJECTS and (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) >= FIGURE_MIN_AREA:
+            regions.append({"kind": "figure", "bbox": bbox})
+
+    # Displayed equations (an equation within a sentence is left in the text)
+
+    bboxes = [region["bbox"] for region in regions]
+    chars = [char for char in page.chars if not char["text"].isspace() and not is_in_bounding_boxes(char, bboxes)]
+    math_chars = [
+        get_bounding_box(char) for char in chars if any(font in char["fontname"] for font in EQUATION_FONTS)
+    ]
+
+    for bbox, count in merge_bounding_boxes(math_chars, FIGURE_MARGIN):
+        nb_chars = sum(1 for char in chars if char["top"] < bbox[3] and char["bottom"] > bbox[1])
+        if count >= EQUATION_MIN_SHARE * nb_chars:
+            regions.append({"kind": "equation", "bbox": bbox})
+
+    for region in regions:
+        region["page"] = page.page_number
+
+    return sorted(regions, key=lambda region: region["bbox"][1])
+
+
+def get_placeholder(region):
+    """
+
+    Args:
+        region: table, figure or equation (see 'find_masked_regions')
+
+    Returns:
+        Text replacing the region in the catalogue of requirement
+    """
+
+    return "[{} on page {} at ({:.0f}, {:.0f}, {:.0f}, {:.0f}): refer to original TCM]".format(
+        region["kind"], region["page"], *region["bbox"]
+    )
+
+
+def get_line_key(line):
+    """
+
+    Args:
+        line: list of words
+
+    Returns:
+        Key identifying a running header or footer: the text of the line with the page number at its start or end
+        masked ('X', 'X/Y' or 'X of Y', which change from one page to the other) and the vertical band of the page in
+        which the line is located
+    """
+
+    text = re.sub(
+        r"^\d+(?:\s*(?:/|of)\s*\d+)?(?=\s|$)|(?<=\s)\d+(?:\s*(?:/|of)\s*\d+)?$",
+        "#",
+        " ".join(word["text"] for word in line),
+    )
+
+    return text + "@" + str(int(line[0]["top"] // HEADER_FOOTER_BAND))
+
+
+def is_in_margin(line, height):
+    """
+
+    Args:
+        line: list of words
+        height: height of the page of the line
+
+    Returns:
+        To check if the line can be a running header or footer: it is in the top or bottom margin of the page and it
+        is neither an article title nor a numbered paragraph (see 'tokenise_line' and 'detect_article')
+    """
+
+    if not (line[0]["top"] < HEADER_FOOTER_MARGIN * height or line[0]["bottom"] > (1 - HEADER_FOOTER_MARGIN) * height):
+        return False
+
+    tokens, words, numbered, paragraph = tokenise_line(" ".join(word["text"] for word in line))
+
+    return not (numbered or (len(words) > 1 and words[0] in ("Article", "Section")))
+
+
+def learn_headers_and_footers(pages_lines, heights):
+    """
+
+    Args:
+        pages_lines: lines of every page of a document (output of 'extract_lines_from_page')
+        heights: height of every page of the document
+
+    Returns:
+        Document-level model of the page layout, learnt once for the whole document:
+        - 'running_keys': keys (see 'get_line_key') of the margin lines (see 'is_in_margin') repeated at the same
+          place on many pages, i.e. the running headers and footers
+        - 'body_size': median font size of the document, used to detect small text (headers, footers, footnotes)
+    """
+
+    sizes = [word["size"] for lines in pages_lines for line in lines for word in line]
+    body_size = np.median(np.array(sizes)) if len(sizes) > 0 else 0
+
+    # Count on how many pages each line key appears
+    pages_per_key = {}
+    for lines, height in zip(pages_lines, heights):
+        for key in {get_line_key(line) for line in lines if is_in_margin(line, height)}:
+            pages_per_key[key] = pages_per_key.get(key, 0) + 1
+
+    min_pages = max(HEADER_FOOTER_MIN_PAGES, HEADER_FOOTER_MIN_SHARE * len(pages_lines))
+    running_keys = [key for key, nb_pages in pages_per_key.items() if nb_pages >= min_pages]
+
+    return {"running_keys": np.array(running_keys, dtype=object), "body_size": body_size}
+
+
+def remove_headers_and_footers(pages_lines, layout):
+    """
+
+    Args:
+        pages_lines: lines of every page of a document (output of 'extract_lines_from_page')
+        layout: document-level model returned by 'learn_headers_and_footers'
+
+    Returns:
+        Mask (one boolean array per page) of the lines to keep. Running headers and footers are looked up in the
+        document-level model and small text is detected by comparing the median size of each line with the
+        median size of the document, both with vectorised operations over all the lines of the document.
+    """
+
+    lines = [line for page_lines in pages_lines for line in page_lines]
+
+    if len(lines) == 0:
+        return [np.array([], dtype=bool) for _ in pages_lines]
+
+    # Median size of every line: sort the word sizes by line and pick the middle of each group
+    line_ids = np.repeat(np.arange(len(lines)), [len(line) for line in lines])
+    sizes = np.array([word["size"] for line in lines for word in line])
+    sorted_sizes = sizes[np.lexsort((sizes, line_ids))]
+    counts = np.bincount(line_ids, minlength=len(lines))
+    starts = np.cumsum(counts) - counts
+    line_sizes = (sorted_sizes[starts + (counts - 1) // 2] + sorted_sizes[starts + counts // 2]) / 2
+
+    keys = np.array([get_line_key(line) for line in lines], dtype=object)
+
+    remove = (
+        (line_sizes < layout["body_size"] - 0.4)  # Detect small text in header and footer
+        | np.isin(keys, layout["running_keys"])  # Detect running header and footer
+        | np.array([
+            (len(line) == 1 and line[0]["text"].isdigit())  # Remove pagination ('X')
+            or (len(line) < 5 and line[0]["text"] == "Page" and line[1]["text"].isdigit())
+            # Remove pagination ('Page X of Y')
+            for line in lines
+        ])
+    )
+
+    return np.split(~remove, np.cumsum([len(page_lines) for page_lines in pages_lines])[:-1])
+
+
+def extract_text_from_lines(lines, keep, regions=()):
+    """
+
+    Args:
+        lines: lines of one page (output of 'extract_lines_from_page')
+        keep: mask of the lines to keep (output of 'remove_headers_and_footers')
+        regions: tables, figures and equations left out of the lines (output of 'find_masked_regions')
+
+    Returns:
+        Text and horizontal position of the lines of one page, with the placeholder of each region inserted where
+        the region is on the page
+    """
+
     # Extract 'text' and 'x0' (horizontal position) dictionaries info into two lists
 
     text = []
     x_pos = []
+    regions = list(regions)
 
-    # Remove header and footer by comparing the median size of the line and the median size of the page
-
-    median_size = np.median(np.array([word["size"] for word in dic]))
-
-    for line in lines:
+    for line, keep_line in zip(lines, keep):
 
-        if not (
-                np.median(np.array(
-                    [word["size"] for word in line])) < median_size - 0.4  # Detect small text in header and footer
-                or (len(line) == 1 and line[0]["text"].isdigit())  # Remove pagination ('X')
-                or (len(line) < 5 and line[0]["text"] == "Page" and line[1]["text"].isdigit())
-                # Remove pagination ('Page X of Y')
+        while len(regions) > 0 and regions[0]["bbox"][1] < line[0]["top"]:
+            text.append(get_placeholder(regions[0]))
+            x_pos.append(regions.pop(0)["bbox"][0])
 
-        ):
+        if keep_line:
 
             phrase = ""
 
@@ -396,20 +845,41 @@ def extract_text_from_page(page):
 
             # Remove useless spaces at the beginning of paragraph
 
-            while (
-                    phrase[0] == " "
-            ):
-                phrase = phrase[1:]
+            phrase = phrase.lstrip(" ")
 
             # Remove headers with 'Official Journal of the European Union'
 
-            if not (len(phrase.split()) < 15 and "Official Journal of the European Union" in phrase):
+            if len(phrase) > 0 and not (len(phrase.split()) < 15 and "Official Journal of the European Union" in phrase):
                 text.append(phrase)
                 x_pos.append(line[0]["x0"])
 
+    for region in regions:
+        text.append(get_placeholder(region))
+        x_pos.append(region["bbox"][0])
+
     return text, x_pos
 
 
+def extract_text_from_page(page, layout=None):
+    """
+
+    Args:
+        page:
+        layout: document-level model returned by 'learn_headers_and_footers' (learnt from this page only if None)
+
+    Returns:
+        Extract text and horizontal position of the lines of one page of a pdf document
+    """
+
+    regions = find_masked_regions(page) if SKIP_TABLES_AND_FIGURES else []
+    lines = extract_lines_from_page(page, regions)
+
+    if layout is None:
+        layout = learn_headers_and_footers([lines], [page.height])
+
+    return extract_text_from_lines(lines, remove_headers_and_footers([lines], layout)[0], regions)
+
+
 def convert_pdf_to_str(path_pdf):
     """
 
@@ -422,12 +892,22 @@ def convert_pdf_to_str(path_pdf):
 
     pdf = pdfplumber.open(path_pdf)
 
+    # Leave out the tables, figures and equations (optional)
+
+    pages_regions = [find_masked_regions(page) if SKIP_TABLES_AND_FIGURES else [] for page in pdf.pages]
+
+    # Learn the running headers and footers once for the whole document
+
+    pages_lines = [extract_lines_from_page(page, regions) for page, regions in zip(pdf.pages, pages_regions)]
+    layout = learn_headers_and_footers(pages_lines, [page.height for page in pdf.pages])
+    pages_keep = remove_headers_and_footers(pages_lines, layout)
+
     text = []
     x_pos = []
 
-    for page in pdf.pages:
+    for lines, keep, regions in zip(pages_lines, pages_keep, pages_regions):
 
-        text_page, x_pos_page = extract_text_from_page(page)
+        text_page, x_pos_page = extract_text_from_lines(lines, keep, regions)
 
         if len(text_page) != 0:  # In case page is empty
 
@@ -447,17 +927,19 @@ def convert_pdf_to_str(path_pdf):
     return text, x_pos
 
 
-def detect_and_remove_annex_before(text, x_pos):
+def detect_and_remove_annex_before(lines):
     """
 
     Args:
-        text:
-        x_pos:
+        lines: DocumentLines of the document
 
     Returns:
         Remove annexes when they are included in the TCM document
     """
 
+    text = lines.text
+    x_pos = lines.x_pos
+
     i = 0
 
     while i < len(text) and not (
@@ -468,24 +950,22 @@ def detect_and_remove_annex_before(text, x_pos):
     ):
         i += 1
 
-    if i != len(text):
-        text = text[0:i]
-        x_pos = x_pos[0:i]
-
-    return text, x_pos
+    return lines.select(slice(0, i))
 
 
-def remove_contents_and_whereas(text, x_pos):
+def remove_contents_and_whereas(lines):
     """
 
     Args:
-        text:
-        x_pos:
+        lines: DocumentLines of the document
 
     Returns:
         Remove front page, table of contents and whereas
     """
 
+    text = lines.text
+    x_pos = lines.x_pos
+
     i = 0
 
     # Looking for Article 1 (or Section 1) but only when centered ('x_pos[i] > 180')
@@ -505,23 +985,11 @@ def remove_contents_and_whereas(text, x_pos):
     if i == len(text):
         i = 0
 
-    for k in range(i):
-        text.pop(0)
-        x_pos.pop(0)
+    lines = lines.select(slice(i, None))
 
     # Remove useless spaces
 
-    while "" in text:
-        i = text.index("")
-        text.pop(i)
-        x_pos.pop(i)
-
-    while " " in text:
-        i = text.index(" ")
-        text.pop(i)
-        x_pos.pop(i)
-
-    return text, x_pos
+    return lines.select((lines.text != "") & (lines.text != " "))
 
 
 def remove_contents_and_whereas_2nd_try(text):
@@ -581,77 +1049,103 @@ def remove_equation_symbols(df):
     return df
 
 
-def detect_article(text, line, i, articles_nb):
+def tokenise_line(line):
     """
 
     Args:
-        text:
-        line:
-        i:
-        articles_nb:
+        line: line of text
 
     Returns:
-        To detect if the line is an article title ('Article x')
+        Features of the line used by the article and paragraph references, computed once:
+        - tokens: words of the line;
+        - words: words of the line once ".", "-", ":" and "–" are replaced by spaces (to harmonize all formats of
+          'Article x');
+        - numbered: whether the line starts like a paragraph ('1.' or '(1)'), including sub-paragraphs;
+        - paragraph: number of the paragraph starting on the line ('1. xxxxx' or '(1) xxxxx'), "" otherwise.
     """
 
-    articles_nb_array = np.array(articles_nb)
+    tokens = line.split()
+    words = line.replace(".", " ").replace("-", " ").replace(":", " ").replace("–", " ").split()
 
-    line = (
-        line.replace(".", " ").replace("-", " ").replace(":", " ").replace("–", " ")  # To harmonize all formats
-    )
+    prefix = line.split(".")[0]
+    enumerated = len(line) > 1 and line[0] == "(" and line[1].isdigit()
+    numbered = (len(line) != 0 and prefix.isdigit()) or enumerated
+
+    if len(line) != 0 and prefix.isdigit() and len(tokens) > 3:  # To avoid line like '2019.' to be a paragraph
+        paragraph = str(int(prefix))
+    elif enumerated:
+        paragraph = str(int("".join(itertools.takewhile(str.isdigit, line[1:]))))
+    else:
+        paragraph = ""
+
+    return tokens, words, numbered, paragraph
+
+
+def detect_article(words, next_line, previous_article_nb, last_article_nb):
+    """
+
+    Args:
+        words: harmonized words of the line (see 'tokenise_line')
+        next_line: text of the next line (None for the last line)
+        previous_article_nb: article number of the previous line (None for the first line)
+        last_article_nb: last article number before the line that is not a title (None if there is none)
+
+    Returns:
+        To detect if the line is an article title ('Article x')
+    """
 
-    if (
-            len(line.split()) > 1
+    if not (
+            len(words) > 1
             and (
-                line.split()[0] == "Article"
-                or (line.split()[0] == "Section" and not guideline_test)  # Because in TCM sections can be equivalent to
+                words[0] == "Article"
+                or (words[0] == "Section" and not guideline_test)  # Because in TCM sections can be equivalent to
                 # articles, but in GL section are equivalent to chapters
             )
-            and (
-                    (
-                        len(line.split()) == 2  # It means the format is 'Article x' line break and then the title
-                        and (
-                                text[i + 1][0].isupper()  # To check if the title next line start with an uppercase
-                                or text[i + 1].split()[0] == "aFRR"  # Exception
-                                or text[i + 1].split()[0] == "mFRR"  # Exception
-                        )
+    ):
+        return False
+
+    if len(words) == 2:  # It means the format is 'Article x' line break and then the title
+        if not (
+                next_line is not None
+                and (
+                        next_line[0].isupper()  # To check if the title next line start with an uppercase
+                        or next_line.split()[0] == "aFRR"  # Exception
+                        or next_line.split()[0] == "mFRR"  # Exception
                 )
-                    or (
-                            len(line.split()) > 2  # It means the format is 'Article x : title' in one line
-                            and (
-                                    line.split()[2][0].isupper()  # To check if the title start with an uppercase
-                                    or line.split()[2] == "aFFR"  # Exception
-                                    or line.split()[2] == "mFFR"  # Exception
-                            )
-                    )
-            )
-            and (
-            (  # Checking if it's the first article of the TCM
-                    line.split()[1] == "1"
-                    and (len(articles_nb) == 0 or not articles_nb[-1].isdigit())
-            )
-            or (  # Checking if the article number (line.split()[1]) is equal to the numer of the previous article + 1
-                    len(articles_nb) > 0
-                    and (articles_nb[-1].isdigit() or articles_nb[-1] == "title")
-                    and line.split()[1].isdigit()
-                    and int(line.split()[1])
-                    == int(articles_nb_array[articles_nb_array != "title"][-1]) + 1
-                    and "Article " + line.split()[1] != text[i + 1]
-            )
-    )
+        ):
+            return False
+
+    elif not (  # It means the format is 'Article x : title' in one line
+            words[2][0].isupper()  # To check if the title start with an uppercase
+            or words[2] == "aFFR"  # Exception
+            or words[2] == "mFFR"  # Exception
     ):
-        return True
-    else:
         return False
 
+    return (
+        (  # Checking if it's the first article of the TCM
+                words[1] == "1"
+                and (previous_article_nb is None or not previous_article_nb.isdigit())
+        )
+        or (  # Checking if the article number is equal to the number of the previous article + 1
+                previous_article_nb is not None
+                and (previous_article_nb.isdigit() or previous_article_nb == "title")
+                and words[1].isdigit()
+                and last_article_nb is not None
+                and last_article_nb.isdigit()
+                and int(words[1]) == int(last_article_nb) + 1
+                and "Article " + words[1] != next_line
+        )
+    )
+
 
-def extract_article_name_and_nb(text, line, i):
+def extract_article_name_and_nb(text, words, i):
     """
 
     Args:
-        text:
-        line:
-        i:
+        text: lines of the document
+        words: harmonized words of the line i (see 'tokenise_line')
+        i: index of the line of the article title
 
     Returns:
         To extract the proper name of the article and its number
@@ -661,11 +1155,9 @@ def extract_article_name_and_nb(text, line, i):
     # 1: format is 'Article x' line break and then the title;
     # 2: format is 'Article x : title' in one line
 
-    line = line.replace(".", " ").replace("-", " ").replace(":", " ").replace("–", " ")  # To harmonize all formats
+    article_nb = words[1]
 
-    if len(line.split()) == 2:  # It means the format is 'Article x' line break and then the title
-
-        article_nb = line.split()[1]
+    if len(words) == 2:  # It means the format is 'Article x' line break and then the title
 
         if i + 1 < len(text):
 
@@ -684,12 +1176,7 @@ def extract_article_name_and_nb(text, line, i):
 
     else:  # It means the format is 'Article x : title' in one line
 
-        article_nb = line.split()[1]
-        article_name = ""
-
-        for word in line.split()[2:]:
-            article_name = article_name + word + " "
-
+        article_name = "".join(word + " " for word in words[2:])
         article_witness = 1
 
         # When the article title is too long to fit into one line
@@ -702,105 +1189,66 @@ def extract_article_name_and_nb(text, line, i):
     return article_name, article_nb, article_witness
 
 
-def detect_paragraph(line):
+def add_paragraph_and_article_reference(text, x_pos):
     """
 
     Args:
-        line:
+        text: lines of the document
+        x_pos: horizontal position of each line
 
     Returns:
-        To detect if a line is a new paragraph ('1. xxxxx')
+        Article number, article name and paragraph reference of each line, assigned in a single forward pass over the
+        features of the lines (see 'tokenise_line'). The paragraph references of the next lines are set in advance by
+        the article and title lines ("article name", "title name"), and the other lines take the reference of the
+        previous line.
     """
 
-    if (
-            len(line) != 0
-            and line.split(".")[0].isdigit()
-            and len(line.split()) > 3  # To avoid line like '2019.' to be detected as beginning of a paragraph
-    ):
-
-        return True
+    features = [tokenise_line(line) for line in text]
 
-    else:
-
-        return False
-
-
-def add_paragraph_and_article_reference(text, x_pos):
     articles_nb = []
     article_nb = "None"
+    last_article_nb = None  # Last article number that is not a title
     articles_name = []
     article_name = "None"
-    paragraphs = []
-    paragraph = 0
-    articles_witness = []
+    paragraphs = [paragraph for _, _, _, paragraph in features]
 
-    for i, line in enumerate(text):
-        article_witness = 0
+    for i, (tokens, words, _, _) in enumerate(features):
 
         # Title
 
-        if (
-                len(line.split()) > 0
-                and (line.split()[0] == "TITLE" or line.split()[0] == "CHAPTER" or (
-                line.split()[0] == "Section" and guideline_test))
-                and x_pos[i] > 160
-        ):
+        is_title = len(tokens) > 0 and x_pos[i] > 160 and (tokens[0] == "TITLE" or tokens[0] == "CHAPTER")
+
+        if is_title or (len(tokens) > 0 and tokens[0] == "Section" and guideline_test and x_pos[i] > 160):
             article_nb = "title"
             article_name = "title"
 
         # Article
 
-        if detect_article(text, line, i, articles_nb):
-            article_name, article_nb, article_witness = extract_article_name_and_nb(text, line, i)
+        article_witness = 0
+        if detect_article(
+                words,
+                text[i + 1] if i + 1 < len(text) else None,
+                articles_nb[-1] if i > 0 else None,
+                last_article_nb,
+        ):
+            article_name, article_nb, article_witness = extract_article_name_and_nb(text, words, i)
         articles_nb.append(article_nb)
         articles_name.append(article_name)
-        articles_witness.append(article_witness)
+        if article_nb != "title":
+            last_article_nb = article_nb
 
         # Paragraph
 
-        if detect_paragraph(line):
-
-            k = 0
-            digits = []
-            while k < len(line) and line[k].isdigit():
-                digits.append(line[k])
-                k += 1
-
-            paragraph = 0
-            for j, digit in enumerate(digits):
-                paragraph += int(digit) * 10 ** (len(digits) - j - 1)
-            paragraphs.append(str(paragraph))
-
-        else:
-
-            if len(line) > 1 and line[0] == "(" and line[1].isdigit():
-                k = 1
-                digits = []
-                while k < len(line) and line[k].isdigit():
-                    digits.append(line[k])
-                    k += 1
-
-                paragraph = 0
-                for j, digit in enumerate(digits):
-                    paragraph += int(digit) * 10 ** (len(digits) - j - 1)
-                paragraphs.append(str(paragraph))
-            else:
-                paragraphs.append("")
-
-    # Complete paragraphs
-
-    for i, line in enumerate(text):
-
-        if articles_witness[i] == 1:
-            if len(line.split()) == 2:
+        if article_witness == 1:
+            if len(tokens) == 2:
                 paragraphs[i] = "article number"
                 if i + 1 < len(paragraphs):
                     paragraphs[i + 1] = "article name"
             else:
                 paragraphs[i] = "article number and name"
 
-        if articles_witness[i] == 2:
-            if len(line.split()) == 2:
+        if article_witness == 2:
+            if len(tokens) == 2:
                 paragraphs[i] = "article number"
                 if i + 2 < len(paragraphs):
                     paragraphs[i + 1] = "article name"
@@ -811,14 +1259,11 @@ def add_paragraph_and_article_reference(text, x_pos):
                     paragraphs[i + 1] = "article number and name"
 
         if paragraphs[i] == "":
-            if (
-                    len(line.split()) > 0
-                    and (line.split()[0] == "TITLE" or line.split()[0] == "CHAPTER")
-                    and x_pos[i] > 160
-            ):
-                if len(line.split()) == 2:
+            if is_title:
+                if len(tokens) == 2:
                     paragraphs[i] = "title number"
-                    paragraphs[i + 1] = "title name"
+                    if i + 1 < len(paragraphs):
+                        paragraphs[i + 1] = "title name"
                 else:
                     paragraphs[i] = "title number and name"
 
@@ -830,67 +1275,67 @@ def add_paragraph_and_article_reference(text, x_pos):
                     paragraphs[i] = "1"
                 else:
                     paragraphs[i] = paragraphs[i - 1]
-    try:
-        paragraphs = unflag_subparagraph_as_paragraph(text, x_pos, articles_nb, paragraphs)
-    except IndexError:
-        paragraphs = []
+
+    paragraphs = unflag_subparagraph_as_paragraph(
+        x_pos, [numbered for _, _, numbered, _ in features], articles_nb, paragraphs
+    )
 
     return articles_nb, articles_name, paragraphs
 
 
-def unflag_subparagraph_as_paragraph(text, x_pos, articles_nb, paragraphs):
+def unflag_subparagraph_as_paragraph(x_pos, numbered, articles_nb, paragraphs):
     """
 
     Args:
-        text:
-        x_pos:
-        articles_nb:
-        paragraphs:
+        x_pos: horizontal position of each line
+        numbered: whether each line starts like a paragraph ('1.' or '(1)', see 'tokenise_line')
+        articles_nb: article number of each line
+        paragraphs: paragraph reference of each line
 
     Returns:
         To not consider sub-paragraphs which have the same structure as paragraphs ('1.' or '(1)') but are not paragraphs
     """
 
-    for i, line in enumerate(text):
+    index = 1  # Line of the paragraph n°1 of the current article (line after the last article name)
 
-        # To find line that have been identified as paragraph in the previous 'for'-loop
+    for i in range(len(paragraphs)):
 
-        if (len(line) != 0 and line.split(".")[0].isdigit()) or (
-                len(line) > 1 and line[0] == "(" and line[1].isdigit()
-        ):
+        # The references before the line are final, so the last article name is followed line by line
 
-            # To find the paragraph n°1 of the article
+        if i > 0 and (paragraphs[i - 1] == "article name" or paragraphs[i - 1] == "article number and name"):
+            index = i
 
-            para_trunc = paragraphs[:i]
-            para_trunc.reverse()
-            index_1 = 0
-            index_2 = 0
+        # To find line that have been identified as paragraph in the previous loop
 
-            if "article name" in para_trunc:
-                index_1 = len(para_trunc) - para_trunc.index("article name") - 1
+        if not numbered[i] or index >= len(x_pos):
+            continue
 
-            if "article number and name" in para_trunc:
-                index_2 = (
-                        len(para_trunc) - para_trunc.index("article number and name") - 1
-                )
+        # To check if the current paragraph is more indented in comparison with the first paragraph of the article
 
-            index = max(index_1, index_2) + 1
+        if x_pos[i] > x_pos[index] + 10:
 
-            # To check if the current paragraph is more indented in comparison with the first paragraph of the article
-            if index >= len(x_pos):
-                continue
+            j = 0
 
-            if i < len(x_pos) and x_pos[i] > x_pos[index] + 10:
+            # Replace all the subparagraph line references to the closest previous paragraph reference
 
-                j = 0
+            while (
+                i + j < len(x_pos)
+                and x_pos[i + j] > x_pos[index] + 10
+                and articles_nb[i + j] == articles_nb[i]
+            ):
+                flagged = paragraphs[i + j]
+                paragraphs[i + j] = paragraphs[i - 1]
+                j += 1
 
-                # Replace all the subparagraph line references to the closest previous paragraph reference
+            # With the tables and figures left out, the lines following the sub-paragraphs that took the reference of
+            # the last one (placeholder of a table, text after the list, etc.) belong to the same paragraph as well.
+            # The default extraction keeps the references it always had
 
+            if SKIP_TABLES_AND_FIGURES:
                 while (
                     i + j < len(x_pos)
-                    and i + j < len(text)
-                    and i + j < len(articles_nb)
-                    and x_pos[i + j] > x_pos[index] + 10
+                    and not numbered[i + j]
+                    and paragraphs[i + j] == flagged
                     and articles_nb[i + j] == articles_nb[i]
                 ):
                     paragraphs[i + j] = paragraphs[i - 1]
@@ -1141,6 +1586,9 @@ def identify_decision_date(file_pdf, full_path):
     Returns:
         Decision date of TCM 
     """
+
+    import datetime
+    from datetime import date
     
     # function to check if a string is a full date
     def is_date(s): 
@@ -1243,17 +1691,17 @@ def create_table_of_tcms(path_pdf, preferred_folders, add_only_one_file=False):
 
     for market_code in preferred_folders:
 
-        for methodology in os.listdir(path_pdf + "\\" + market_code):
+        for methodology in os.listdir(os.path.join(path_pdf, market_code)):
 
-            if os.path.isdir(path_pdf + "\\" + market_code + "\\" + methodology):
+            if os.path.isdir(os.path.join(path_pdf, market_code, methodology)):
 
                 for file_pdf in os.listdir(
-                        path_pdf + "\\" + market_code + "\\" + methodology + "\\Approved"
+                        os.path.join(path_pdf, market_code, methodology, "Approved")
                 ):
 
                     if file_pdf.endswith(".pdf"):
 
-                        full_path_pdf = path_pdf + "\\" + market_code + "\\" + methodology + "\\Approved" + "\\" + file_pdf
+                        full_path_pdf = os.path.join(path_pdf, market_code, methodology, "Approved", file_pdf)
                         decision_date = identify_decision_date(file_pdf, full_path_pdf)
 
                         market_codes.append(market_code)
@@ -1300,12 +1748,235 @@ def create_table_of_tcms(path_pdf, preferred_folders, add_only_one_file=False):
     return df
 
 
-def create_table_of_requirement(path_pdf, table_of_tcm, stakeholders_list):    
+def get_full_path_pdf(path_pdf, tcm):
+    """
+
+    Args:
+        path_pdf: full route where the "Approved" PDF folders are located
+        tcm: row of the table of TCMs
+
+    Returns:
+        Full route of the PDF document of the TCM
+    """
+
+    return os.path.join(path_pdf, tcm["Regulation_name"], tcm["TCM_name"], "Approved", tcm["File_name"])
+
+
+class DocumentLines:
+    """
+    Lines of one document in columns (one numpy array per column, one row per line), carried from
+    'convert_pdf_to_str' to the table of requirement. The stages select rows with masks and slices of all the columns
+    at once, so that the columns cannot get out of step.
+    """
+
+    __slots__ = [
+        "text",
+        "x_pos",
+        "article_nb",
+        "article_name",
+        "paragraph",
+        "requirement",
+        "stakeholder",
+        "frequency",
+    ]
+
+    def __init__(self, text, x_pos):
+
+        self.text = to_object_array(text)
+        self.x_pos = np.asarray(x_pos, dtype=float)
+
+        for column in self.__slots__[2:]:
+            setattr(self, column, np.full(len(self.text), "", dtype=object))
+
+    def __len__(self):
+
+        return len(self.text)
+
+    def select(self, rows):
+        """
+
+        Args:
+            rows: boolean mask, slice or indices of the rows to keep
+
+        Returns:
+            New DocumentLines with the selected rows of every column
+        """
+
+        lines = DocumentLines.__new__(DocumentLines)
+
+        for column in self.__slots__:
+            setattr(lines, column, getattr(self, column)[rows])
+
+        return lines
+
+    def join_paragraphs(self):
+        """
+
+        Returns:
+            New DocumentLines with one row per run of consecutive lines of the same paragraph: the texts are joined
+            with line breaks, the requirements, stakeholders and frequencies are concatenated, and the article of the
+            first line of the run is kept
+        """
+
+        if len(self) == 0:
+            return self
+
+        starts = np.flatnonzero(np.r_[True, self.paragraph[1:] != self.paragraph[:-1]])
+        bounds = zip(starts, np.r_[starts[1:], len(self)])
+
+        lines = self.select(starts)
+        columns = [("text", "\n"), ("requirement", ""), ("stakeholder", ""), ("frequency", "")]
+        joined = {column: [] for column, _ in columns}
+
+        for start, end in bounds:
+            for column, separator in columns:
+                joined[column].append(separator.join(getattr(self, column)[start:end]))
+
+        for column, _ in columns:
+            setattr(lines, column, to_object_array(joined[column]))
+
+        return lines
+
+    def to_dataframe(self):
+        """
+
+        Returns:
+            Table of requirement of the document, with the monitoring status ("Pending" for the lines with a "shall"
+            requirement) and the default frequency ("One-off") of the lines with a requirement
+        """
+
+        has_shall = np.array(["shall" in requirement for requirement in self.requirement], dtype=bool)
+
+        frequency = self.frequency.copy()
+        frequency[(self.requirement != "") & (frequency == "")] = "One-off"
+
+        return pd.DataFrame(
+            data={
+                "Article_nb": self.article_nb,
+                "Article_name": self.article_name,
+                "Paragraph_nb": self.paragraph,
+                "Text": self.text,
+                "Requirement_keyword": self.requirement,
+                "Stakeholder_identified": self.stakeholder,
+                "Frequency": frequency,
+                "Monitoring_status": np.where(has_shall, "Pending", "No requirement").astype(object),
+            }
+        )
+
+
+def to_object_array(values):
+    """
+
+    Args:
+        values: list of strings
+
+    Returns:
+        One-dimensional numpy array of Python strings (never split into characters or into a 2D array)
+    """
+
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+
+    return array
+
+
+def remove_annexes_after_language(lines):
+    """
+
+    Args:
+        lines: DocumentLines of the document, with the article names
+
+    Returns:
+        Remove the annexes at the end of the document: everything from the last line starting with "Annex" that comes
+        after the article "Language"
+    """
+
+    is_annex = np.array([line.split()[0].lower() == "annex" for line in lines.text], dtype=bool)
+    is_language = np.isin(lines.article_name, ["Language", "Language "])
+    after_language = (np.cumsum(is_language) - is_language) > 0
+
+    annexes = np.flatnonzero(is_annex & after_language)
+
+    return lines.select(slice(0, annexes[-1])) if len(annexes) > 0 else lines
+
+
+def extract_requirements_from_pdf(full_path_pdf, regulation_name, stakeholders_list):
+    """
+
+    Args:
+        full_path_pdf: full route of the PDF document
+        regulation_name: Market Code folder of the document ("Regulation" for the regulations themselves)
+        stakeholders_list: Identified (ex ante) stakeholders who could be obliged by legal requirement
+
+    Returns:
+        Table of requirement of one document, without 'TCM_id' and 'Requirement_id' (empty for scanned documents)
+    """
+
+    text, x_pos = convert_pdf_to_str(full_path_pdf)
+
+    global guideline_test
+
+    if regulation_name == "Regulation":
+        guideline_test = True
+    else:
+        guideline_test = False
+
+    if len(text) == 0:  # in case it is a scanned document
+        print("scanned document")
+        return pd.DataFrame()
+
+    lines = detect_and_remove_annex_before(DocumentLines(text, x_pos))
+
+    lines = remove_contents_and_whereas(lines)
+
+    (
+        articles_nb,
+        articles_name,
+        paragraphs,
+    ) = add_paragraph_and_article_reference(lines.text.tolist(), lines.x_pos.tolist())
+
+    lines.article_nb = to_object_array(articles_nb)
+    lines.article_name = to_object_array(articles_name)
+    lines.paragraph = to_object_array(paragraphs)
+
+    lines = remove_annexes_after_language(lines)
+
+    lines.frequency = to_object_array(add_frequency_reference(lines.text))
 
-    df = pd.DataFrame()
+    requirements, stakeholders = identify_requirements(lines.text, lines.article_nb, stakeholders_list)
+    lines.requirement = to_object_array(requirements)
+    lines.stakeholder = to_object_array(stakeholders)
+
+    return lines.join_paragraphs().to_dataframe()
+
+
+class ExtractionCancelled(Exception):
+    """
+    Raised by 'create_table_of_requirement' when the extraction is cancelled from the dialog box.
+    """
+
+def create_table_of_requirement(path_pdf, table_of_tcm, stakeholders_list, progress=None, cancel=None):
+    """
+
+    Args:
+        path_pdf: full route where the "Approved" PDF folders are located
+        table_of_tcm: catalogue of regulation returned by create_table_of_tcms
+        stakeholders_list: Identified (ex ante) stakeholders who could be obliged by legal requirement
+        progress: function called after each document with the number of documents analysed, the number of
+        documents and the file name (optional)
+        cancel: threading.Event checked before each document, ExtractionCancelled is raised once it is set (optional)
+
+    Returns:
+        Catalogue of requirement of all the documents of the table of TCMs
+    """
+
+    dfs = []
 
     for n in range(len(table_of_tcm)):
 
+        if cancel is not None and cancel.is_set():
+            raise ExtractionCancelled("Extraction cancelled after " + str(n) + " documents")
+
         print(
             "("
             + str(n + 1)
@@ -1318,106 +1989,31 @@ def create_table_of_requirement(path_pdf, table_of_tcm, stakeholders_list):
 
         if not table_of_tcm.iloc[n]["Ignore_status"]:
 
-            text, x_pos = convert_pdf_to_str(
-                path_pdf
-                + "\\"
-                + table_of_tcm.iloc[n]["Regulation_name"]
-                + "\\"
-                + table_of_tcm.iloc[n]["TCM_name"]
-                + "\\Approved"
-                + "\\"
-                + table_of_tcm.iloc[n]["File_name"]
+            df_temp = extract_requirements_from_pdf(
+                get_full_path_pdf(path_pdf, table_of_tcm.iloc[n]), table_of_tcm.iloc[n]["Regulation_name"], stakeholders_list
             )
 
-            global guideline_test
+            if len(df_temp) > 0:
+                df_temp.insert(0, "TCM_id", [table_of_tcm.iloc[n]["TCM_id"]] * len(df_temp))
+                dfs.append(df_temp)
 
-            if table_of_tcm.iloc[n]["Regulation_name"] == "Regulation":
-                guideline_test = True
-            else:
-                guideline_test = False
+        if progress is not None:
+            progress(n + 1, len(table_of_tcm), table_of_tcm.iloc[n]["File_name"])
 
-            if len(text) == 0:  # in case it is a scanned document
-                print("scanned document")
-            else:
-                text, x_pos = detect_and_remove_annex_before(text, x_pos)
-
-                text, x_pos = remove_contents_and_whereas(text, x_pos)
-
-                (
-                    articles_nb,
-                    articles_name,
-                    paragraphs,
-                ) = add_paragraph_and_article_reference(text, x_pos)
-
-                k = len(text)
-                for i in range(len(text)):
-                    if text[i].split()[0].lower() == "annex" and (
-                            "Language" in articles_name[0:i] or "Language " in articles_name[0:i]):
-                        k = i
-
-                articles_nb = articles_nb[0:k]
-                articles_name = articles_name[0:k]
-                paragraphs = paragraphs[0:k]
-                text = text[0:k]
-
-                frequencies = add_frequency_reference(text)
-
-                requirements, stakeholders = identify_requirements(text, articles_nb, stakeholders_list)
-
-                # Join paragraphs
-                if True:
-                    i = 0
-                    while i < len(text) - 1:
-                        if paragraphs[i] == paragraphs[i + 1]:
-                            j = 1
-                            while (
-                                    i + j < len(paragraphs) and paragraphs[i] == paragraphs[i + j]
-                            ):
-                                j += 1
-                            text[i] = "\n".join(text[i: i + j])
-                            requirements[i] = "".join(requirements[i: i + j])
-                            stakeholders[i] = "".join(stakeholders[i: i + j])
-                            frequencies[i] = "".join(frequencies[i: i + j])
-                            for k in range(i + 1, i + j):
-                                articles_nb.pop(i + 1)
-                                articles_name.pop(i + 1)
-                                paragraphs.pop(i + 1)
-                                text.pop(i + 1)
-                                requirements.pop(i + 1)
-                                stakeholders.pop(i + 1)
-                                frequencies.pop(i + 1)
-                        i += 1
-
-
-                monitoring_status = []
-                for requirement in requirements:
-                    if "shall" in requirement or "shall (passive form)" in requirement:
-                        monitoring_status.append("Pending")
-                    else:
-                        monitoring_status.append("No requirement")
-
-                for i in range(len(text)):
-                    if requirements[i] != "":
-                        if frequencies[i] == "":
-                            frequencies[i] = "One-off"
-    
+    return add_requirement_ids(dfs)
 
-                df_temp = pd.DataFrame(
-                    data={
-                        "Article_nb": articles_nb,
-                        "Article_name": articles_name,
-                        "Paragraph_nb": paragraphs,
-                        "Text": text,
-                        "Requirement_keyword": requirements,
-                        "Stakeholder_identified": stakeholders,
-                        "Frequency": frequencies,
-                        "Monitoring_status": monitoring_status,
-                    }
-                )
 
-                df_temp.insert(0, "TCM_id", [table_of_tcm.iloc[n]["TCM_id"]] * len(text))
+def add_requirement_ids(dfs):
+    """
 
-                df = pd.concat([df, df_temp])
+    Args:
+        dfs: tables of requirement of each document (with 'TCM_id'), in the order of the table of TCMs
+
+    Returns:
+        Catalogue of requirement with the 'Requirement_id' column
+    """
+
+    df = pd.concat(dfs) if len(dfs) > 0 else pd.DataFrame()
 
     df.insert(
         0, "Requirement_id", ["r" + str(i + 1).zfill(4) for i in range(len(df))], True
@@ -1425,4 +2021,431 @@ def create_table_of_requirement(path_pdf, table_of_tcm, stakeholders_list):
 
     return df
 
-main()
+
+def init_work_queue(queue_path, path_pdf, table_of_tcm):
+    """
+
+    Args:
+        queue_path: shared folder of the work queue (reachable from every machine running an extractor)
+        path_pdf: full route where the "Approved" PDF folders are located (as seen from the extractors)
+        table_of_tcm: catalogue of regulation returned by create_table_of_tcms
+
+    Returns:
+        Create the work queue: one task file per document to analyse, named after its 'TCM_id', and the table of
+        TCMs used to merge the results in a deterministic order
+    """
+
+    for folder in ["tasks", "claims", "shards"]:
+        os.makedirs(os.path.join(queue_path, folder), exist_ok=True)
+
+    table_of_tcm.to_pickle(os.path.join(queue_path, "table_of_tcms.pkl"))
+
+    for n in range(len(table_of_tcm)):
+        tcm = table_of_tcm.iloc[n]
+        if not tcm["Ignore_status"]:
+            task = {
+                "TCM_id": tcm["TCM_id"],
+                "Regulation_name": tcm["Regulation_name"],
+                "File_name": tcm["File_name"],
+                "full_path_pdf": get_full_path_pdf(path_pdf, tcm),
+            }
+            with open(os.path.join(queue_path, "tasks", tcm["TCM_id"] + ".json"), "w") as f:
+                json.dump(task, f)
+
+
+def claim_task(queue_path, tcm_id, worker_id, claim_timeout=QUEUE_CLAIM_TIMEOUT):
+    """
+
+    Args:
+        queue_path: shared folder of the work queue
+        tcm_id: identifier of the task
+        worker_id: name of the extractor instance
+        claim_timeout: age (in seconds) after which the claim of an instance that did not deliver is abandoned
+
+    Returns:
+        True if the task was claimed by this instance. The claim is a lock file created atomically (only one
+        instance can create it, also on network shares). An abandoned claim is renamed before the lock is created
+        again, but the age check and the rename are not atomic together: another instance may have taken over the
+        claim in between, so the renamed claim is checked again and put back if it is a fresh one. In the remaining
+        window two instances may analyse the same document, which only writes the same shard twice.
+    """
+
+    lock_path = os.path.join(queue_path, "claims", tcm_id + ".lock")
+    abandoned_path = lock_path + "." + worker_id + ".abandoned"
+    renamed = False
+
+    try:
+        if time.time() - os.path.getmtime(lock_path) > claim_timeout:
+            os.rename(lock_path, abandoned_path)
+            renamed = True
+    except OSError:
+        pass  # No claim yet, or another instance took over the abandoned claim first
+
+    if renamed and time.time() - os.path.getmtime(abandoned_path) <= claim_timeout:
+        try:
+            os.link(abandoned_path, lock_path)  # Fails if a claim was created in the meantime
+        except OSError:
+            pass
+        os.remove(abandoned_path)
+        return False
+
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+
+    with os.fdopen(fd, "w") as f:
+        f.write(worker_id)
+
+    return True
+
+
+def run_queue_worker(queue_path, stakeholders_list=STAKEHOLDERS_LIST, worker_id=None, claim_timeout=QUEUE_CLAIM_TIMEOUT):
+    """
+
+    Args:
+        queue_path: shared folder of the work queue created by init_work_queue
+        stakeholders_list: Identified (ex ante) stakeholders who could be obliged by legal requirement
+        worker_id: name of the extractor instance (host name and process id by default)
+        claim_timeout: age (in seconds) after which the claim of an instance that did not deliver is abandoned
+
+    Returns:
+        Claim and analyse the documents of the queue until none is left, writing one shard (table of requirement
+        of the document) per document. Several instances can run at the same time, on one or several machines.
+        After the first pass, the unfinished documents are gone over again (claims abandoned in the meantime are
+        taken over) until each one has a shard or an unexpired claim.
+        Returns the number of documents analysed by this instance.
+    """
+
+    if worker_id is None:
+        worker_id = socket.gethostname() + "-" + str(os.getpid())
+
+    nb_done = 0
+    tasks = sorted(os.listdir(os.path.join(queue_path, "tasks")))
+    claimed = True
+
+    while claimed:
+
+        claimed = False
+
+        for n, task_file in enumerate(tasks):
+
+            tcm_id = task_file[:-len(".json")]
+            shard_path = os.path.join(queue_path, "shards", tcm_id + ".pkl")
+
+            if os.path.exists(shard_path) or not claim_task(queue_path, tcm_id, worker_id, claim_timeout):
+                continue
+
+            claimed = True
+
+            with open(os.path.join(queue_path, "tasks", task_file)) as f:
+                task = json.load(f)
+
+            print("(" + str(n + 1) + "/" + str(len(tasks)) + ") " + worker_id + " analysing: " + task["File_name"])
+
+            df_temp = extract_requirements_from_pdf(task["full_path_pdf"], task["Regulation_name"], stakeholders_list)
+
+            # Write the shard under a temporary name first, so that a shard is either complete or absent
+            df_temp.to_pickle(shard_path + "." + worker_id)
+            os.replace(shard_path + "." + worker_id, shard_path)
+            nb_done += 1
+
+    return nb_done
+
+
+def merge_queue_shards(queue_path):
+    """
+
+    Args:
+        queue_path: shared folder of the work queue, once every task has been analysed
+
+    Returns:
+        df_tcm: catalogue of regulation
+        df_requirement: catalogue of requirement, identical to the output of create_table_of_requirement: the shards
+        are merged in the order of the table of TCMs and 'Requirement_id' is assigned afterwards
+    """
+
+    table_of_tcm = pd.read_pickle(os.path.join(queue_path, "table_of_tcms.pkl"))
+
+    dfs = []
+    missing = []
+
+    for n in range(len(table_of_tcm)):
+        tcm = table_of_tcm.iloc[n]
+        if not tcm["Ignore_status"]:
+            shard_path = os.path.join(queue_path, "shards", tcm["TCM_id"] + ".pkl")
+            if not os.path.exists(shard_path):
+                missing.append(tcm["File_name"])
+            else:
+                df_temp = pd.read_pickle(shard_path)
+                if len(df_temp) > 0:
+                    df_temp.insert(0, "TCM_id", [tcm["TCM_id"]] * len(df_temp))
+                    dfs.append(df_temp)
+
+    if len(missing) > 0:
+        raise RuntimeError("Documents not analysed yet: " + ", ".join(missing))
+
+    return table_of_tcm, add_requirement_ids(dfs)
+
+
+def prepare_tables_for_monocle(df_tcm, df_requirement):
+    """
+
+    Args:
+        df_tcm: catalogue of regulation (output of 'create_table_of_tcms')
+        df_requirement: catalogue of requirement (output of 'create_table_of_requirement')
+
+    Returns:
+        The two tables transformed for the upload in MONOCLE (the steps formerly done manually in Excel, see the
+        README.md file):
+        - 'TCM_name_actual': 'TCM_name' without the number in front of it (first three characters, or two when the
+          number has only one digit);
+        - For the TCMs stored in the "Regulation" folder, the values of 'Regulation_name' and 'TCM_name_actual' are
+          switched ('Regulation' / 'SO' becomes 'SO' / 'Regulation');
+        - 'Full_name': concatenation of 'Regulation_name', 'TCM_name_actual' and 'Geographic_perimeter', in the
+          ninth column of the table of TCMs as expected by MONOCLE;
+        - The rows of the catalogue of requirement whose 'Paragraph_nb' is textual ("article number",
+          "article name", "title number and name", etc.) are deleted;
+        - 'TCM_full_name' is looked up from the table of TCMs with 'TCM_id' and inserted after 'TCM_id'.
+    """
+
+    df_tcm = df_tcm.copy()
+
+    # Remove the number in front of the TCM name
+
+    tcm_name_actual = df_tcm["TCM_name"].str.replace(r"^\d{1,2}\s", "", regex=True)
+
+    # Switch regulation and TCM names for the regulations
+
+    is_regulation = df_tcm["Regulation_name"] == "Regulation"
+    df_tcm["Regulation_name"] = df_tcm["Regulation_name"].where(~is_regulation, tcm_name_actual)
+    df_tcm["TCM_name_actual"] = tcm_name_actual.where(~is_regulation, "Regulation")
+
+    df_tcm["Full_name"] = (
+            df_tcm["Regulation_name"] + MONOCLE_FULL_NAME_SEPARATOR
+            + df_tcm["TCM_name_actual"] + MONOCLE_FULL_NAME_SEPARATOR
+            + df_tcm["Geographic_perimeter"]
+    )
+
+    df_tcm = df_tcm[MONOCLE_TCM_COLUMNS]
+
+    # Keep only the paragraphs (numeric 'Paragraph_nb') and add the full name of the TCM
+
+    df_requirement = df_requirement[df_requirement["Paragraph_nb"].astype(str).str.fullmatch(r"\d+")].copy()
+    df_requirement.insert(
+        df_requirement.columns.get_loc("TCM_id") + 1,
+        "TCM_full_name",
+        df_requirement["TCM_id"].map(df_tcm.set_index("TCM_id")["Full_name"]),
+    )
+
+    return df_tcm, df_requirement.reset_index(drop=True)
+
+
+def export_monocle_workbook(df_tcm, df_requirement, path_xlsx):
+    """
+
+    Args:
+        df_tcm: table of TCMs (output of 'prepare_tables_for_monocle')
+        df_requirement: table of requirements (output of 'prepare_tables_for_monocle')
+        path_xlsx: full route of the workbook to create
+
+    Returns:
+        One workbook with one Excel table per sheet ('table_of_tcm' and 'table_of_requirement'), ready for the
+        upload in MONOCLE
+    """
+
+    with pd.ExcelWriter(path_xlsx, engine="xlsxwriter") as writer:
+
+        for name, df in [("table_of_tcm", df_tcm), ("table_of_requirement", df_requirement)]:
+
+            df.to_excel(writer, sheet_name=name, startrow=1, header=False, index=False)
+            writer.sheets[name].add_table(
+                0, 0, len(df), len(df.columns) - 1,
+                {"name": name, "columns": [{"header": column} for column in df.columns]},
+            )
+
+
+
+def get_tcm_keys(df_tcm):
+    """
+
+    Args:
+        df_tcm: catalogue of regulation
+
+    Returns:
+        Key of each TCM: market code folder, methodology folder and file name, which do not change between runs
+    """
+
+    return (df_tcm["Regulation_name"] + "/" + df_tcm["TCM_name"] + "/" + df_tcm["File_name"]).tolist()
+
+
+def get_requirement_keys(df_requirement):
+    """
+
+    Args:
+        df_requirement: catalogue of requirement with the stable 'TCM_id'
+
+    Returns:
+        Key of each requirement row: TCM, article number, paragraph number and rank of the row among the rows with
+        the same TCM, article and paragraph (several "article name" rows, sub-paragraphs flagged as paragraphs, etc.)
+    """
+
+    columns = ["TCM_id", "Article_nb", "Paragraph_nb"]
+    df = df_requirement[columns].astype(str)
+    occurrence = df.groupby(columns, sort=False).cumcount().astype(str)
+
+    return (df["TCM_id"] + "|" + df["Article_nb"] + "|" + df["Paragraph_nb"] + "|" + occurrence).tolist()
+
+
+def get_stable_ids(keys, ids, prefix):
+    """
+
+    Args:
+        keys: keys of the rows, in the order of the table
+        ids: mapping of the known keys to their identifier, completed in place with the new keys
+        prefix: first character of the identifiers ("t" or "r")
+
+    Returns:
+        Identifier of each row: the one of the mapping for the known keys, the next free number for the new keys (the
+        identifiers of removed rows are never reused)
+    """
+
+    next_nb = max([int(i[len(prefix):]) for i in ids.values()], default=0) + 1
+
+    for key in keys:
+        if key not in ids:
+            ids[key] = prefix + str(next_nb).zfill(4)
+            next_nb += 1
+
+    return [ids[key] for key in keys]
+
+
+def assign_stable_ids(df_tcm, df_requirement, id_map_path):
+    """
+
+    Args:
+        df_tcm: catalogue of regulation (with the 'TCM_id' of the run)
+        df_requirement: catalogue of requirement (with the 'TCM_id' and 'Requirement_id' of the run)
+        id_map_path: full route of the JSON mapping of the keys to the identifiers, created if it does not exist
+
+    Returns:
+        The two catalogues with 'TCM_id' and 'Requirement_id' taken from the mapping (see 'get_tcm_keys' and
+        'get_requirement_keys'), so that a new document or paragraph does not shift the identifiers of the others and
+        MONOCLE only has to import what changed. The mapping is updated with the new keys.
+    """
+
+    if os.path.exists(id_map_path):
+        with open(id_map_path, encoding="utf-8") as f:
+            id_map = json.load(f)
+    else:
+        id_map = {"tcm": {}, "requirement": {}}
+
+    df_tcm = df_tcm.copy()
+    tcm_ids = dict(zip(df_tcm["TCM_id"], get_stable_ids(get_tcm_keys(df_tcm), id_map["tcm"], "t")))
+    df_tcm["TCM_id"] = df_tcm["TCM_id"].map(tcm_ids)
+
+    if len(df_requirement) > 0:
+        df_requirement = df_requirement.copy()
+        df_requirement["TCM_id"] = df_requirement["TCM_id"].map(tcm_ids)
+        df_requirement["Requirement_id"] = get_stable_ids(
+            get_requirement_keys(df_requirement), id_map["requirement"], "r"
+        )
+
+    # Write the mapping under a temporary name first, so that an interrupted run does not corrupt it
+    with open(id_map_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(id_map, f, ensure_ascii=False, indent=0)
+    os.replace(id_map_path + ".tmp", id_map_path)
+
+    return df_tcm, df_requirement
+
+
+def create_requirement_delta(df_previous, df_requirement):
+    """
+
+    Args:
+        df_previous: catalogue of requirement of the previous export (empty for the first export)
+        df_requirement: new catalogue of requirement, with the same stable identifiers
+
+    Returns:
+        The requirement rows inserted, changed (any value differs) or removed since the previous export, with their
+        new values (previous values for the removed rows) and the 'Change' column in front of them
+    """
+
+    previous = df_previous.set_index("Requirement_id") if len(df_previous) > 0 else pd.DataFrame()
+    current = df_requirement.set_index("Requirement_id")
+
+    inserted = current.index.difference(previous.index, sort=False)
+    removed = previous.index.difference(current.index, sort=False)
+    common = current.index.intersection(previous.index, sort=False)
+
+    columns = current.columns.intersection(previous.columns, sort=False)
+    different = (
+        current.loc[common, columns].astype(str).ne(previous.loc[common, columns].astype(str)).any(axis=1)
+        | (len(columns) < len(current.columns))
+    )
+    changed = common[different.to_numpy()]
+
+    delta = pd.concat([
+        current.loc[inserted].assign(Change="inserted"),
+        current.loc[changed].assign(Change="changed"),
+        previous.loc[removed].assign(Change="removed"),
+    ])
+    delta = delta.reindex(columns=["Change"] + current.columns.tolist())
+
+    return delta.rename_axis("Requirement_id").reset_index()
+
+
+def export_requirement_delta(df_requirement, export_path):
+    """
+
+    Args:
+        df_requirement: catalogue of requirement with the stable identifiers (as uploaded in MONOCLE)
+        export_path: folder where the workbooks are written
+
+    Returns:
+        Write the rows inserted, changed or removed since the previous export to the same folder (every row for the
+        first export) in 'catalogue_of_requirement_delta.xlsx', then keep the catalogue for the next comparison
+    """
+
+    snapshot_path = os.path.join(export_path, SNAPSHOT_FILE_NAME)
+    df_previous = pd.read_pickle(snapshot_path) if os.path.exists(snapshot_path) else pd.DataFrame()
+
+    delta = create_requirement_delta(df_previous, df_requirement)
+    print(
+        "Delta since the previous export: "
+        + ", ".join(str((delta["Change"] == change).sum()) + " " + change for change in ["inserted", "changed", "removed"])
+    )
+
+    delta.to_excel(export_path + "//" + "catalogue_of_requirement_delta.xlsx", index=False, engine="xlsxwriter")
+
+    df_requirement.to_pickle(snapshot_path + ".tmp")
+    os.replace(snapshot_path + ".tmp", snapshot_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create the catalogue of requirements. Without arguments, the dialog box is shown. The queue "
+                    "commands distribute the extraction over several instances sharing the QUEUE_PATH folder."
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    parser_init = subparsers.add_parser("queue-init", help="Create the table of TCMs and the work queue.")
+    parser_init.add_argument("queue_path")
+    parser_init.add_argument("--folder-path", default=FOLDER_PATH, help="Folder where the regulations are stored.")
+    parser_init.add_argument("--market-codes", nargs="+", default=MARKET_CODE_LIST, help="Market Code folders.")
+    parser_work = subparsers.add_parser("queue-work", help="Analyse the documents of the work queue.")
+    parser_work.add_argument("queue_path")
+    parser_work.add_argument("--worker-id", help="Name of the instance (host name and process id by default).")
+    parser_merge = subparsers.add_parser("queue-merge", help="Merge the results of the work queue and export them.")
+    parser_merge.add_argument("queue_path")
+    parser_merge.add_argument("export_path", help="Folder where the workbooks are written.")
+    args = parser.parse_args()
+
+    if args.command == "queue-init":
+        init_work_queue(args.queue_path, args.folder_path, create_table_of_tcms(args.folder_path, args.market_codes))
+    elif args.command == "queue-work":
+        run_queue_worker(args.queue_path, worker_id=args.worker_id)
+    elif args.command == "queue-merge":
+        df_tcm, df_requirement = merge_queue_shards(args.queue_path)
+        export_tables(df_tcm, df_requirement, args.export_path)
+    else:
+        main()
@@ -0,0 +1,416 @@
+"""
+This Python script generates a synthetic corpus of TCM-shaped regulation PDF documents so that the extraction of the
+catalogue of requirements can be measured reproducibly without access to the internal share.
+
+The documents mimic the layout handled by 'catalogue_of_requirements_project.py': title page with decision date,
+whereas section, table of contents, centered 'Article x' headings with their name on the next line, numbered
+paragraphs, indented sub-paragraphs, formulas with exponents and indices, footnotes, running headers, pagination,
+optional ruled tables and an annex after the last 'Language' article. The PDF files are written directly (standard Helvetica font, no external
+library required) and a manifest with the expected structure is stored next to them.
+
+Usage: python synthetic_corpus.py OUTPUT_FOLDER [--documents N] [--pages N] [--seed N] [--tables P]
+
+Maintainer: Jose Javier Saiz (josejavier.saizanton@acer.europa.eu, josejavier.saiz.anton@gmail.com)
+"""
+
+import argparse
+import json
+import os
+import random
+import textwrap
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+LEFT_MARGIN = 72
+BODY_TOP = 760
+BODY_BOTTOM = 80
+BODY_SIZE = 11
+LEADING = 14  # Distance between two lines of the same paragraph
+PARAGRAPH_GAP = 24  # Distance between two paragraphs (must be above LEADING + 0.4)
+WRAP_WIDTH = 88
+
+MANIFEST_NAME = "manifest.json"
+
+# Running header written with the body font size on every page but the first one, so that it can only be removed by
+# recognising it is repeated on many pages
+RUNNING_HEADER = "Decision of the regulatory authorities on the synthetic methodology"
+
+ARTICLE_NAMES = [
+    "Definitions and interpretation",
+    "Capacity calculation methodology",
+    "Publication of data",
+    "Cost sharing arrangements",
+    "Reporting obligations",
+    "Fallback procedures",
+    "Coordinated redispatching",
+    "Monitoring and review",
+    "Transparency requirements",
+    "Allocation constraints",
+    "Operational security limits",
+    "Timescale for implementation",
+]
+
+SUBJECTS = ["All TSOs", "The NEMOs", "The regulatory authorities", "Each TSO", "The Agency", "The market participant"]
+FREQUENCIES = ["annually", "quarterly", "monthly", "every two years", ""]
+OBJECTS = [
+    "publish the results of the capacity calculation",
+    "provide the relevant data to the coordinated capacity calculator",
+    "submit a report on the implementation of this methodology",
+    "review the common grid model",
+    "coordinate the values of the reliability margin",
+    "notify any change of the bidding zone configuration",
+]
+FILLER = [
+    "in accordance with the principles set out in this methodology",
+    "taking into account the operational security limits of the transmission system",
+    "with a view to ensuring an efficient use of the cross-zonal capacity",
+    "based on the most accurate forecast of the transmission system",
+    "without undue discrimination between market participants",
+    "pursuant to the relevant provisions of the capacity calculation regulation",
+]
+# Ruled tables (header row and one row per bidding zone border)
+TABLE_COLUMNS = ["Bidding zone border", "Capacity (MW)", "Margin (MW)"]
+TABLE_BORDERS = ["DE-FR", "FR-BE", "BE-NL", "NL-DE", "AT-DE", "PL-CZ"]
+TABLE_COLUMN_WIDTH = 150
+TABLE_ROW_HEIGHT = 18
+
+ITEMS = [
+    "the expected flows on critical network elements",
+    "the remedial actions taken into account",
+    "the allocation constraints applied in the region",
+    "the base case used for the calculation",
+]
+
+
+def sentence(rng, with_requirement=True):
+    """
+
+    Args:
+        rng: random.Random instance
+        with_requirement: whether the sentence contains a 'shall' requirement
+
+    Returns:
+        A synthetic regulation sentence without digits (so it can never be read as a paragraph number)
+    """
+
+    if with_requirement:
+        frequency = rng.choice(FREQUENCIES)
+        text = rng.choice(SUBJECTS) + " shall " + rng.choice(OBJECTS) + " " + rng.choice(FILLER)
+        if frequency:
+            text = text + " " + frequency
+    else:
+        text = "This provision applies " + rng.choice(FILLER) + " and " + rng.choice(FILLER)
+    return text + "."
+
+
+class Layout:
+    """
+    Place text on A4 pages from top to bottom and keep track of footnotes, running headers and pagination.
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.footnotes = []
+        self.new_page()
+
+    def new_page(self):
+        self.ops = []
+        self.footnotes = []
+        self.pages.append((self.ops, self.footnotes))
+        self.y = BODY_TOP
+
+    def bottom(self):
+        return BODY_BOTTOM + 12 * len(self.footnotes)
+
+    def text(self, x, y, string, size=BODY_SIZE):
+        self.ops.append(("text", x, y, size, string))
+
+    def line(self, x1, y1, x2, y2):
+        self.ops.append(("line", x1, y1, x2, y2))
+
+    def block(self, string, x=LEFT_MARGIN, gap=PARAGRAPH_GAP, size=BODY_SIZE, centered=False, width=WRAP_WIDTH):
+        """Write a wrapped block of text, starting a new page when the bottom margin is reached."""
+        lines = textwrap.wrap(string, width=width - (x - LEFT_MARGIN) // 6)
+        if self.y - gap < self.bottom():
+            self.new_page()
+            gap = 0
+        self.y -= gap
+        for k, line in enumerate(lines):
+            if k > 0:
+                self.y -= LEADING
+                if self.y < self.bottom():
+                    self.new_page()
+            self.text(center(line, size) if centered else x, self.y, line, size)
+
+    def formula(self, x=150, gap=PARAGRAPH_GAP):
+        """Write a displayed formula with an exponent and an index ('ATC^{Core}_{i,A-B} = RAM')."""
+        if self.y - gap < self.bottom():
+            self.new_page()
+            gap = 0
+        self.y -= gap
+        self.text(x, self.y, "ATC")
+        self.text(x + 25, self.y + 4, "Core", 7)
+        self.text(x + 25, self.y - 3, "i,A-B", 7)
+        self.text(x + 50, self.y, "= RAM minus the reference flow")
+
+    def table(self, rows, gap=PARAGRAPH_GAP):
+        """Write a ruled table (header row, then one line of cells per row) with the grid drawn around each cell."""
+        rows = [TABLE_COLUMNS] + rows
+        height = TABLE_ROW_HEIGHT * len(rows)
+        if self.y - gap - height < self.bottom():
+            self.new_page()
+            gap = 0
+        top = self.y - gap + LEADING
+        right = LEFT_MARGIN + TABLE_COLUMN_WIDTH * len(TABLE_COLUMNS)
+        for r, cells in enumerate(rows):
+            for c, cell in enumerate(cells):
+                self.text(LEFT_MARGIN + 4 + TABLE_COLUMN_WIDTH * c, top - TABLE_ROW_HEIGHT * (r + 1) + 5, cell)
+        for r in range(len(rows) + 1):
+            self.line(LEFT_MARGIN, top - TABLE_ROW_HEIGHT * r, right, top - TABLE_ROW_HEIGHT * r)
+        for c in range(len(TABLE_COLUMNS) + 1):
+            x = LEFT_MARGIN + TABLE_COLUMN_WIDTH * c
+            self.line(x, top, x, top - height)
+        self.y = top - height - LEADING
+
+    def footnote_reference(self, string, number):
+        """Write a superscript footnote reference after the last line and the footnote at the bottom of the page."""
+        self.text(LEFT_MARGIN + 5.5 * len(string), self.y + 4, str(number), 7)
+        self.footnotes.append(str(number) + " Commission Regulation (EU) establishing a guideline, OJ L 197.")
+
+
+def center(string, size):
+    # Approximation of the Helvetica average glyph width
+    return max(LEFT_MARGIN, (PAGE_WIDTH - 0.52 * size * len(string)) / 2)
+
+
+def escape(string):
+    return string.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def render_pdf(pages, path):
+    """
+
+    Args:
+        pages: list of (draw operations, footnotes) tuples produced by Layout
+        path: file path of the PDF to write
+
+    Returns:
+        Write a minimal PDF 1.4 file with one standard Helvetica font
+    """
+
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages tree, filled once the page objects are known
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+
+    for n, (ops, footnotes) in enumerate(pages):
+        content = []
+
+        # Running header
+        content.append("BT /F1 9 Tf %d %d Td (%s) Tj ET" % (
+            LEFT_MARGIN, 812, escape("L 197/" + str(n + 1) + " EN Official Journal of the European Union")))
+        if n > 0:
+            content.append("BT /F1 %d Tf %d %d Td (%s) Tj ET" % (BODY_SIZE, LEFT_MARGIN, 786, escape(RUNNING_HEADER)))
+
+        for op in ops:
+            if op[0] == "text":
+                _, x, y, size, string = op
+                content.append("BT /F1 %s Tf %.2f %.2f Td (%s) Tj ET" % (size, x, y, escape(string)))
+            else:
+                _, x1, y1, x2, y2 = op
+                content.append("%.2f %.2f m %.2f %.2f l S" % (x1, y1, x2, y2))
+
+        for k, footnote in enumerate(footnotes):
+            content.append("BT /F1 8 Tf %d %d Td (%s) Tj ET" % (
+                LEFT_MARGIN, BODY_BOTTOM - 10 + 12 * (len(footnotes) - k - 1), escape(footnote)))
+
+        # Pagination
+        content.append("BT /F1 11 Tf %d %d Td (%s) Tj ET" % (
+            PAGE_WIDTH - 130, 40, escape("Page " + str(n + 1) + " of " + str(len(pages)))))
+
+        stream = "\n".join(content)
+        objects.append("<< /Length %d >>\nstream\n%s\nendstream" % (len(stream.encode("latin-1")), stream))
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> "
+            "/Contents %d 0 R >>" % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+        )
+        kids.append("%d 0 R" % len(objects))
+
+    objects[1] = "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(kids), len(kids))
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for k, obj in enumerate(objects):
+        offsets.append(len(data))
+        data += ("%d 0 obj\n%s\nendobj\n" % (k + 1, obj)).encode("latin-1")
+    xref = len(data)
+    data += ("xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)).encode("latin-1")
+    for offset in offsets:
+        data += ("%010d 00000 n \n" % offset).encode("latin-1")
+    data += ("trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)).encode(
+        "latin-1")
+
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def generate_document(path, pages=20, seed=0, title="synthetic methodology", tables=0.0):
+    """
+
+    Args:
+        path: file path of the PDF to write
+        pages: approximate number of pages of the document
+        seed: seed of the random generator (same seed, same document)
+        title: name of the methodology written on the title page
+        tables: probability of a ruled table after each numbered paragraph (the documents generated without tables
+        are the same as before tables were added)
+
+    Returns:
+        Write a synthetic TCM and return its expected structure: list of articles with their number, name and
+        number of paragraphs as the catalogue script should find them, and number of tables
+    """
+
+    rng = random.Random(seed)
+    layout = Layout()
+
+    # Title page
+    layout.y = 700
+    layout.block("DECISION OF THE REGULATORY AUTHORITIES", size=14, centered=True, gap=0)
+    layout.block("of 14 November 2019", centered=True, gap=30)
+    layout.block("on the " + title, centered=True, gap=30)
+
+    # Whereas section
+    layout.block("Whereas:", gap=40)
+    for k in range(rng.randint(3, 6)):
+        layout.block("(" + str(k + 1) + ") " + sentence(rng, False), x=LEFT_MARGIN)
+
+    # Table of contents (left aligned, so that it is not confused with the first article)
+    nb_articles = max(3, pages * 2)
+    names = ["Subject matter and scope"] + [rng.choice(ARTICLE_NAMES) for _ in range(nb_articles)] + ["Language"]
+    layout.new_page()
+    layout.block("Contents", gap=0)
+    for k, name in enumerate(names[:8]):
+        layout.block("Article " + str(k + 1) + " " + name, gap=LEADING + 4)
+
+    articles = []
+    footnote_number = 0
+    nb_tables = 0
+    layout.new_page()
+
+    k = 0
+    while k < len(names):
+        name = names[k]
+        # Stop adding ordinary articles once the requested page count is reached
+        if len(layout.pages) >= pages and name != "Language":
+            names = names[:k] + ["Language"]
+            continue
+
+        nb = str(k + 1)
+        layout.block("Article " + nb, centered=True, gap=36)
+        layout.block(name, centered=True, gap=18)
+
+        if name == "Language" or rng.random() < 0.15:
+            # Article with one unnumbered paragraph
+            layout.block(" ".join(sentence(rng) for _ in range(2)))
+            nb_paragraphs = 1
+        else:
+            nb_paragraphs = rng.randint(2, 6)
+            for p in range(nb_paragraphs):
+                paragraph = str(p + 1) + ". " + " ".join(sentence(rng) for _ in range(rng.randint(1, 4)))
+                layout.block(paragraph)
+
+                if rng.random() < 0.2:
+                    footnote_number += 1
+                    last_line = textwrap.wrap(paragraph, width=WRAP_WIDTH)[-1]
+                    layout.footnote_reference(last_line, footnote_number)
+
+                if rng.random() < 0.3:
+                    for letter in "abc"[:rng.randint(2, 3)]:
+                        layout.block("(" + letter + ") " + rng.choice(ITEMS) + ";", x=100, gap=20)
+
+                if rng.random() < 0.15:
+                    # Numbered sub-paragraphs indented as sub-paragraphs must not be read as paragraphs
+                    for sub in range(2):
+                        layout.block("(" + str(sub + 1) + ") " + rng.choice(ITEMS) + " " + rng.choice(FILLER) + ";",
+                                     x=100, gap=20)
+
+                if rng.random() < 0.1:
+                    layout.formula()
+
+                if tables > 0 and rng.random() < tables:
+                    layout.table([
+                        [rng.choice(TABLE_BORDERS), str(rng.randint(500, 3000)), str(rng.randint(50, 300))]
+                        for _ in range(rng.randint(2, 5))
+                    ])
+                    nb_tables += 1
+
+        articles.append({"nb": nb, "name": name, "paragraphs": nb_paragraphs})
+        k += 1
+
+    # Annex after the 'Language' article (removed by the extraction)
+    layout.block("Annex I", centered=True, gap=48)
+    layout.block("Illustrative example", centered=True, gap=18)
+    for p in range(3):
+        layout.block(str(p + 1) + ". " + sentence(rng))
+
+    render_pdf(layout.pages, path)
+
+    return {
+        "pages": len(layout.pages),
+        "articles": articles,
+        "headers_and_footers": [RUNNING_HEADER],
+        "tables": nb_tables,
+    }
+
+
+def generate_corpus(folder_path, documents=3, pages=20, seed=0, market_code="CACM", tables=0.0):
+    """
+
+    Args:
+        folder_path: root folder of the corpus (equivalent of the "Market Codes WEB" folder)
+        documents: number of PDF documents to generate
+        pages: approximate number of pages of each document
+        seed: seed of the random generator
+        market_code: Market Code folder in which the documents are stored
+        tables: probability of a ruled table after each numbered paragraph
+
+    Returns:
+        Write the documents in FOLDER/<market code>/<methodology>/Approved/ together with a manifest and return the
+        manifest as a dictionary indexed by file name
+    """
+
+    manifest = {}
+
+    for n in range(documents):
+        methodology = str(n + 1).zfill(2) + " Synthetic methodology " + str(n + 1)
+        approved = os.path.join(folder_path, market_code, methodology, "Approved")
+        os.makedirs(approved, exist_ok=True)
+
+        file_pdf = "Action " + str(n + 1) + " - Synthetic TCM Core approved.pdf"
+        structure = generate_document(os.path.join(approved, file_pdf), pages=pages, seed=seed + n,
+                                      title=methodology[3:].lower(), tables=tables)
+        structure["market_code"] = market_code
+        structure["methodology"] = methodology
+        manifest[file_pdf] = structure
+
+    with open(os.path.join(folder_path, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus of TCM-shaped PDF documents.")
+    parser.add_argument("folder_path", help="Folder where the corpus is written.")
+    parser.add_argument("--documents", type=int, default=3, help="Number of documents (default: 3).")
+    parser.add_argument("--pages", type=int, default=20, help="Approximate number of pages per document (default: 20).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator (default: 0).")
+    parser.add_argument("--tables", type=float, default=0.0,
+                        help="Probability of a ruled table after each numbered paragraph (default: 0).")
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.folder_path, args.documents, args.pages, args.seed, tables=args.tables)
+    for file_pdf, structure in manifest.items():
+        print(file_pdf + ": " + str(structure["pages"]) + " pages, " + str(len(structure["articles"])) + " articles")